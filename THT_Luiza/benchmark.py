@@ -0,0 +1,230 @@
+import argparse
+import datetime as dt
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import pandas as pd
+from src.extract import extract
+from src.load import load
+from src.metrics import collect_metrics, peak_rss, stage
+from src.synthetic import write_inputs
+from src.transform import TIME_PERIODS, transformation
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Numbers of polling events of the benchmark inputs
+SIZES = [10_000, 100_000, 1_000_000, 10_000_000]
+POLLING_RATE = 2.0
+EVENTS_PER_DEVICE = 2_000
+EVENTS_PER_ORDER = 20
+
+
+def measure(input_dir: str, time_period: list = TIME_PERIODS) -> dict:
+    """
+    Runs the pipeline of `events_processing.main` on the inputs of a folder and measures each step
+    and each sub-step of `transformation` with `collect_metrics`.
+
+    Args:
+        input_dir (str): The folder with `polling.csv`, `connectivity_status.csv` and `orders.csv`.
+        time_period (list): Time periods in minutes, see `transformation`.
+
+    Returns:
+        dict: The number of rows of each input and of the report, the metrics of each step, with its
+        own peak memory, and the peak resident set size of the process.
+    """
+    with collect_metrics() as records, tempfile.TemporaryDirectory() as output_dir:
+        with stage("extract") as metrics:
+            df_polling, df_conn_status, df_orders = extract(
+                path_polling=os.path.join(input_dir, "polling.csv"),
+                path_conn_status=os.path.join(input_dir, "connectivity_status.csv"),
+                path_orders=os.path.join(input_dir, "orders.csv"),
+                typed=True,
+            )
+            rows = {
+                "polling": len(df_polling),
+                "connectivity_status": len(df_conn_status),
+                "orders": len(df_orders),
+            }
+            metrics["rows_out"] = sum(rows.values())
+        with stage("transform", rows_in=len(df_orders)) as metrics:
+            df_report = transformation(
+                df_polling, df_conn_status, df_orders, time_period=time_period
+            )
+            metrics["rows_out"] = len(df_report)
+        with stage("load", rows_in=len(df_report)):
+            load(df_report, os.path.join(output_dir, "events_report.csv"))
+
+    stages = {record.pop("stage"): record for record in records}
+    return {
+        "rows": rows | {"report": len(df_report)},
+        "stages": stages,
+        # The steps are the stages without a parent stage
+        "seconds": sum(v["seconds"] for k, v in stages.items() if "." not in k),
+        "peak_rss_bytes": peak_rss(),
+    }
+
+
+def git_commit() -> str:
+    """Returns the hash of the current git commit, or None outside of a git repository."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(
+    sizes: list = SIZES,
+    data_dir: str = "data/benchmark/inputs",
+    output_path: str = None,
+    seed: int = 0,
+) -> str:
+    """
+    Benchmarks the pipeline on synthetic inputs of increasing sizes and writes the results to a JSON file.
+
+    The inputs of each size are generated once with `write_inputs` and kept in `data_dir`. Each size
+    is measured in a new process, so that its peak memory is not the one of a bigger previous size.
+
+    Args:
+        sizes (list): The numbers of polling events of the inputs.
+        data_dir (str): The folder to keep the generated inputs in.
+        output_path (str, optional): The path to the JSON file. Defaults to
+            `data/benchmark/benchmark_<commit>_<time>.json`.
+        seed (int): The seed of the generated inputs.
+
+    Returns:
+        str: The path to the JSON file.
+    """
+    commit = git_commit()
+    if output_path is None:
+        output_path = (
+            f"data/benchmark/benchmark_{commit}_"
+            f"{dt.datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.json"
+        )
+
+    results = []
+    for size in sizes:
+        # About EVENTS_PER_DEVICE polling events per device, over as many hours as needed
+        n_devices = max(1, size // EVENTS_PER_DEVICE)
+        parameters = {
+            "n_devices": n_devices,
+            "n_orders": max(1, size // EVENTS_PER_ORDER),
+            "polling_rate": POLLING_RATE,
+            "hours": size / (n_devices * POLLING_RATE * 60),
+            "seed": seed,
+        }
+        input_dir = os.path.join(data_dir, f"{size}_seed{seed}")
+        if not os.path.exists(os.path.join(input_dir, "orders.csv")):
+            logger.info(f"Generating the inputs with {size} polling events")
+            write_inputs(input_dir, **parameters)
+
+        logger.info(f"Measuring the inputs with {size} polling events")
+        process = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "measure", input_dir],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        result = json.loads(process.stdout)
+        results.append({"size": size, "parameters": parameters, **result})
+        logger.info(
+            f"{size} polling events: {result['seconds']:.2f} s, "
+            f"peak RSS {result['peak_rss_bytes'] / 2**20:.0f} MiB"
+        )
+
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    with open(output_path, "w") as f:
+        json.dump(
+            {
+                "commit": commit,
+                "time": dt.datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "pandas": pd.__version__,
+                "machine": platform.machine(),
+                "results": results,
+            },
+            f,
+            indent=2,
+        )
+    logger.info(f"FINISHED: Benchmark results path is '{output_path}'")
+
+    return output_path
+
+
+def compare(path_base: str, path_new: str) -> pd.DataFrame:
+    """
+    Compares the timings and peak memory of two benchmark result files.
+
+    Args:
+        path_base (str): The path to the results of the reference commit.
+        path_new (str): The path to the results to compare with the reference.
+
+    Returns:
+        pd.DataFrame: One row per size and step, with the seconds of both runs and their ratio,
+        and the peak memory of the step in both runs. The row of the stage "total" of each size has
+        the seconds of the steps and the peak resident set size of both runs.
+    """
+    rows = []
+    for path, run_name in [(path_base, "base"), (path_new, "new")]:
+        with open(path) as f:
+            for result in json.load(f)["results"]:
+                for name, values in result["stages"].items():
+                    rows.append(
+                        {"size": result["size"], "stage": name, "run": run_name}
+                        | values
+                    )
+                rows.append(
+                    {
+                        "size": result["size"],
+                        "stage": "total",
+                        "run": run_name,
+                        "seconds": result["seconds"],
+                        "peak_rss_bytes": result["peak_rss_bytes"],
+                    }
+                )
+    df = pd.DataFrame(rows).pivot(
+        index=["size", "stage"],
+        columns="run",
+        values=["seconds", "peak_memory_bytes", "peak_rss_bytes"],
+    )
+    df.columns = [f"{value}_{run_name}" for value, run_name in df.columns]
+    df["seconds_ratio"] = df["seconds_new"] / df["seconds_base"]
+
+    return df.reset_index()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmarks the events pipeline on synthetic inputs."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    parser_run = subparsers.add_parser("run", help="run the benchmark")
+    parser_run.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser_run.add_argument("--data-dir", default="data/benchmark/inputs")
+    parser_run.add_argument("--output", default=None)
+    parser_run.add_argument("--seed", type=int, default=0)
+    parser_measure = subparsers.add_parser(
+        "measure", help="measure the inputs of a folder and print the results as JSON"
+    )
+    parser_measure.add_argument("input_dir")
+    parser_compare = subparsers.add_parser("compare", help="compare two result files")
+    parser_compare.add_argument("path_base")
+    parser_compare.add_argument("path_new")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        run(args.sizes, args.data_dir, args.output, args.seed)
+    elif args.command == "measure":
+        print(json.dumps(measure(args.input_dir)))
+    else:
+        print(compare(args.path_base, args.path_new).to_string(index=False))
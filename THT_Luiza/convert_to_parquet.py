@@ -0,0 +1,82 @@
+import argparse
+import glob
+import logging
+import os
+import pandas as pd
+from src.load import load
+from src.timestamps import parse_timestamps
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Columns stored as timestamps, so the Parquet files are read without parsing strings
+TIME_COLUMNS = [
+    "creation_time",
+    "order_creation_time",
+    "preceding_event",
+    "following_event",
+    "status_time",
+]
+
+
+def convert_csv_to_parquet(path_csv: str, path_parquet: str) -> str:
+    """
+    Converts an input or report CSV file to a Parquet file.
+
+    The index columns written by pandas (`Unnamed: 0`) are dropped, the time columns are parsed
+    to timestamps and the device_id column is dictionary-encoded.
+
+    Args:
+        path_csv (str): The path to the CSV file.
+        path_parquet (str): The path to the Parquet file to write.
+
+    Returns:
+        str: The path to the Parquet file.
+    """
+    df = pd.read_csv(path_csv)
+    df = df.drop(columns=[c for c in df.columns if c.startswith("Unnamed:")])
+    for column in set(TIME_COLUMNS) & set(df.columns):
+        df[column] = parse_timestamps(df[column])
+
+    os.makedirs(os.path.dirname(path_parquet) or ".", exist_ok=True)
+    _, output_path = load(df=df, path_to_write=path_parquet)
+    return output_path
+
+
+def main(input_dir: str, output_dir: str):
+    """
+    Converts all the CSV files of a folder and its sub-folders to Parquet files, keeping the
+    same relative paths under the output folder.
+
+    Args:
+        input_dir (str): The folder with the CSV files, e.g. `data`.
+        output_dir (str): The folder to write the Parquet files to.
+
+    Returns:
+        None
+    """
+    paths_csv = sorted(
+        glob.glob(os.path.join(input_dir, "**", "*.csv"), recursive=True)
+    )
+    for path_csv in paths_csv:
+        relative_path = os.path.relpath(path_csv, input_dir)
+        path_parquet = os.path.join(
+            output_dir, os.path.splitext(relative_path)[0] + ".parquet"
+        )
+        try:
+            convert_csv_to_parquet(path_csv, path_parquet)
+        except ValueError as e:
+            logger.warning(f"SKIPPED: '{path_csv}': {e}")
+            continue
+        logger.info(f"Converted '{path_csv}' to '{path_parquet}'")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Converts the CSV inputs and reports to Parquet files."
+    )
+    parser.add_argument("input_dir", help="folder with the CSV files")
+    parser.add_argument("output_dir", help="folder to write the Parquet files to")
+    args = parser.parse_args()
+    main(input_dir=args.input_dir, output_dir=args.output_dir)
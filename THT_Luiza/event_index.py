@@ -0,0 +1,86 @@
+import argparse
+import json
+import logging
+import pandas as pd
+from src.extract import CONN_STATUS_COLUMNS, POLLING_COLUMNS, read_table
+from src.index import build_event_index, load_event_index, lookup_order
+from src.transform import TIME_PERIODS
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def build(input_dir: str, index_dir: str, input_format: str = "csv") -> str:
+    """
+    Builds the event index of the polling events and connectivity status of an input folder.
+
+    Args:
+        input_dir (str): The folder with the `polling` and `connectivity_status` files.
+        index_dir (str): The folder to write the index to.
+        input_format (str): Extension of the input files: "csv", "parquet" or "arrow". Defaults to "csv".
+
+    Returns:
+        str: The path to the index folder.
+    """
+    # The orders are not indexed, so only the event inputs are read
+    df_polling = read_table(f"{input_dir}/polling.{input_format}", POLLING_COLUMNS)
+    df_conn_status = read_table(
+        f"{input_dir}/connectivity_status.{input_format}", CONN_STATUS_COLUMNS
+    )
+    return build_event_index(df_polling, df_conn_status, index_dir)
+
+
+def lookup(
+    index_dir: str,
+    order_id,
+    device_id: str,
+    order_creation_time: str,
+    time_period: list = TIME_PERIODS,
+) -> dict:
+    """
+    Computes the report row of a single order from an event index.
+
+    Args:
+        index_dir (str): The folder of the index, see `build`.
+        order_id: The ID of the order.
+        device_id (str): The ID of the device the order was dispatched to.
+        order_creation_time (str): The creation time of the order.
+        time_period (list): Time periods in minutes, see `events_processing.main`.
+
+    Returns:
+        dict: The report row of the order.
+    """
+    return lookup_order(
+        load_event_index(index_dir),
+        order_id,
+        device_id,
+        order_creation_time,
+        time_period=time_period,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Builds an event index and looks up the report row of single orders."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    parser_build = subparsers.add_parser("build", help="build the index of the inputs")
+    parser_build.add_argument("input_dir", help="folder with the input files")
+    parser_build.add_argument("index_dir", help="folder to write the index to")
+    parser_build.add_argument("--input-format", default="csv")
+    parser_lookup = subparsers.add_parser("lookup", help="print the row of an order")
+    parser_lookup.add_argument("index_dir", help="folder of the index")
+    parser_lookup.add_argument("order_id", type=int)
+    parser_lookup.add_argument("device_id")
+    parser_lookup.add_argument("order_creation_time")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        build(args.input_dir, args.index_dir, input_format=args.input_format)
+    else:
+        row = lookup(
+            args.index_dir, args.order_id, args.device_id, args.order_creation_time
+        )
+        row = {key: None if pd.isna(value) else value for key, value in row.items()}
+        print(json.dumps(row, default=str, indent=2))
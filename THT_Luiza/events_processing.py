@@ -1,31 +1,120 @@
+import contextlib
+import cProfile
 import logging
 import os
 import datetime as dt
+from src.buckets import cached_polling_buckets
+from src.cache import CACHE_DIR
 from src.load import load
-from src.extract import extract
-from src.transform import transformation
+from src.extract import ORDERS_COLUMNS, extract, read_table
+from src.transform import transformation, MAX_REPORT_CACHE_ROWS, TIME_PERIODS
+from src.stream import transformation_chunked
+from src.parallel import transformation_parallel
+from src.partitions import transformation_partitioned
+from src.metrics import collect_metrics, stage, write_metrics
+from src.incremental import read_state, transformation_incremental, write_state
 
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-def main():
+def main(
+    time_period: list = TIME_PERIODS,
+    chunksize: int = None,
+    workers: int = None,
+    input_format: str = "csv",
+    output_format: str = "csv",
+    incremental: bool = False,
+    metrics_path: str = None,
+    profile_path: str = None,
+    compression: str = None,
+    engine: str = "pandas",
+    max_memory: int = None,
+    connectivity_windows: bool = False,
+    cache: bool = False,
+    bucket_minutes: int = None,
+    report_cache: bool = False,
+    report_cache_max_rows: int = MAX_REPORT_CACHE_ROWS,
+    partitioned: bool = False,
+    dates: list = None,
+):
     """
     Executes the ETL process for processing polling events, connectivity status, and orders data.
 
     Args:
-        None
+        time_period (list): Time periods in minutes to count the polling events in, negative before
+            and positive after the order creation time. Defaults to 3 minutes before and after and
+            60 minutes before.
+        chunksize (int, optional): If given, runs in streaming mode: the polling events are read in
+            chunks of `chunksize` rows and only the events inside the longest time period are kept in
+            memory. The polling file must be ordered by creation_time. Defaults to None.
+        workers (int, optional): If given, runs the transformation on device shards in `workers`
+            processes. Not used in streaming mode. Defaults to None.
+        input_format (str): Extension of the input files: "csv", "parquet" or "arrow". Defaults to "csv".
+        output_format (str): Extension of the report file: "csv" or "parquet". Defaults to "csv".
+        incremental (bool): If True, only the new orders and the orders that were still open in the
+            previous run are processed, and their rows are upserted into the persisted report
+            `data/output/events_report.<output_format>`. The state of the runs is kept next to it in
+            `events_report_state.json`. The inputs are read in memory. Defaults to False.
+        metrics_path (str, optional): If given, the wall time, CPU time, row counts and peak memory of
+            the extract, transform and load steps and of the sub-steps of the transformation are written
+            to this JSON file. Defaults to None.
+        profile_path (str, optional): If given, the run is profiled with cProfile and the stats are dumped
+            to this file, e.g. for `snakeviz` or `pstats`. The worker processes of the parallel mode are
+            not profiled. Defaults to None.
+        compression (str, optional): "gzip" or "zstd" to compress the CSV report, which then ends with
+            .gz or .zst. Compressing with zstd needs the `zstandard` package. Defaults to None.
+        engine (str): "pandas", or "duckdb" to compute the report with SQL queries in DuckDB, which
+            reads the polling and connectivity status files itself. Needs the `duckdb` package and is
+            not used in the streaming, parallel and incremental modes, which run with pandas. Defaults to "pandas".
+        max_memory (int, optional): Memory budget of the transformation in bytes. When the transformation
+            is estimated to need more, the devices are transformed in sequential shards, and the peak memory
+            is logged against the budget. Only used by the default mode with the pandas engine. Defaults to None.
+        connectivity_windows (bool): If True, the report also has, for each time period, the seconds the device
+            was OFFLINE and its number of OFFLINE/ONLINE transitions. Only used by the default and parallel
+            modes with the pandas engine. Defaults to False.
+        cache (bool): If True, the parsed inputs are cached in `data/cache`, keyed by the path, size,
+            modification time and content hash of each file, so the next runs on the same files skip
+            their parsing. The least recently used inputs are removed above `MAX_CACHE_BYTES`.
+            Defaults to False, i.e. the files are always parsed.
+        bucket_minutes (int, optional): If given, the polling events are aggregated into per-device buckets
+            of this many minutes and the windows are counted from the buckets, with the same counts. With
+            the cache, the buckets of a polling file are kept for the next runs. Only used by the default
+            mode with the pandas engine. Defaults to None.
+        report_cache (bool): If True, the report rows of each device are cached in `data/cache` and only the
+            devices with new orders or events are computed again by the next runs, see
+            `report_rows_with_cache`. Only used by the default mode with the pandas engine. Defaults to False.
+        report_cache_max_rows (int): The maximum number of report rows kept in the report cache, the rows of the
+            least recently used devices are evicted above it. Defaults to `MAX_REPORT_CACHE_ROWS`, one million.
+        partitioned (bool): If True, the inputs are the date-partitioned folders `data/input/polling`,
+            `data/input/connectivity_status` and `data/input/orders`, with the files of each date in a subfolder
+            `date=YYYY-MM-DD`, and each day is transformed in its own process with its halos of events from the
+            neighbouring days, see `transformation_partitioned`. `workers` sets the number of processes.
+            Defaults to False.
+        dates (list, optional): The dates of the orders to report in partitioned mode, as "YYYY-MM-DD" strings.
+            Defaults to all the dates.
 
     Returns:
         None
     """
 
     # Use default input path
-    filename_polling = "data/input/polling.csv"
-    filename_conn_status = "data/input/connectivity_status.csv"
-    filename_orders = "data/input/orders.csv"
-    filename_output = f"data/output/events_report_{dt.datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.csv"
+    filename_polling = f"data/input/polling.{input_format}"
+    filename_conn_status = f"data/input/connectivity_status.{input_format}"
+    filename_orders = f"data/input/orders.{input_format}"
+    filename_output = f"data/output/events_report_{dt.datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.{output_format}"
+    filename_state = "data/output/events_report_state.json"
+    if incremental:
+        filename_output = f"data/output/events_report.{output_format}"
+        chunksize = None
+    if partitioned:
+        filename_polling, filename_conn_status, filename_orders = (
+            os.path.splitext(fp)[0]
+            for fp in [filename_polling, filename_conn_status, filename_orders]
+        )
+    if compression and output_format == "csv":
+        filename_output += {"gzip": ".gz", "zstd": ".zst"}[compression]
 
     # Create input/output directory if it doesn't exist
     file_paths = [
@@ -37,28 +126,129 @@ def main():
     for fp in file_paths:
         os.makedirs(os.path.dirname("/".join(fp.split("/")[:-1])), exist_ok=True)
 
-    # extract
-    logger.info("Starting extraction step")
-    df_polling, df_conn_status, df_orders = extract(
-        path_polling=filename_polling,
-        path_conn_status=filename_conn_status,
-        path_orders=filename_orders,
-    )
-    logger.info("DONE: extraction step")
-
-    # transform
-    logger.info("Starting transformation step")
-    data_transform = transformation(
-        df_polling=df_polling,
-        df_connectivity_status=df_conn_status,
-        df_orders=df_orders,
-    )
-    logger.info("DONE: transformation step")
-
-    # load
-    logger.info("Starting load step")
-    ret, output_path = load(df=data_transform, path_to_write=filename_output)
-    logger.info("DONE: load done")
+    # DuckDB only runs the default mode, the other modes read the inputs with pandas
+    use_duckdb = engine == "duckdb" and not (chunksize or workers or incremental)
+
+    # Metrics and profiling, only when they are asked for
+    with contextlib.ExitStack() as instrumentation:
+        if metrics_path:
+            records = instrumentation.enter_context(collect_metrics())
+        if profile_path:
+            profiler = cProfile.Profile()
+            os.makedirs(os.path.dirname(profile_path) or ".", exist_ok=True)
+            instrumentation.callback(profiler.dump_stats, profile_path)
+            instrumentation.enter_context(profiler)
+
+        # extract
+        logger.info("Starting extraction step")
+        with stage("extract") as metrics:
+            if partitioned:
+                # Each day reads its own partitions in the transformation
+                df_polling, df_conn_status, df_orders = (
+                    filename_polling,
+                    filename_conn_status,
+                    filename_orders,
+                )
+            elif use_duckdb:
+                # DuckDB scans the polling and connectivity status files itself
+                df_polling, df_conn_status = filename_polling, filename_conn_status
+                df_orders = read_table(filename_orders, columns=ORDERS_COLUMNS)
+            else:
+                df_polling, df_conn_status, df_orders = extract(
+                    path_polling=filename_polling,
+                    path_conn_status=filename_conn_status,
+                    path_orders=filename_orders,
+                    chunksize=chunksize,
+                    typed=True,
+                    concurrent=True,
+                    cache_dir=CACHE_DIR if cache else None,
+                )
+            if not chunksize and not use_duckdb and not partitioned:
+                metrics["rows_out"] = (
+                    len(df_polling) + len(df_conn_status) + len(df_orders)
+                )
+        logger.info("DONE: extraction step")
+
+        # transform
+        logger.info("Starting transformation step")
+        with stage(
+            "transform", rows_in=None if partitioned else len(df_orders)
+        ) as metrics:
+            if partitioned:
+                data_transform = transformation_partitioned(
+                    path_polling=filename_polling,
+                    path_conn_status=filename_conn_status,
+                    path_orders=filename_orders,
+                    dates=dates,
+                    time_period=time_period,
+                    workers=workers,
+                    connectivity_windows=connectivity_windows,
+                    cache_dir=CACHE_DIR if cache else None,
+                )
+            elif incremental:
+                data_transform, state = transformation_incremental(
+                    df_polling=df_polling,
+                    df_connectivity_status=df_conn_status,
+                    df_orders=df_orders,
+                    df_report=(
+                        read_table(filename_output)
+                        if os.path.exists(filename_output)
+                        else None
+                    ),
+                    state=read_state(filename_state),
+                    time_period=time_period,
+                )
+            elif chunksize:
+                data_transform = transformation_chunked(
+                    polling_chunks=df_polling,
+                    df_connectivity_status=df_conn_status,
+                    df_orders=df_orders,
+                    time_period=time_period,
+                )
+            elif workers:
+                data_transform = transformation_parallel(
+                    df_polling=df_polling,
+                    df_connectivity_status=df_conn_status,
+                    df_orders=df_orders,
+                    time_period=time_period,
+                    workers=workers,
+                    connectivity_windows=connectivity_windows,
+                )
+            else:
+                polling_buckets = None
+                if bucket_minutes and cache and engine == "pandas":
+                    polling_buckets = cached_polling_buckets(
+                        filename_polling, df_polling, bucket_minutes=bucket_minutes
+                    )
+                data_transform = transformation(
+                    df_polling=df_polling,
+                    df_connectivity_status=df_conn_status,
+                    df_orders=df_orders,
+                    time_period=time_period,
+                    engine=engine,
+                    max_memory=max_memory,
+                    connectivity_windows=connectivity_windows,
+                    bucket_minutes=bucket_minutes,
+                    polling_buckets=polling_buckets,
+                    report_cache_dir=CACHE_DIR if report_cache else None,
+                    report_cache_max_rows=report_cache_max_rows,
+                )
+            metrics["rows_out"] = len(data_transform)
+        logger.info("DONE: transformation step")
+
+        # load
+        logger.info("Starting load step")
+        with stage("load", rows_in=len(data_transform)):
+            ret, output_path = load(df=data_transform, path_to_write=filename_output)
+            if incremental:
+                write_state(filename_state, state)
+        logger.info("DONE: load done")
+
+    if metrics_path:
+        write_metrics(metrics_path, records)
+        logger.info(f"Metrics path is '{metrics_path}'")
+    if profile_path:
+        logger.info(f"Profile path is '{profile_path}'")
     logger.info(f"FINISHED: Output data path is '{output_path}'")
 
 
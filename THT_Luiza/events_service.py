@@ -0,0 +1,121 @@
+import argparse
+import asyncio
+import contextlib
+import logging
+import os
+import signal
+import sys
+from src.service import ReportService, run_service, serve_socket, tail_csv
+from src.transform import TIME_PERIODS
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Messages read ahead of the service, so a fast source waits for the service instead of filling the memory
+QUEUE_SIZE = 10_000
+
+
+async def serve(
+    path_polling: str = None,
+    path_conn_status: str = None,
+    path_orders: str = None,
+    socket_path: str = None,
+    output_path: str = None,
+    follow: bool = False,
+    time_period: list = TIME_PERIODS,
+    lateness: float = 0.0,
+    max_idle_minutes: float = None,
+) -> int:
+    """
+    Runs the report continuously: the polling events, connectivity status records and orders are read
+    as they arrive, and the report row of each order is written as soon as its windows have closed.
+
+    Args:
+        path_polling (str, optional): A polling events CSV file to read, with the columns of `data/input/polling.csv`.
+        path_conn_status (str, optional): A connectivity status CSV file to read.
+        path_orders (str, optional): An orders CSV file to read.
+        socket_path (str, optional): A Unix socket to listen on for JSON messages, see `serve_socket`.
+        output_path (str, optional): The file to append the report rows to, as JSON lines. Defaults to
+            the standard output.
+        follow (bool): If True, the files are followed as `tail -f` and the service runs until it is
+            stopped. Defaults to False, i.e. it stops at the end of the files.
+        time_period (list): Time periods in minutes, see `transformation`.
+        lateness (float): The seconds a message may arrive after newer messages of its source.
+        max_idle_minutes (float, optional): How long the last events of an idle device are kept, see
+            `ReportService`. Defaults to the longest time period.
+
+    Returns:
+        int: The number of report rows written.
+    """
+    # Stops the service gracefully, reporting the pending orders
+    loop = asyncio.get_running_loop()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        with contextlib.suppress(NotImplementedError):
+            loop.add_signal_handler(signal_number, asyncio.current_task().cancel)
+
+    service = ReportService(
+        time_period=time_period, lateness=lateness, max_idle_minutes=max_idle_minutes
+    )
+    queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+    sources = []
+    for kind, path in [
+        ("polling", path_polling),
+        ("connectivity_status", path_conn_status),
+        ("order", path_orders),
+    ]:
+        if path:
+            # No order is reported before every file has been read up to its time
+            service.register(path)
+            sources.append(asyncio.create_task(tail_csv(path, kind, queue, follow)))
+    server = None
+    if socket_path:
+        server = await serve_socket(socket_path, queue)
+        sources.append(asyncio.create_task(server.serve_forever()))
+        logger.info(f"Listening on '{socket_path}'")
+
+    with contextlib.ExitStack() as stack:
+        output = sys.stdout
+        if output_path:
+            os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+            output = stack.enter_context(open(output_path, "a"))
+        try:
+            written = await run_service(service, queue, output, sources)
+        finally:
+            for source in sources:
+                source.cancel()
+            if server is not None:
+                server.close()
+
+    logger.info(f"FINISHED: {written} report rows written")
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Reports the orders continuously from streams of events."
+    )
+    parser.add_argument("--polling", help="polling events CSV file to read")
+    parser.add_argument("--connectivity-status", help="connectivity status CSV file")
+    parser.add_argument("--orders", help="orders CSV file to read")
+    parser.add_argument("--socket", help="Unix socket to listen on for JSON messages")
+    parser.add_argument("--output", help="file to append the report rows to")
+    parser.add_argument("--follow", action="store_true", help="follow the files")
+    parser.add_argument("--time-period", type=int, nargs="+", default=TIME_PERIODS)
+    parser.add_argument("--lateness", type=float, default=0.0)
+    parser.add_argument("--max-idle-minutes", type=float, default=None)
+    args = parser.parse_args()
+
+    asyncio.run(
+        serve(
+            path_polling=args.polling,
+            path_conn_status=args.connectivity_status,
+            path_orders=args.orders,
+            socket_path=args.socket,
+            output_path=args.output,
+            follow=args.follow,
+            time_period=args.time_period,
+            lateness=args.lateness,
+            max_idle_minutes=args.max_idle_minutes,
+        )
+    )
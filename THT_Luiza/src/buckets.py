@@ -0,0 +1,481 @@
+import json
+import logging
+import os
+import shutil
+import threading
+import numpy as np
+import pandas as pd
+from src.cache import (
+    CACHE_DIR,
+    FOLDER_EXTENSION,
+    MAX_CACHE_BYTES,
+    cache_key,
+    evict,
+)
+from src.extract import POLLING_COLUMNS
+from src.timestamps import parse_timestamps
+from src.transform import (
+    ERROR_CODES,
+    MINUTE,
+    POLLING_EVENT_COLUMNS,
+    STATUS_CODES,
+    TIME_PERIODS,
+    _count_names,
+    count_columns,
+    device_index,
+    index_events_by_device,
+    locate_orders,
+    polling_event_codes,
+    python_value,
+    searchsorted_by_device,
+    time_period_suffix,
+)
+
+
+logger = logging.getLogger(__name__)
+
+# Arrays of the buckets, each stored in `<name>.npy` and memory-mapped by `read_polling_buckets`
+BUCKET_ARRAYS = [
+    "bucket_start",
+    "bucket_offsets",
+    "bucket_counts",
+    "event_first",
+    "event_time",
+    "event_status",
+    "event_error",
+]
+BUCKET_METADATA = "buckets.json"
+
+
+def _code_counts(
+    keys: np.ndarray,
+    status: np.ndarray,
+    error: np.ndarray,
+    n_keys: int,
+    n_status_codes: int,
+    n_error_codes: int,
+) -> np.ndarray:
+    """
+    Counts the polling events of each key, e.g. a bucket, for every count column of `_count_names`.
+
+    Args:
+        keys (np.ndarray): The key of each event, in `range(n_keys)`.
+        status (np.ndarray): The position of the status code of each event in the status codes, -1 if missing.
+        error (np.ndarray): The position of the error code of each event in the error codes, -1 if missing.
+        n_keys (int): The number of keys.
+        n_status_codes (int): The number of status codes.
+        n_error_codes (int): The number of error codes.
+
+    Returns:
+        np.ndarray: An int64 array of shape (n_keys, number of count columns).
+    """
+    # Column 0 of each matrix counts the events without a code
+    n_status, n_error = n_status_codes + 1, n_error_codes + 1
+    status_counts = np.bincount(
+        keys * n_status + status + 1, minlength=n_keys * n_status
+    ).reshape(n_keys, n_status)
+    error_counts = np.bincount(
+        keys * n_error + error + 1, minlength=n_keys * n_error
+    ).reshape(n_keys, n_error)
+
+    return np.hstack(
+        [
+            status_counts[:, 1:].sum(axis=1, keepdims=True),
+            status_counts[:, 1:],
+            error_counts[:, 1:],
+            error_counts[:, :1],
+        ]
+    ).astype(np.int64)
+
+
+def bucket_sorted_events(
+    events_sorted: pd.DataFrame,
+    devices: pd.Index,
+    offsets: np.ndarray,
+    bucket_minutes: int = 1,
+    status_codes: list = STATUS_CODES,
+    error_codes: list = ERROR_CODES,
+) -> dict:
+    """
+    Aggregates polling events sorted by `index_events_by_device` into per-device time buckets.
+
+    The counts of each bucket are stored as running counts over the buckets, so the counts of a
+    run of whole buckets are the difference of two rows. The events themselves are kept as their
+    times and code positions, to count exactly the part of the buckets cut by a window edge.
+
+    Args:
+        events_sorted (pd.DataFrame): The polling events sorted by `index_events_by_device`.
+        devices (pd.Index): The device IDs returned by `index_events_by_device`.
+        offsets (np.ndarray): The block offsets returned by `index_events_by_device`.
+        bucket_minutes (int): The length of the buckets in minutes.
+        status_codes (list): The status codes to count, see `polling_event_codes`.
+        error_codes (list): The error codes to count, see `polling_event_codes`.
+
+    Returns:
+        dict: The buckets, with the arrays of `BUCKET_ARRAYS`:
+            - bucket_start: the start time of each bucket as int64 nanoseconds, sorted by device and time
+            - bucket_offsets: the buckets of `devices[i]` are `bucket_offsets[i]:bucket_offsets[i + 1]`
+            - bucket_counts: the running counts of the buckets, one row per bucket boundary and one
+              column per count column of `_count_names`
+            - event_first: the events of bucket `b` are `event_first[b]:event_first[b + 1]`
+            - event_time, event_status, event_error: the time and code positions of each event
+        and the `devices`, `bucket_ns`, `status_codes` and `error_codes` they were built with.
+    """
+    bucket_ns = bucket_minutes * MINUTE
+    times = (
+        events_sorted["creation_time"].to_numpy(dtype="datetime64[ns]").view("int64")
+    )
+    starts = times - times % bucket_ns
+    device_of_event = np.repeat(np.arange(len(devices)), np.diff(offsets))
+
+    # A bucket begins at each event whose device or bucket start differs from the previous event
+    new_bucket = np.ones(len(times), dtype=bool)
+    new_bucket[1:] = (starts[1:] != starts[:-1]) | (
+        device_of_event[1:] != device_of_event[:-1]
+    )
+    event_first = np.append(np.flatnonzero(new_bucket), len(times))
+    bucket_of_event = np.cumsum(new_bucket) - 1
+    n_buckets = len(event_first) - 1
+
+    bucket_offsets = np.zeros(len(devices) + 1, dtype=np.int64)
+    np.cumsum(
+        np.bincount(device_of_event[event_first[:-1]], minlength=len(devices)),
+        out=bucket_offsets[1:],
+    )
+
+    status = pd.Categorical(events_sorted["status_code"], categories=status_codes).codes
+    error = pd.Categorical(events_sorted["error_code"], categories=error_codes).codes
+    counts = _code_counts(
+        bucket_of_event, status, error, n_buckets, len(status_codes), len(error_codes)
+    )
+    bucket_counts = np.zeros((n_buckets + 1, counts.shape[1]), dtype=np.int64)
+    np.cumsum(counts, axis=0, out=bucket_counts[1:])
+
+    return {
+        "bucket_start": starts[event_first[:-1]],
+        "bucket_offsets": bucket_offsets,
+        "bucket_counts": bucket_counts,
+        "event_first": event_first,
+        "event_time": times,
+        "event_status": status,
+        "event_error": error,
+        "devices": devices,
+        "bucket_ns": bucket_ns,
+        "status_codes": list(status_codes),
+        "error_codes": list(error_codes),
+    }
+
+
+def bucket_polling_events(
+    df_polling: pd.DataFrame,
+    bucket_minutes: int = 1,
+    status_codes: list = STATUS_CODES,
+    error_codes: list = ERROR_CODES,
+) -> dict:
+    """
+    Aggregates the polling events into per-device time buckets, see `bucket_sorted_events`.
+
+    Args:
+        df_polling (pd.DataFrame): Input DataFrame containing polling events.
+        bucket_minutes (int): The length of the buckets in minutes.
+        status_codes (list): Declared status codes, see `transformation`.
+        error_codes (list): Declared error codes, see `transformation`.
+
+    Returns:
+        dict: The buckets returned by `bucket_sorted_events`.
+    """
+    df_polling = df_polling.assign(
+        creation_time=parse_timestamps(df_polling["creation_time"])
+    )
+    events_sorted, devices, offsets = index_events_by_device(
+        df_polling,
+        devices=device_index(df_polling["device_id"]),
+        columns=POLLING_EVENT_COLUMNS,
+    )
+    status_codes, error_codes = polling_event_codes(
+        events_sorted, status_codes=status_codes, error_codes=error_codes
+    )
+    buckets = bucket_sorted_events(
+        events_sorted, devices, offsets, bucket_minutes, status_codes, error_codes
+    )
+    logger.info(
+        f"Aggregated {len(events_sorted)} polling events into "
+        f"{len(buckets['bucket_start'])} buckets of {bucket_minutes} min"
+    )
+    return buckets
+
+
+def cached_polling_buckets(
+    path_polling: str,
+    df_polling: pd.DataFrame,
+    bucket_minutes: int = 1,
+    cache_dir: str = CACHE_DIR,
+    max_bytes: int = MAX_CACHE_BYTES,
+) -> dict:
+    """
+    Loads the buckets of a polling file from the cache of `src.cache`, or builds them with
+    `bucket_polling_events` and caches them under the content hash of the file for the next runs.
+    The cached buckets are a folder of `write_polling_buckets`, so their events are memory-mapped
+    and only the pages of the buckets around the orders are read.
+
+    Args:
+        path_polling (str): The path to the polling file.
+        df_polling (pd.DataFrame): The polling events read from the file.
+        bucket_minutes (int): The length of the buckets in minutes.
+        cache_dir (str): The cache folder.
+        max_bytes (int): The maximum total size of the cache, see `evict`.
+
+    Returns:
+        dict: The buckets returned by `bucket_polling_events`, with the declared codes of `transformation`.
+    """
+    name = (
+        f"{cache_key(path_polling, POLLING_COLUMNS, cache_dir)}"
+        f"_buckets_{bucket_minutes}min"
+    )
+    buckets_dir = os.path.join(cache_dir, name + FOLDER_EXTENSION)
+    try:
+        buckets = read_polling_buckets(buckets_dir)
+    except ValueError:
+        buckets = bucket_polling_events(df_polling, bucket_minutes=bucket_minutes)
+        path_tmp = f"{buckets_dir}.{os.getpid()}.{threading.get_ident()}.tmp"
+        write_polling_buckets(buckets, path_tmp)
+        try:
+            os.replace(path_tmp, buckets_dir)
+        except OSError:
+            # Cached by another run in the meantime
+            shutil.rmtree(path_tmp, ignore_errors=True)
+        evict(cache_dir, max_bytes)
+        return buckets
+
+    # The folders are touched when they are loaded, as the pickles of `load_cached`
+    os.utime(buckets_dir)
+    logger.info(f"Read the polling buckets of '{path_polling}' from the cache")
+    return buckets
+
+
+def write_polling_buckets(buckets: dict, buckets_dir: str) -> str:
+    """
+    Writes buckets to a folder, to reuse them in the next runs with `read_polling_buckets`.
+
+    Args:
+        buckets (dict): The buckets returned by `bucket_polling_events`.
+        buckets_dir (str): The folder to write the buckets to. It is created if it does not exist, and
+            the files of previous buckets are replaced.
+
+    Returns:
+        str: The path to the buckets folder.
+    """
+    os.makedirs(buckets_dir, exist_ok=True)
+    for name in BUCKET_ARRAYS:
+        np.save(
+            os.path.join(buckets_dir, f"{name}.npy"),
+            np.ascontiguousarray(buckets[name]),
+        )
+    # The metadata is written last, so a folder without it is not read as complete buckets
+    with open(os.path.join(buckets_dir, BUCKET_METADATA), "w") as f:
+        json.dump(
+            {
+                "devices": [python_value(device) for device in buckets["devices"]],
+                "bucket_ns": buckets["bucket_ns"],
+                "status_codes": [
+                    python_value(code) for code in buckets["status_codes"]
+                ],
+                "error_codes": [python_value(code) for code in buckets["error_codes"]],
+            },
+            f,
+        )
+    return buckets_dir
+
+
+def read_polling_buckets(buckets_dir: str) -> dict:
+    """
+    Opens buckets written by `write_polling_buckets`. The arrays are memory-mapped, so only the events
+    of the buckets cut by a window edge are read from the disk.
+
+    Args:
+        buckets_dir (str): The path to the buckets folder.
+
+    Returns:
+        dict: The buckets, as returned by `bucket_polling_events`.
+
+    Raises:
+        ValueError: If the folder does not contain buckets.
+    """
+    path_metadata = os.path.join(buckets_dir, BUCKET_METADATA)
+    if not os.path.exists(path_metadata):
+        raise ValueError(f"The buckets path '{buckets_dir}' does not exist")
+
+    with open(path_metadata) as f:
+        buckets = json.load(f)
+    buckets["devices"] = pd.Index(buckets["devices"])
+    for name in BUCKET_ARRAYS:
+        buckets[name] = np.asarray(
+            np.load(os.path.join(buckets_dir, f"{name}.npy"), mmap_mode="r")
+        )
+
+    return buckets
+
+
+def _edge_counts(
+    buckets: dict,
+    edge_buckets: np.ndarray,
+    window_starts: np.ndarray,
+    window_ends: np.ndarray,
+) -> np.ndarray:
+    """
+    Counts the events of the given buckets that are inside their window, reading only the events of these buckets.
+
+    Args:
+        buckets (dict): The buckets returned by `bucket_polling_events`.
+        edge_buckets (np.ndarray): A bucket per window, or -1 for no bucket.
+        window_starts (np.ndarray): The first time of each window, as int64 nanoseconds.
+        window_ends (np.ndarray): The last time of each window, as int64 nanoseconds.
+
+    Returns:
+        np.ndarray: An int64 array of shape (number of windows, number of count columns).
+    """
+    event_first = buckets["event_first"]
+    windows = np.flatnonzero(edge_buckets >= 0)
+    first = event_first[edge_buckets[windows]]
+    lengths = event_first[edge_buckets[windows] + 1] - first
+
+    # Positions of all the events of the edge buckets, with the window of each one
+    window_of_event = np.repeat(windows, lengths)
+    starts_of_windows = np.cumsum(lengths) - lengths
+    events = np.repeat(first - starts_of_windows, lengths) + np.arange(lengths.sum())
+
+    times = buckets["event_time"][events]
+    inside = (times >= window_starts[window_of_event]) & (
+        times <= window_ends[window_of_event]
+    )
+    return _code_counts(
+        window_of_event[inside],
+        buckets["event_status"][events[inside]],
+        buckets["event_error"][events[inside]],
+        len(edge_buckets),
+        len(buckets["status_codes"]),
+        len(buckets["error_codes"]),
+    )
+
+
+def count_polling_events_in_buckets(
+    orders: pd.DataFrame,
+    buckets: dict,
+    time_period: list = TIME_PERIODS,
+) -> pd.DataFrame:
+    """
+    Computes the counts of polling events of each order from per-device time buckets.
+
+    The buckets inside a window are counted with their running counts. The bucket cut by each edge of
+    the window is counted from its events, so the counts are exactly those of `count_polling_events_in_windows`.
+
+    Args:
+        orders (pd.DataFrame): A Pandas DataFrame containing orders data, with the columns order_id,
+            device_id and order_creation_time.
+        buckets (dict): The buckets returned by `bucket_polling_events` or `read_polling_buckets`.
+        time_period (list): The time periods in minutes. Negative periods are counted before the order
+            creation time and positive periods after it.
+
+    Returns:
+        pd.DataFrame: The same DataFrame as `count_polling_events_in_windows`.
+    """
+    bucket_start, bucket_offsets = buckets["bucket_start"], buckets["bucket_offsets"]
+    bucket_counts = buckets["bucket_counts"]
+    status_codes, error_codes = buckets["status_codes"], buckets["error_codes"]
+    order_times, codes, groups = locate_orders(orders, buckets["devices"])
+    first_bucket = np.where(codes >= 0, bucket_offsets[codes], 0)
+
+    columns = {"order_id": orders["order_id"].to_numpy()}
+    names = _count_names(status_codes, error_codes)
+    for t in time_period:
+        # Windows before the order are [order + t, order] and windows after it are [order, order + t]
+        shift = pd.Timedelta(minutes=t).value
+        window_starts = order_times + min(shift, 0)
+        window_ends = order_times + max(shift, 0)
+        # The first bucket starting in the window and the last bucket starting before its end.
+        # The buckets in between are whole, and the buckets before them and at the end are cut
+        i = searchsorted_by_device(bucket_start, bucket_offsets, groups, window_starts)
+        k = (
+            searchsorted_by_device(
+                bucket_start, bucket_offsets, groups, window_ends, side="right"
+            )
+            - 1
+        )
+        i[codes < 0], k[codes < 0] = 0, -1
+
+        whole = k >= i
+        counts = np.where(
+            whole[:, None],
+            bucket_counts[np.maximum(k, 0)] - bucket_counts[i],
+            0,
+        )
+        counts += _edge_counts(
+            buckets,
+            np.where(i > first_bucket, i - 1, -1),
+            window_starts,
+            window_ends,
+        )
+        counts += _edge_counts(
+            buckets, np.where(whole, k, -1), window_starts, window_ends
+        )
+        suffix = time_period_suffix(t)
+        for j, name in enumerate(names):
+            columns[name + suffix] = counts[:, j]
+
+    return pd.DataFrame(columns)[
+        ["order_id"] + count_columns(time_period, status_codes, error_codes)
+    ]
+
+
+def near_polling_events(orders: pd.DataFrame, buckets: dict) -> pd.DataFrame:
+    """
+    Takes from the buckets the polling events that can be the nearest preceding or following event of the orders.
+
+    The nearest events of an order are in the last bucket of its device starting at or before the order, or
+    are the last event of the bucket before it or the first event of the bucket after it. Only these events
+    are read from the buckets, so `find_near_events_and_status` finds the same nearest events in them as in
+    all the polling events.
+
+    Args:
+        orders (pd.DataFrame): A Pandas DataFrame containing orders data, with the columns device_id and
+            order_creation_time, parsed as datetimes.
+        buckets (dict): The buckets returned by `bucket_polling_events` or `read_polling_buckets`.
+
+    Returns:
+        pd.DataFrame: The polling events, with the columns creation_time and device_id, sorted by device and time.
+    """
+    bucket_start, bucket_offsets = buckets["bucket_start"], buckets["bucket_offsets"]
+    event_first = buckets["event_first"]
+    order_times, codes, groups = locate_orders(orders, buckets["devices"])
+    known = codes >= 0
+    first_bucket = np.where(known, bucket_offsets[codes], 0)
+    end_bucket = np.where(known, bucket_offsets[codes + 1], 0)
+    k = (
+        searchsorted_by_device(
+            bucket_start, bucket_offsets, groups, order_times, side="right"
+        )
+        - 1
+    )
+
+    # The events of bucket k with the last event of the bucket before it and the first event of the bucket
+    # after it, or the first event of the device for the orders before its first bucket
+    starts = event_first[np.maximum(k, first_bucket)] - (k > first_bucket)
+    ends = np.where(
+        k >= first_bucket,
+        event_first[k + 1] + (k + 1 < end_bucket),
+        starts + 1,
+    )
+    lengths = np.where(known, ends - starts, 0)
+    events = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths) + np.arange(
+        lengths.sum()
+    )
+    events, first = np.unique(events, return_index=True)
+
+    return pd.DataFrame(
+        {
+            "creation_time": buckets["event_time"][events].view("datetime64[ns]"),
+            "device_id": pd.Categorical.from_codes(
+                np.repeat(codes, lengths)[first], categories=buckets["devices"]
+            ),
+        }
+    )
@@ -0,0 +1,228 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import pandas as pd
+from src.timestamps import TIMESTAMP_FORMATS, parse_timestamps
+
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = "data/cache"
+# Total size of the cached objects, the least recently used ones are removed above it
+MAX_CACHE_BYTES = 2 * 2**30
+# Path, size, modification time and content hash of the files read with the cache
+INDEX_FILE = "index.json"
+CACHE_EXTENSION = ".pkl"
+# Folders of memory-mapped arrays, e.g. the polling buckets, evicted with the pickles
+FOLDER_EXTENSION = ".npy.d"
+HASH_BLOCK_BYTES = 2**20
+
+# The index is shared by the threads of the concurrent extract
+_index_lock = threading.Lock()
+
+
+def content_hash(path: str, columns: list = None) -> str:
+    """
+    Hashes the content of a file and the columns read from it.
+
+    Args:
+        path (str): The path to the file.
+        columns (list, optional): The columns read from the file, so the same file read with other
+            columns has another hash.
+
+    Returns:
+        str: The BLAKE2b hex digest.
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(json.dumps(columns).encode())
+    with open(path, "rb") as f:
+        while block := f.read(HASH_BLOCK_BYTES):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _read_index(cache_dir: str) -> dict:
+    """Reads the index of a cache folder, or returns an empty index if it is missing or corrupt."""
+    try:
+        with open(os.path.join(cache_dir, INDEX_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_index(cache_dir: str, index: dict) -> None:
+    """Writes the index of a cache folder atomically."""
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, INDEX_FILE)
+    path_tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(path_tmp, "w") as f:
+        json.dump(index, f)
+    os.replace(path_tmp, path)
+
+
+def cache_key(path: str, columns: list = None, cache_dir: str = CACHE_DIR) -> str:
+    """
+    Finds the cache key of a file: the content hash of `content_hash`. The file is only hashed again
+    when its size or modification time changed since it was last read with the cache.
+
+    Args:
+        path (str): The path to the file.
+        columns (list, optional): The columns read from the file.
+        cache_dir (str): The cache folder.
+
+    Returns:
+        str: The cache key.
+    """
+    stat = os.stat(path)
+    entry = {
+        "columns": columns,
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+    }
+    name = os.path.abspath(path)
+    with _index_lock:
+        known = _read_index(cache_dir).get(name)
+    if known is not None and {k: known.get(k) for k in entry} == entry:
+        return known["key"]
+
+    key = content_hash(path, columns)
+    with _index_lock:
+        index = _read_index(cache_dir)
+        index[name] = entry | {"key": key}
+        _write_index(cache_dir, index)
+    return key
+
+
+def evict(cache_dir: str = CACHE_DIR, max_bytes: int = MAX_CACHE_BYTES) -> list:
+    """
+    Removes the least recently used cached objects, pickles or folders of arrays, until their total size
+    is at most `max_bytes`.
+
+    Args:
+        cache_dir (str): The cache folder.
+        max_bytes (int): The maximum total size of the cached objects in bytes.
+
+    Returns:
+        list: The names of the removed objects.
+    """
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if entry.name.endswith(CACHE_EXTENSION):
+            stat = entry.stat()
+            entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        elif entry.name.endswith(FOLDER_EXTENSION) and entry.is_dir():
+            size = sum(array.stat().st_size for array in os.scandir(entry.path))
+            entries.append((entry.stat().st_mtime_ns, size, entry.path))
+    # The objects are touched when they are loaded, so the oldest modification time is the least recently used
+    entries.sort()
+    total = sum(size for _, size, _ in entries)
+    removed = []
+    for _, size, path in entries:
+        if total <= max_bytes:
+            break
+        if path.endswith(FOLDER_EXTENSION):
+            shutil.rmtree(path, ignore_errors=True)
+            removed.append(os.path.basename(path)[: -len(FOLDER_EXTENSION)])
+        else:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            removed.append(os.path.basename(path)[: -len(CACHE_EXTENSION)])
+        total -= size
+    if removed:
+        logger.info(f"Evicted {len(removed)} cached objects from '{cache_dir}'")
+    return removed
+
+
+def load_cached(name: str, cache_dir: str = CACHE_DIR):
+    """
+    Loads an object from the cache and marks it as recently used.
+
+    Args:
+        name (str): The name of the object in the cache, e.g. a key of `cache_key`.
+        cache_dir (str): The cache folder.
+
+    Returns:
+        The cached object, or None if it is not in the cache.
+    """
+    path_cache = os.path.join(cache_dir, name + CACHE_EXTENSION)
+    try:
+        value = pd.read_pickle(path_cache)
+    except FileNotFoundError:
+        return None
+    os.utime(path_cache)
+    return value
+
+
+def store_cached(
+    name: str, value, cache_dir: str = CACHE_DIR, max_bytes: int = MAX_CACHE_BYTES
+) -> None:
+    """
+    Stores an object in the cache atomically, then evicts the least recently used objects above `max_bytes`.
+
+    Args:
+        name (str): The name of the object in the cache.
+        value: The object, which is pickled.
+        cache_dir (str): The cache folder, created if needed.
+        max_bytes (int): The maximum total size of the cache, see `evict`.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    path_cache = os.path.join(cache_dir, name + CACHE_EXTENSION)
+    path_tmp = f"{path_cache}.{os.getpid()}.{threading.get_ident()}.tmp"
+    pd.to_pickle(value, path_tmp)
+    os.replace(path_tmp, path_cache)
+    evict(cache_dir, max_bytes)
+
+
+def read_cached(
+    path: str,
+    read,
+    columns: list = None,
+    cache_dir: str = CACHE_DIR,
+    max_bytes: int = MAX_CACHE_BYTES,
+    reader: str = None,
+) -> pd.DataFrame:
+    """
+    Reads an input file through an on-disk cache of parsed frames.
+
+    The frame is read with `read` and its time columns of `TIMESTAMP_FORMATS` are parsed with
+    `parse_timestamps`, then it is pickled in `cache_dir` under the key of `cache_key` and the name of the
+    reader. The next reads of the same content with the same reader, even from another path, load the
+    pickle instead of parsing the file again.
+    The cache folder must only be written by this module, as pickles are trusted when they are loaded.
+
+    Args:
+        path (str): The path to the file.
+        read (callable): Reads the file, called as `read(path, columns)`, e.g. `read_table`.
+        columns (list, optional): The columns to read.
+        cache_dir (str): The cache folder, created if needed.
+        max_bytes (int): The maximum total size of the cache, see `evict`.
+        reader (str, optional): The name of `read` and of its options, e.g. "pyarrow_typed", so that the
+            frames of a file read in other ways, with other dtypes, are cached apart.
+
+    Returns:
+        pd.DataFrame: The content of the file, with parsed time columns.
+    """
+    key = cache_key(path, columns, cache_dir)
+    if reader:
+        key = f"{key}_{reader}"
+    df = load_cached(key, cache_dir)
+    if df is not None:
+        logger.info(f"Read '{path}' from the cache")
+        return df
+
+    df = read(path, columns)
+    df = df.assign(
+        **{
+            column: parse_timestamps(df[column])
+            for column in df.columns
+            if column in TIMESTAMP_FORMATS
+        }
+    )
+    store_cached(key, df, cache_dir, max_bytes)
+
+    return df
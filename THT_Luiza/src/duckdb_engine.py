@@ -0,0 +1,235 @@
+import os
+import numpy as np
+import pandas as pd
+from src.extract import (
+    CONN_STATUS_COLUMNS,
+    ORDERS_COLUMNS,
+    PARQUET_EXTENSIONS,
+    POLLING_COLUMNS,
+    read_table,
+)
+from src.timestamps import parse_timestamps
+from src.transform import (
+    ERROR_CODES,
+    STATUS_CODES,
+    TIME_PERIODS,
+    _count_names,
+    python_value,
+    time_period_suffix,
+)
+
+
+def _register(con, name: str, source, columns: list, time_column: str) -> None:
+    """
+    Creates a view of an input with a VARCHAR device_id and a TIMESTAMP_NS time column.
+
+    Args:
+        con (duckdb.DuckDBPyConnection): The DuckDB connection.
+        name (str): The name of the view.
+        source (pd.DataFrame or str): The input DataFrame, or the path to a CSV or Parquet file,
+            which is then scanned by DuckDB without being loaded in pandas. Other files are read with `read_table`.
+        columns (list): The columns of the input.
+        time_column (str): The name of the time column.
+    """
+    if isinstance(source, str):
+        extension = os.path.splitext(source)[1].lower()
+        if extension in PARQUET_EXTENSIONS:
+            relation = con.read_parquet(source)
+        elif extension in (".csv", ".gz", ".zst"):
+            relation = con.read_csv(source, header=True)
+        else:
+            source = read_table(source, columns=columns)
+    if not isinstance(source, str):
+        # Dictionary-encoded and integer time columns of `extract(typed=True)` are decoded first
+        source = pd.DataFrame(
+            {
+                column: (
+                    parse_timestamps(source[column])
+                    if column == time_column
+                    else np.asarray(source[column], dtype=object)
+                    if isinstance(source[column].dtype, pd.CategoricalDtype)
+                    else source[column]
+                )
+                for column in columns
+            }
+        )
+        relation = con.from_df(source)
+
+    casts = ", ".join(
+        f"TRY_CAST({column} AS TIMESTAMP_NS) AS {column}"
+        if column == time_column
+        else f"CAST({column} AS VARCHAR) AS {column}"
+        if column == "device_id"
+        else column
+        for column in columns
+    )
+    relation.project(casts).create_view(name)
+
+
+def _sql_literal(value) -> str:
+    """Formats a status or error code as a SQL literal."""
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+    return repr(python_value(value))
+
+
+def transformation_duckdb(
+    df_polling,
+    df_connectivity_status,
+    df_orders,
+    time_period: list = TIME_PERIODS,
+    status_codes: list = STATUS_CODES,
+    error_codes: list = ERROR_CODES,
+) -> pd.DataFrame:
+    """
+    Builds the report of `transformation` with SQL queries in an embedded DuckDB database.
+
+    The nearest preceding and following polling events and the previous connectivity status are
+    found with ASOF JOINs, and the polling events of all the time periods are counted in a single
+    range join grouped by order. DuckDB runs the queries on all the CPU cores and can spill to disk,
+    so the polling events and connectivity status can be given as file paths and are then not
+    loaded in pandas. It needs the `duckdb` package.
+
+    Args:
+        df_polling (pd.DataFrame or str): The polling events, or the path to a CSV or Parquet file.
+        df_connectivity_status (pd.DataFrame or str): The connectivity status logs, or the path to
+            a CSV or Parquet file.
+        df_orders (pd.DataFrame or str): The orders, or the path to their file. They are always read in pandas.
+        time_period (list): Time periods in minutes, see `transformation`.
+        status_codes (list): Declared status codes, see `transformation`.
+        error_codes (list): Declared error codes, see `transformation`.
+
+    Returns:
+        pd.DataFrame: The same report as `transformation`, with the same rows and columns in the same order.
+        When several connectivity status logs of a device have the same time, the status of any of
+        them can be reported.
+    """
+    import duckdb
+
+    if isinstance(df_orders, str):
+        df_orders = read_table(df_orders, columns=ORDERS_COLUMNS)
+
+    # The orders keep their input position, to return the rows in the order of `transformation`
+    df_base = df_orders.loc[
+        df_orders["device_id"].notna(), ["order_id", "device_id", "order_creation_time"]
+    ]
+    df_base = df_base.assign(
+        order_creation_time=parse_timestamps(df_base["order_creation_time"])
+    )
+
+    con = duckdb.connect()
+    try:
+        con.execute("SET enable_progress_bar = false")
+        _register(
+            con,
+            "orders",
+            df_base.assign(order_row=np.arange(len(df_base))),
+            ["order_row", "device_id", "order_creation_time"],
+            "order_creation_time",
+        )
+        _register(con, "polling_input", df_polling, POLLING_COLUMNS, "creation_time")
+        _register(
+            con,
+            "conn_status_input",
+            df_connectivity_status,
+            CONN_STATUS_COLUMNS,
+            "creation_time",
+        )
+        con.execute(
+            "CREATE TEMP TABLE polling AS SELECT * FROM polling_input "
+            "WHERE device_id IS NOT NULL AND creation_time IS NOT NULL"
+        )
+        con.execute(
+            "CREATE VIEW conn_status AS SELECT * FROM conn_status_input "
+            "WHERE device_id IS NOT NULL AND creation_time IS NOT NULL"
+        )
+
+        # The declared codes, then the other codes found in the polling events, as `polling_event_codes`
+        codes = []
+        for column, declared in [
+            ("status_code", status_codes),
+            ("error_code", error_codes),
+        ]:
+            found = {
+                python_value(value)
+                for (value,) in con.execute(
+                    f"SELECT DISTINCT {column} FROM polling WHERE {column} IS NOT NULL"
+                ).fetchall()
+            }
+            codes.append(list(declared) + sorted(found - set(declared)))
+        status_codes, error_codes = codes
+
+        # Conditions of each count, in the order of `_count_names`
+        conditions = (
+            ["p.status_code IS NOT NULL"]
+            + [f"p.status_code = {_sql_literal(code)}" for code in status_codes]
+            + [f"p.error_code = {_sql_literal(code)}" for code in error_codes]
+            + ["p.error_code IS NULL"]
+        )
+        counts = []
+        for t in time_period:
+            # Windows before the order are [order + t, order] and windows after it are [order, order + t]
+            bound = f"o.order_creation_time + INTERVAL '{t} minutes'"
+            window = (
+                f"p.creation_time >= {bound} AND p.creation_time <= o.order_creation_time"
+                if t <= 0
+                else f"p.creation_time >= o.order_creation_time AND p.creation_time <= {bound}"
+            )
+            for name, condition in zip(
+                _count_names(status_codes, error_codes), conditions
+            ):
+                counts.append(
+                    f'COUNT(*) FILTER (WHERE {window} AND {condition}) AS "{name}{time_period_suffix(t)}"'
+                )
+        start = min([0] + list(time_period))
+        end = max([0] + list(time_period))
+
+        df_sql = con.execute(
+            f"""
+            WITH preceding AS (
+                SELECT o.order_row, p.creation_time AS preceding_event
+                FROM orders o ASOF LEFT JOIN polling p
+                ON o.device_id = p.device_id AND o.order_creation_time >= p.creation_time
+            ), following AS (
+                SELECT o.order_row, p.creation_time AS following_event
+                FROM orders o ASOF LEFT JOIN polling p
+                ON o.device_id = p.device_id AND o.order_creation_time <= p.creation_time
+            ), status AS (
+                SELECT o.order_row, c.status AS previous_status, c.creation_time AS status_time
+                FROM orders o ASOF LEFT JOIN conn_status c
+                ON o.device_id = c.device_id AND o.order_creation_time >= c.creation_time
+            ), counts AS (
+                SELECT o.order_row, {", ".join(counts)}
+                FROM orders o LEFT JOIN polling p
+                ON o.device_id = p.device_id
+                AND p.creation_time >= o.order_creation_time + INTERVAL '{start} minutes'
+                AND p.creation_time <= o.order_creation_time + INTERVAL '{end} minutes'
+                GROUP BY o.order_row
+            )
+            SELECT *
+            FROM preceding
+            JOIN following USING (order_row)
+            JOIN status USING (order_row)
+            JOIN counts USING (order_row)
+            ORDER BY order_row
+            """
+        ).df()
+    finally:
+        con.close()
+
+    result = pd.DataFrame(
+        {
+            "order_id": df_base["order_id"].to_numpy(),
+            "device_id": df_base["device_id"].array,
+            "order_creation_time": df_base["order_creation_time"].to_numpy(),
+            "preceding_event": df_sql["preceding_event"].to_numpy("datetime64[ns]"),
+            "following_event": df_sql["following_event"].to_numpy("datetime64[ns]"),
+            "previous_status": df_sql["previous_status"].fillna(np.nan).to_numpy(),
+            "status_time": df_sql["status_time"].to_numpy("datetime64[ns]"),
+        }
+    )
+    count_names = [column for column in df_sql.columns if column.startswith("count_")]
+    result[count_names] = df_sql[count_names].astype(np.int64).to_numpy()
+
+    # Same row order as `find_near_events_and_status`, i.e. sorted by order creation time
+    return result.sort_values("order_creation_time").reset_index(drop=True)
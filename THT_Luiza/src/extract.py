@@ -1,15 +1,184 @@
 import pandas as pd
+import numpy as np
+import importlib.util
+import logging
 import os
+from concurrent.futures import ThreadPoolExecutor
+from src.cache import MAX_CACHE_BYTES, read_cached
+from src.timestamps import TIMESTAMP_FORMATS, parse_timestamps
+from src.transform import SORTED_BY, sortedness
 
 
-def extract(path_polling: str, path_conn_status: str, path_orders: str) -> tuple:
+logger = logging.getLogger(__name__)
+
+# Columns read from each input, the other columns of the files are not loaded
+POLLING_COLUMNS = ["creation_time", "device_id", "error_code", "status_code"]
+CONN_STATUS_COLUMNS = ["creation_time", "status", "device_id"]
+ORDERS_COLUMNS = ["order_creation_time", "order_id", "device_id"]
+
+PARQUET_EXTENSIONS = (".parquet", ".pq")
+ARROW_EXTENSIONS = (".arrow", ".feather", ".ipc")
+
+# The multithreaded Arrow CSV reader is used by the concurrent extract when pyarrow is installed
+ARROW_CSV_AVAILABLE = importlib.util.find_spec("pyarrow") is not None
+
+
+def read_csv_arrow(path: str, columns: list = None) -> pd.DataFrame:
+    """
+    Reads a CSV file with the multithreaded Arrow CSV reader. It needs `pyarrow`.
+
+    The values are converted as by `pd.read_csv`: empty strings and the usual null markers are
+    missing values, and integer columns with missing values are floats. The time columns of
+    `TIMESTAMP_FORMATS` are kept as strings, so they are parsed with their declared format
+    by `parse_timestamps`.
+
+    Args:
+        path (str): The path to the CSV file.
+        columns (list, optional): The columns to read, in this order. Defaults to all the columns.
+
+    Returns:
+        pd.DataFrame: The content of the file.
+    """
+    import pyarrow as pa
+    import pyarrow.csv as csv
+
+    convert_options = csv.ConvertOptions(
+        include_columns=columns,
+        strings_can_be_null=True,
+        column_types={column: pa.string() for column in TIMESTAMP_FORMATS},
+    )
+    return csv.read_csv(path, convert_options=convert_options).to_pandas()
+
+
+def read_table(
+    path: str, columns: list = None, chunksize: int = None, engine: str = None
+):
+    """
+    Reads a CSV, Parquet or Arrow IPC file, picked by the file extension.
+
+    Parquet and Arrow IPC files need `pyarrow`. Their columns keep the types they were written
+    with, so timestamps are not parsed again.
+
+    Args:
+        path (str): The path to the file. Files ending with .parquet or .pq are read as Parquet,
+            files ending with .arrow, .feather or .ipc as Arrow IPC and the other files as CSV.
+        columns (list, optional): The columns to read. Defaults to all the columns.
+        chunksize (int, optional): If given, an iterator over DataFrames of about `chunksize` rows
+            is returned instead of a DataFrame. Defaults to None.
+        engine (str, optional): The CSV reader: "pyarrow" for `read_csv_arrow`, or None for the pandas
+            C parser. Chunked reads always use the pandas C parser. Defaults to None.
+
+    Returns:
+        pd.DataFrame or Iterator[pd.DataFrame]: The content of the file.
+    """
+    extension = os.path.splitext(path)[1].lower()
+
+    if extension in PARQUET_EXTENSIONS:
+        if chunksize is None:
+            return pd.read_parquet(path, columns=columns)
+        import pyarrow.parquet as pq
+
+        batches = pq.ParquetFile(path).iter_batches(
+            batch_size=chunksize, columns=columns
+        )
+        return (batch.to_pandas() for batch in batches)
+
+    if extension in ARROW_EXTENSIONS:
+        if chunksize is None:
+            return pd.read_feather(path, columns=columns)
+        import pyarrow.ipc as ipc
+
+        reader = ipc.open_file(path)
+        return (
+            reader.get_batch(i).select(columns or reader.schema.names).to_pandas()
+            for i in range(reader.num_record_batches)
+        )
+
+    if engine == "pyarrow" and chunksize is None:
+        return read_csv_arrow(path, columns=columns)
+
+    return pd.read_csv(path, header=0, sep=",", usecols=columns, chunksize=chunksize)
+
+
+def encode_inputs(
+    df_polling: pd.DataFrame, df_conn_status: pd.DataFrame, df_orders: pd.DataFrame
+) -> tuple:
     """
-    Reads CSV files from the specified paths returns them as a tuple with 3 pandas DataFrame.
+    Converts the 3 input DataFrames to compact types:
+        - device_id is dictionary-encoded, with the same categories (the sorted device IDs) in the 3 DataFrames,
+          so the joins are done on the integer codes and the strings are only written back by `load`
+        - status_code, error_code and status are categoricals
+        - creation_time and order_creation_time are int64 nanoseconds since the epoch, with invalid
+          times as the NaT integer value
 
     Args:
-        path_polling (str): The path to the polling CSV file
-        path_conn_status (str): The path to the connectivity status CSV file
-        path_orders (str): The path to the orders CSV file
+        df_polling (pd.DataFrame): The polling events.
+        df_conn_status (pd.DataFrame): The connectivity status records.
+        df_orders (pd.DataFrame): The orders.
+
+    Returns:
+        tuple: A tuple of the 3 converted DataFrames, in the same order.
+    """
+    frames = [df_polling, df_conn_status, df_orders]
+    device_ids = pd.concat([df["device_id"] for df in frames]).dropna().unique()
+    device_dtype = pd.CategoricalDtype(categories=pd.Index(device_ids).sort_values())
+
+    def to_nanoseconds(times: pd.Series) -> np.ndarray:
+        times = parse_timestamps(times)
+        return times.to_numpy(dtype="datetime64[ns]").view("int64")
+
+    df_polling = df_polling.assign(
+        device_id=df_polling["device_id"].astype(device_dtype),
+        creation_time=to_nanoseconds(df_polling["creation_time"]),
+        status_code=df_polling["status_code"].astype("category"),
+        error_code=df_polling["error_code"].astype("category"),
+    )
+    df_conn_status = df_conn_status.assign(
+        device_id=df_conn_status["device_id"].astype(device_dtype),
+        creation_time=to_nanoseconds(df_conn_status["creation_time"]),
+        status=df_conn_status["status"].astype("category"),
+    )
+    df_orders = df_orders.assign(
+        device_id=df_orders["device_id"].astype(device_dtype),
+        order_creation_time=to_nanoseconds(df_orders["order_creation_time"]),
+    )
+
+    return df_polling, df_conn_status, df_orders
+
+
+def extract(
+    path_polling: str,
+    path_conn_status: str,
+    path_orders: str,
+    chunksize: int = None,
+    typed: bool = False,
+    concurrent: bool = False,
+    cache_dir: str = None,
+    cache_max_bytes: int = MAX_CACHE_BYTES,
+) -> tuple:
+    """
+    Reads CSV, Parquet or Arrow IPC files from the specified paths returns them as a tuple with 3 pandas DataFrame.
+    The format of each file is picked by its extension, see `read_table`, and only the
+    columns used by the report are read. When the times are parsed, i.e. with `typed` or `cache_dir`,
+    the columns each DataFrame is already sorted by are checked in linear time and recorded in
+    `df.attrs["sorted_by"]`, see `sortedness`, so the transformation does not sort it again.
+
+    Args:
+        path_polling (str): The path to the polling file
+        path_conn_status (str): The path to the connectivity status file
+        path_orders (str): The path to the orders file
+        chunksize (int, optional): If given, the polling file is not loaded in memory and
+            an iterator over DataFrames of `chunksize` rows is returned instead. Defaults to None.
+        typed (bool, optional): If True, the DataFrames are converted to compact types with
+            `encode_inputs`. Not used with `chunksize`. Defaults to False.
+        concurrent (bool, optional): If True, the 3 files are read at the same time in threads, and
+            the CSV files with the multithreaded Arrow CSV reader when `pyarrow` is installed.
+            Defaults to False.
+        cache_dir (str, optional): If given, the files read in memory are cached in this folder with
+            their time columns parsed, see `read_cached`, and the next extractions of the same files
+            load them from the cache. The polling file is not cached with `chunksize`. Defaults to None,
+            i.e. no cache.
+        cache_max_bytes (int): The maximum total size of the cache folder, see `evict`.
 
     Returns:
         tuple: A tuple of the 3 dataframes containing the following columns:
@@ -36,9 +205,50 @@ def extract(path_polling: str, path_conn_status: str, path_orders: str) -> tuple
         if not os.path.isdir(output_dir):
             raise ValueError(f"The data path '{p}' does not exist")
 
-    # Read the CSV files into a DataFrames
-    df_polling = pd.read_csv(path_polling, header=[0], sep=",")
-    df_conn_status = pd.read_csv(path_conn_status, header=[0], sep=",")
-    df_orders = pd.read_csv(path_orders, header=[0], sep=",")
+    # Read the files into a DataFrames
+    reads = [
+        (path_polling, POLLING_COLUMNS, chunksize),
+        (path_conn_status, CONN_STATUS_COLUMNS, None),
+        (path_orders, ORDERS_COLUMNS, None),
+    ]
+    # The readers release the GIL while parsing, so the files are read in parallel
+    engine = "pyarrow" if concurrent and ARROW_CSV_AVAILABLE else None
+    reader = (engine or "pandas") + ("_typed" if typed else "")
+
+    def read(path: str, columns: list, size: int):
+        if cache_dir and size is None:
+            return read_cached(
+                path,
+                read=lambda path, columns: read_table(path, columns, engine=engine),
+                columns=columns,
+                cache_dir=cache_dir,
+                max_bytes=cache_max_bytes,
+                reader=reader,
+            )
+        return read_table(path, columns=columns, chunksize=size, engine=engine)
+
+    if concurrent:
+        with ThreadPoolExecutor(max_workers=len(reads)) as executor:
+            futures = [executor.submit(read, *r) for r in reads]
+            df_polling, df_conn_status, df_orders = (f.result() for f in futures)
+    else:
+        df_polling, df_conn_status, df_orders = (read(*r) for r in reads)
+
+    if typed and chunksize is None:
+        df_polling, df_conn_status, df_orders = encode_inputs(
+            df_polling, df_conn_status, df_orders
+        )
+
+    # Inputs already in order are not sorted again by the transformation
+    if chunksize is None:
+        for df, path, time_column in [
+            (df_polling, path_polling, "creation_time"),
+            (df_conn_status, path_conn_status, "creation_time"),
+            (df_orders, path_orders, "order_creation_time"),
+        ]:
+            sorted_by = sortedness(df, time_column)
+            if sorted_by:
+                df.attrs[SORTED_BY] = sorted_by
+                logger.info(f"'{path}' is sorted by {', '.join(sorted_by)}")
 
     return df_polling, df_conn_status, df_orders
@@ -0,0 +1,206 @@
+import json
+import logging
+import os
+import pandas as pd
+from src.timestamps import parse_timestamps
+from src.transform import (
+    ERROR_CODES,
+    STATUS_CODES,
+    TIME_PERIODS,
+    polling_event_codes,
+    python_value,
+    sort_report_rows,
+    time_period_bounds,
+    transformation,
+)
+
+
+logger = logging.getLogger(__name__)
+
+REPORT_TIME_COLUMNS = [
+    "order_creation_time",
+    "preceding_event",
+    "following_event",
+    "status_time",
+]
+MAX_OPEN_MINUTES = 24 * 60
+
+
+def read_state(path_state: str) -> dict:
+    """
+    Reads the state of the last incremental run.
+
+    Args:
+        path_state (str): The path to the JSON state file.
+
+    Returns:
+        dict: The state, with the following keys, or an empty dict if there was no previous run:
+            - last_order_time: The creation time of the newest processed order, in ISO format
+            - open_order_ids: The IDs of the orders whose report rows can still change
+            - time_period: The time periods of the report
+            - status_codes: The status codes counted in the report, see `polling_event_codes`
+            - error_codes: The error codes counted in the report
+    """
+    if not os.path.exists(path_state):
+        return {}
+
+    with open(path_state) as f:
+        return json.load(f)
+
+
+def write_state(path_state: str, state: dict) -> None:
+    """
+    Writes the state of an incremental run, replacing the previous state file at once.
+
+    Args:
+        path_state (str): The path to the JSON state file.
+        state (dict): The state returned by `transformation_incremental`.
+
+    Returns:
+        None
+    """
+    path_tmp = f"{path_state}.tmp"
+    with open(path_tmp, "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(path_tmp, path_state)
+
+
+def transformation_incremental(
+    df_polling: pd.DataFrame,
+    df_connectivity_status: pd.DataFrame,
+    df_orders: pd.DataFrame,
+    df_report: pd.DataFrame = None,
+    state: dict = None,
+    time_period: list = TIME_PERIODS,
+    status_codes: list = STATUS_CODES,
+    error_codes: list = ERROR_CODES,
+    max_open_minutes: int = MAX_OPEN_MINUTES,
+) -> tuple:
+    """
+    Updates a persisted report with the rows of the new orders and of the orders that were still open.
+
+    An order is open while its longest time period after the order creation time is not fully covered
+    by the polling events, or while it has no following polling event and is not older than
+    `max_open_minutes`, so the order of a device that never polls again is closed with a null following
+    event. The report rows of the other orders are final and are not computed again. Only the polling events of the devices of the selected orders
+    are transformed, and of their events older than every window only the last one is kept, as it can
+    still be a preceding event.
+
+    Args:
+        df_polling (pd.DataFrame): Input DataFrame containing polling events.
+        df_connectivity_status (pd.DataFrame): Input DataFrame containing internet connectivity status logs.
+        df_orders (pd.DataFrame): Input DataFrame containing data for orders.
+        df_report (pd.DataFrame, optional): The persisted report of the previous runs. Defaults to None.
+        state (dict, optional): The state of the previous run, see `read_state`. Defaults to None,
+            i.e. all the orders are processed.
+        time_period (list): Time periods in minutes, see `transformation`. If they differ from the
+            time periods of the previous run, the whole report is computed again.
+        status_codes (list): Declared status codes, see `transformation`. The codes counted in the
+            persisted report are counted too, so the rows computed again have all its count columns.
+        error_codes (list): Declared error codes, see `transformation`.
+        max_open_minutes (int): How long after its creation time, by the newest polling event, an order
+            without a following polling event stays open. Defaults to one day.
+
+    Returns:
+        tuple: A tuple with the updated report and the new state.
+    """
+    state = state or {}
+    if state.get("time_period") != list(time_period):
+        state, df_report = {}, None
+
+    # Select the new orders and the orders that were still open
+    df_orders = df_orders.assign(
+        order_creation_time=parse_timestamps(df_orders["order_creation_time"])
+    )
+    is_selected = df_orders["order_id"].isin(state.get("open_order_ids", []))
+    if state.get("last_order_time"):
+        is_selected |= df_orders["order_creation_time"] >= pd.Timestamp(
+            state["last_order_time"]
+        )
+    else:
+        is_selected[:] = True
+    df_selected = df_orders[is_selected & df_orders["device_id"].notna()]
+    logger.info(f"Incremental run: {len(df_selected)} new or open orders")
+    if df_selected.empty:
+        return df_report, state
+
+    # The newest event of all the devices, so the orders of silent devices are closed too
+    df_polling = df_polling.assign(
+        creation_time=parse_timestamps(df_polling["creation_time"])
+    )
+    watermark = df_polling["creation_time"].max()
+
+    # Keep the events of the selected devices: the ones inside the windows, plus the last older one
+    devices = df_selected["device_id"].unique()
+    df_polling = df_polling[df_polling["device_id"].isin(devices)]
+    max_before, max_after = time_period_bounds(time_period)
+    cutoff = df_selected["order_creation_time"].min() - max_before
+    is_old = df_polling["creation_time"] < cutoff
+    last_old = (
+        df_polling[is_old].groupby("device_id", observed=True)["creation_time"].idxmax()
+    )
+    df_polling = df_polling[~is_old | df_polling.index.isin(last_old)]
+    df_connectivity_status = df_connectivity_status[
+        df_connectivity_status["device_id"].isin(devices)
+    ]
+
+    # The codes of the persisted report come first, so its count columns keep their order
+    codes = []
+    for persisted, declared in [
+        (state.get("status_codes", []), status_codes),
+        (state.get("error_codes", []), error_codes),
+    ]:
+        codes.append(persisted + [code for code in declared if code not in persisted])
+    status_codes, error_codes = polling_event_codes(df_polling, *codes)
+
+    df_new = transformation(
+        df_polling=df_polling,
+        df_connectivity_status=df_connectivity_status,
+        df_orders=df_selected,
+        time_period=time_period,
+        status_codes=status_codes,
+        error_codes=error_codes,
+    )
+
+    # Upsert the new rows into the persisted report
+    if df_report is not None and not df_report.empty:
+        df_report = df_report.assign(
+            **{
+                column: parse_timestamps(df_report[column])
+                for column in REPORT_TIME_COLUMNS
+            }
+        )
+        df_report = df_report[~df_report["order_id"].isin(df_new["order_id"])]
+        df_new = pd.concat([df_report, df_new], ignore_index=True)[
+            list(df_new.columns)
+            + [c for c in df_report.columns if c not in df_new.columns]
+        ]
+        counts = [c for c in df_new.columns if c.startswith("count_")]
+        df_new[counts] = df_new[counts].fillna(0).astype("int64")
+    df_new = sort_report_rows(df_new, df_orders)
+
+    # Orders stay open until their windows are covered by the polling events and they have a following event,
+    # or until they are older than the maximum open time
+    max_open = max(max_after, pd.Timedelta(minutes=max_open_minutes))
+    is_open = (
+        (
+            df_new["following_event"].isna()
+            & (df_new["order_creation_time"] + max_open >= watermark)
+        )
+        | (df_new["order_creation_time"] + max_after >= watermark)
+        | pd.isna(watermark)
+    )
+    last_order_time = df_orders["order_creation_time"].max()
+    new_state = {
+        "last_order_time": (
+            last_order_time.isoformat()
+            if pd.notna(last_order_time)
+            else state.get("last_order_time")
+        ),
+        "open_order_ids": df_new.loc[is_open, "order_id"].tolist(),
+        "time_period": list(time_period),
+        "status_codes": [python_value(code) for code in status_codes],
+        "error_codes": [python_value(code) for code in error_codes],
+    }
+
+    return df_new, new_state
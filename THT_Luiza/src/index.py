@@ -0,0 +1,226 @@
+import json
+import logging
+import os
+import numpy as np
+import pandas as pd
+from src.timestamps import parse_timestamps
+from src.transform import (
+    ERROR_CODES,
+    STATUS_CODES,
+    TIME_PERIODS,
+    _count_names,
+    cumulative_polling_counts,
+    device_index,
+    index_events_by_device,
+    polling_event_codes,
+    python_value,
+    time_period_suffix,
+)
+
+
+logger = logging.getLogger(__name__)
+
+# Arrays of the index, each stored in `<name>.npy` and memory-mapped by `load_event_index`
+INDEX_ARRAYS = [
+    "polling_time",
+    "polling_offsets",
+    "polling_counts",
+    "conn_status_time",
+    "conn_status_offsets",
+    "conn_status_status",
+]
+INDEX_METADATA = "index.json"
+
+
+def build_event_index(
+    df_polling: pd.DataFrame,
+    df_connectivity_status: pd.DataFrame,
+    index_dir: str,
+    status_codes: list = STATUS_CODES,
+    error_codes: list = ERROR_CODES,
+) -> str:
+    """
+    Writes the polling events and the connectivity status records to a folder of arrays sorted by
+    device and time, so that the report of a single order can be computed with `lookup_order`
+    by reading only the events of its device.
+
+    The polling events are stored as their times and the running counts of each type of polling
+    event (see `cumulative_polling_counts`), so the counts of any time period are the difference of
+    two rows. The events of `devices[i]` are the rows `offsets[i]:offsets[i + 1]` of each array.
+
+    Args:
+        df_polling (pd.DataFrame): Input DataFrame containing polling events.
+        df_connectivity_status (pd.DataFrame): Input DataFrame containing internet connectivity status logs.
+        index_dir (str): The folder to write the index to. It is created if it does not exist, and the
+            files of a previous index are replaced.
+        status_codes (list): Declared status codes, see `transformation`.
+        error_codes (list): Declared error codes, see `transformation`.
+
+    Returns:
+        str: The path to the index folder.
+    """
+    df_polling = df_polling.assign(
+        creation_time=parse_timestamps(df_polling["creation_time"])
+    )
+    df_connectivity_status = df_connectivity_status.assign(
+        creation_time=parse_timestamps(df_connectivity_status["creation_time"])
+    )
+
+    devices = device_index(df_polling["device_id"], df_connectivity_status["device_id"])
+    events_sorted, devices, offsets = index_events_by_device(
+        df_polling, devices=devices
+    )
+    conn_status_sorted, _, conn_status_offsets = index_events_by_device(
+        df_connectivity_status, devices=devices
+    )
+
+    status_codes, error_codes = polling_event_codes(
+        events_sorted, status_codes=status_codes, error_codes=error_codes
+    )
+    cumulative = cumulative_polling_counts(events_sorted, status_codes, error_codes)
+    statuses = pd.Categorical(conn_status_sorted["status"])
+
+    arrays = {
+        "polling_time": events_sorted["creation_time"]
+        .to_numpy(dtype="datetime64[ns]")
+        .view("int64"),
+        "polling_offsets": offsets,
+        # One row per position, so the counts of all the types at a bound are read at once
+        "polling_counts": np.column_stack(list(cumulative.values())),
+        "conn_status_time": conn_status_sorted["creation_time"]
+        .to_numpy(dtype="datetime64[ns]")
+        .view("int64"),
+        "conn_status_offsets": conn_status_offsets,
+        "conn_status_status": statuses.codes,
+    }
+    metadata = {
+        "devices": [python_value(device) for device in devices],
+        "status_codes": [python_value(code) for code in status_codes],
+        "error_codes": [python_value(code) for code in error_codes],
+        "statuses": [python_value(status) for status in statuses.categories],
+    }
+
+    os.makedirs(index_dir, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(os.path.join(index_dir, f"{name}.npy"), np.ascontiguousarray(array))
+    with open(os.path.join(index_dir, INDEX_METADATA), "w") as f:
+        json.dump(metadata, f)
+
+    logger.info(
+        f"Indexed {len(events_sorted)} polling events and {len(conn_status_sorted)} "
+        f"connectivity status records of {len(devices)} devices in '{index_dir}'"
+    )
+    return index_dir
+
+
+def load_event_index(index_dir: str) -> dict:
+    """
+    Opens an index written by `build_event_index`. The arrays are memory-mapped, so only the
+    pages of the devices that are looked up are read from the disk.
+
+    Args:
+        index_dir (str): The path to the index folder.
+
+    Returns:
+        dict: The index, with the memory-mapped arrays of `INDEX_ARRAYS`, the codes and statuses
+        of the index metadata, `device_codes`, the position of each device ID, and `count_names`,
+        the count columns of one time period.
+
+    Raises:
+        ValueError: If the folder does not contain an index.
+    """
+    path_metadata = os.path.join(index_dir, INDEX_METADATA)
+    if not os.path.exists(path_metadata):
+        raise ValueError(f"The index path '{index_dir}' does not exist")
+
+    with open(path_metadata) as f:
+        index = json.load(f)
+    for name in INDEX_ARRAYS:
+        # Plain arrays over the memory map, which are faster to slice than np.memmap objects
+        index[name] = np.asarray(
+            np.load(os.path.join(index_dir, f"{name}.npy"), mmap_mode="r")
+        )
+    index["device_codes"] = {device: i for i, device in enumerate(index["devices"])}
+    index["count_names"] = _count_names(index["status_codes"], index["error_codes"])
+
+    return index
+
+
+def lookup_order(
+    index: dict,
+    order_id,
+    device_id,
+    order_creation_time,
+    time_period: list = TIME_PERIODS,
+) -> dict:
+    """
+    Computes the report row of a single order from an index opened with `load_event_index`.
+
+    The row has the same values as the row of the order in the report of `transformation` over
+    the indexed events. Only the events of the device of the order are searched.
+
+    Args:
+        index (dict): The index returned by `load_event_index`.
+        order_id: The ID of the order.
+        device_id: The ID of the device the order was dispatched to.
+        order_creation_time: The creation time of the order, as a string or a timestamp.
+        time_period (list): Time periods in minutes to count the polling events in, negative before and
+            positive after the order creation time.
+
+    Returns:
+        dict: The report row, mapping each column of the report to its value. Missing events and
+        statuses are NaT and NaN.
+    """
+    order_time = pd.Timestamp(order_creation_time)
+    code = index["device_codes"].get(device_id)
+    names = index["count_names"]
+
+    row = {
+        "order_id": order_id,
+        "device_id": device_id,
+        "order_creation_time": order_time,
+        "preceding_event": pd.NaT,
+        "following_event": pd.NaT,
+        "previous_status": np.nan,
+        "status_time": pd.NaT,
+    }
+    if code is None or pd.isna(order_time):
+        row.update(
+            {name + time_period_suffix(t): 0 for t in time_period for name in names}
+        )
+        return row
+
+    # Polling events of the device, as in `find_near_events_and_status`
+    start, end = index["polling_offsets"][code], index["polling_offsets"][code + 1]
+    times = index["polling_time"][start:end]
+    left = times.searchsorted(order_time.value, side="left")
+    right = times.searchsorted(order_time.value, side="right")
+    if right > 0:
+        row["preceding_event"] = pd.Timestamp(times[right - 1])
+    if left < len(times):
+        row["following_event"] = pd.Timestamp(times[left])
+
+    # Counts of each time period, as in `count_polling_events_in_windows`: windows before the order
+    # are [order + t, order] and windows after it are [order, order + t]
+    # The time periods can be fractional minutes, e.g. -1.5
+    bounds = order_time.value + pd.to_timedelta(time_period, unit="min").asi8
+    before = np.array(time_period) <= 0
+    lower = np.where(before, times.searchsorted(bounds, side="left"), left)
+    upper = np.where(before, right, times.searchsorted(bounds, side="right"))
+    counts = index["polling_counts"]
+    windows = (counts[start + upper] - counts[start + lower]).tolist()
+    for t, window in zip(time_period, windows):
+        suffix = time_period_suffix(t)
+        row.update({name + suffix: n for name, n in zip(names, window)})
+
+    # Connectivity status of the device
+    start = index["conn_status_offsets"][code]
+    end = index["conn_status_offsets"][code + 1]
+    times = index["conn_status_time"][start:end]
+    right = times.searchsorted(order_time.value, side="right")
+    if right > 0:
+        status = index["conn_status_status"][start + right - 1]
+        row["previous_status"] = index["statuses"][status] if status >= 0 else np.nan
+        row["status_time"] = pd.Timestamp(times[right - 1])
+
+    return row
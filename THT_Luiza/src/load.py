@@ -1,17 +1,175 @@
 import pandas as pd
+import numpy as np
+import contextlib
+import gzip
 import os
+import queue
+import threading
 
+# Rows formatted at a time by the CSV writer
+CHUNKSIZE = 100_000
+# Formatted chunks waiting for the compression thread
+QUEUE_SIZE = 4
+# Compression of the files ending with these extensions
+COMPRESSION_EXTENSIONS = {".gz": "gzip", ".zst": "zstd"}
+GZIP_LEVEL = 6
 
-def load(df: pd.DataFrame, path_to_write: str = None) -> tuple:
+_NS_PER = {"D": 86_400 * 10**9, "s": 10**9, "ms": 10**6, "us": 10**3}
+
+
+def _datetime_unit(values: np.ndarray) -> str:
+    """
+    Finds the resolution `pd.DataFrame.to_csv` formats a whole datetime64[ns] column with: dates only
+    if all the times are midnight, else seconds, milliseconds, microseconds or nanoseconds, as
+    needed by the most precise value.
+    """
+    ns = values.view("int64")[~np.isnat(values)]
+    for unit, step in _NS_PER.items():
+        if not (ns % step).any():
+            return unit
+    return "ns"
+
+
+def _format_datetimes(values: np.ndarray, unit: str) -> np.ndarray:
+    """Formats datetime64[ns] values as `pd.DataFrame.to_csv` does with the given resolution."""
+    text = np.datetime_as_string(values, unit=unit)
+    if unit != "D":
+        # Replace the ISO "T" separator by a space, in place in the fixed-width strings
+        chars = text.view(np.uint32).reshape(len(text), -1)
+        chars[:, 10] = ord(" ")
+    text = text.astype(object)
+    text[np.isnat(values)] = None
+    return text
+
+
+def _open_compressed(f, compression: str, path: str):
+    """Wraps a binary file with a gzip or zstd compressor, or returns it as it is."""
+    if compression is None:
+        return contextlib.nullcontext(f)
+    if compression == "gzip":
+        # The name stored in the gzip header is the final file name, not the temporary one
+        return gzip.GzipFile(
+            filename=os.path.basename(path),
+            mode="wb",
+            fileobj=f,
+            compresslevel=GZIP_LEVEL,
+        )
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError as e:
+            raise ImportError("Writing zstd files needs the `zstandard` package") from e
+        return zstandard.ZstdCompressor().stream_writer(f, closefd=False)
+    raise ValueError(f"Unknown compression '{compression}'")
+
+
+def write_csv(
+    df: pd.DataFrame,
+    path_to_write: str,
+    chunksize: int = CHUNKSIZE,
+    compression: str = None,
+) -> str:
+    """
+    Writes a DataFrame to a CSV file, `chunksize` rows at a time, with the same content as `df.to_csv(index=False)`.
+
+    The chunks are formatted in the calling thread and compressed and written in a background thread,
+    so both overlap. The file is written to a temporary file next to `path_to_write`, which is renamed
+    to `path_to_write` only when it is complete, so a killed run never leaves a partial file.
+
+    Args:
+        df (pd.DataFrame): The DataFrame to write.
+        path_to_write (str): The path to the file to write.
+        chunksize (int): The number of rows formatted at a time.
+        compression (str, optional): "gzip", "zstd" (needs the `zstandard` package) or None. Defaults to None.
+
+    Returns:
+        str: The path to the written file.
+    """
+    # The time columns are formatted with the resolution of the whole column, not of each chunk
+    units = {
+        column: _datetime_unit(df[column].to_numpy())
+        for column in df.columns
+        if df[column].dtype == "datetime64[ns]"
+    }
+
+    path_tmp = f"{path_to_write}.{os.getpid()}.tmp"
+    chunks = queue.Queue(maxsize=QUEUE_SIZE)
+    errors = []
+
+    def write_chunks():
+        try:
+            with open(path_tmp, "wb") as f:
+                with _open_compressed(f, compression, path_to_write) as out:
+                    while (data := chunks.get()) is not None:
+                        out.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+        except BaseException as e:
+            errors.append(e)
+            # Keep consuming the chunks so that the formatting thread is never blocked
+            while chunks.get() is not None:
+                pass
+
+    writer = threading.Thread(target=write_chunks, name="csv-writer", daemon=True)
+    writer.start()
+    try:
+        for start in range(0, max(len(df), 1), chunksize):
+            if errors:
+                break
+            end = start + chunksize
+            chunk = df.iloc[start:end]
+            chunk = chunk.assign(
+                **{
+                    column: _format_datetimes(chunk[column].to_numpy(), unit)
+                    for column, unit in units.items()
+                }
+            )
+            chunks.put(chunk.to_csv(index=False, header=start == 0).encode())
+    except BaseException:
+        chunks.put(None)
+        writer.join()
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(path_tmp)
+        raise
+    chunks.put(None)
+    writer.join()
+
+    if errors:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(path_tmp)
+        raise errors[0]
+    os.replace(path_tmp, path_to_write)
+
+    return path_to_write
+
+
+def load(
+    df: pd.DataFrame,
+    path_to_write: str = None,
+    chunksize: int = CHUNKSIZE,
+    compression: str = "infer",
+) -> tuple:
     """
     Write a Pandas DataFrame to a CSV file at the specified path.
 
+    The CSV file is written in chunks with `write_csv`, compressed if the path ends with .gz or .zst,
+    and only appears at `path_to_write` once it is complete.
+
+    If the path ends with .parquet or .pq, the DataFrame is written as Parquet instead, with a
+    dictionary-encoded device_id column. Writing Parquet needs `pyarrow`.
+
     If no path is provided, a filename will be generated based on the current timestamp and
     the output file will be written to the 'data/output' folder.
 
+    Dictionary-encoded columns, such as the device_id of `extract(typed=True)`, are decoded
+    here and written with their original values.
+
     Args:
         df (pd.DataFrame): The DataFrame to write to a file.
         path_to_write (str, optional): The path to the file to write. Defaults to None.
+        chunksize (int): The number of rows of the CSV file formatted at a time.
+        compression (str): "gzip", "zstd", None, or "infer" to pick it from the extension of the path.
+            Defaults to "infer".
 
     Returns:
         bool: True if the DataFrame was successfully written to the file.
@@ -41,6 +199,21 @@ def load(df: pd.DataFrame, path_to_write: str = None) -> tuple:
     if not (os.path.isdir("/".join(output_dir.split("/")[:-1]))):
         raise ValueError(f"The data path '{path_to_write}' does not exist")
 
-    df.to_csv(path_to_write, index=False)
+    extension = os.path.splitext(path_to_write)[1].lower()
+    if extension in (".parquet", ".pq"):
+        if "device_id" in df.columns:
+            df = df.assign(device_id=df["device_id"].astype("category"))
+        path_tmp = f"{path_to_write}.{os.getpid()}.tmp"
+        try:
+            df.to_parquet(path_tmp, index=False)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path_tmp)
+            raise
+        os.replace(path_tmp, path_to_write)
+    else:
+        if compression == "infer":
+            compression = COMPRESSION_EXTENSIONS.get(extension)
+        write_csv(df, path_to_write, chunksize=chunksize, compression=compression)
 
     return True, path_to_write
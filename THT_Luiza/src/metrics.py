@@ -0,0 +1,112 @@
+import contextlib
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+
+
+# Records of the stages run since `collect_metrics` was entered, None when the metrics are disabled
+_records = None
+# Names of the stages being run, to prefix the names of their sub-steps
+_stages = []
+# Traced memory at the start of each stage being run, and its highest traced memory so far
+_memory = []
+
+
+def peak_rss() -> int:
+    """Returns the peak resident set size of the current process so far, in bytes."""
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+@contextlib.contextmanager
+def collect_metrics():
+    """
+    Enables the metrics of the stages run inside the `with` block. The memory allocations are traced
+    with `tracemalloc` inside the block, which slows the stages down.
+
+    Yields:
+        list: The records of the stages, appended as they finish, see `stage`.
+    """
+    global _records
+    previous, _records = _records, []
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    try:
+        yield _records
+    finally:
+        _records = previous
+        if not tracing:
+            tracemalloc.stop()
+
+
+def _update_peaks() -> int:
+    """Adds the traced peak since the last reset to the stages being run, resets it and returns the traced memory."""
+    current, peak = tracemalloc.get_traced_memory()
+    for memory in _memory:
+        memory[1] = max(memory[1], peak)
+    tracemalloc.reset_peak()
+    return current
+
+
+@contextlib.contextmanager
+def stage(name: str, rows_in: int = None):
+    """
+    Measures a stage of the pipeline when the metrics are enabled with `collect_metrics`.
+    Otherwise the block is only run.
+
+    The record of the stage has its name, prefixed with the names of the enclosing stages,
+    e.g. `transform.merge`, its wall and CPU time in seconds, its number of input and output rows,
+    and its peak memory: the highest memory traced by `tracemalloc` while it runs, above the memory
+    traced at its start. The peak resident set size of the process is only written once for the run,
+    see `write_metrics`.
+
+    Args:
+        name (str): The name of the stage.
+        rows_in (int, optional): The number of rows the stage reads.
+
+    Yields:
+        dict: The record of the stage. The block can set its `rows_out`.
+    """
+    record = {}
+    if _records is None:
+        yield record
+        return
+
+    _stages.append(name)
+    record.update({"stage": ".".join(_stages), "rows_in": rows_in, "rows_out": None})
+    start = _update_peaks()
+    _memory.append([start, start])
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        yield record
+    finally:
+        _stages.pop()
+        _update_peaks()
+        start, peak = _memory.pop()
+    record["seconds"] = time.perf_counter() - wall
+    record["cpu_seconds"] = time.process_time() - cpu
+    record["peak_memory_bytes"] = peak - start
+    _records.append(record)
+
+
+def write_metrics(path: str, records: list) -> str:
+    """
+    Writes the records of `collect_metrics` to a JSON file, with the peak resident set size of the process.
+
+    Args:
+        path (str): The path to the JSON file.
+        records (list): The records of the stages.
+
+    Returns:
+        str: The path to the JSON file.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({"stages": records, "peak_rss_bytes": peak_rss()}, f, indent=2)
+
+    return path
@@ -0,0 +1,135 @@
+import multiprocessing
+import os
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from src.transform import (
+    ERROR_CODES,
+    STATUS_CODES,
+    TIME_PERIODS,
+    indexed_events,
+    polling_event_codes,
+    sort_report_rows,
+    transformation,
+)
+
+
+# Inputs inherited by the forked worker processes, so the shards are not pickled
+_FORKED_INPUTS = None
+
+
+def shard_by_device(df: pd.DataFrame, n_shards: int) -> list:
+    """
+    Hash-partitions the rows of a DataFrame by device ID.
+
+    The hash does not depend on the process, so a device is always in the same shard
+    across the polling events, connectivity status and orders.
+
+    Args:
+        df (pd.DataFrame): A DataFrame with a device_id column.
+        n_shards (int): The number of shards.
+
+    Returns:
+        list: The row positions of each shard, in their input order.
+    """
+    shard_ids = (
+        pd.util.hash_pandas_object(df["device_id"], index=False).to_numpy() % n_shards
+    )
+    return [(shard_ids == shard).nonzero()[0] for shard in range(n_shards)]
+
+
+def _transform_forked_shard(shard: int) -> pd.DataFrame:
+    """Runs `transformation` on a shard of the inputs inherited from the parent process."""
+    frames, shard_positions, kwargs = _FORKED_INPUTS
+    df_polling, df_conn_status, df_orders = [
+        df.iloc[positions[shard]] for df, positions in zip(frames, shard_positions)
+    ]
+    return transformation(
+        df_polling=df_polling,
+        df_connectivity_status=df_conn_status,
+        df_orders=df_orders,
+        **kwargs,
+    )
+
+
+def transformation_parallel(
+    df_polling: pd.DataFrame,
+    df_connectivity_status: pd.DataFrame,
+    df_orders: pd.DataFrame,
+    time_period: list = TIME_PERIODS,
+    status_codes: list = STATUS_CODES,
+    error_codes: list = ERROR_CODES,
+    workers: int = None,
+    connectivity_windows: bool = False,
+) -> pd.DataFrame:
+    """
+    Builds the same report as `transformation`, running it on device shards in a pool of processes.
+
+    Every step of the report is computed per device, so the inputs are hash-partitioned by device ID
+    and each shard is transformed independently. Where processes can be forked, the workers inherit
+    the inputs and only receive the number of their shard.
+
+    Args:
+        df_polling (pd.DataFrame): Input DataFrame containing polling events.
+        df_connectivity_status (pd.DataFrame): Input DataFrame containing internet connectivity status logs.
+        df_orders (pd.DataFrame): Input DataFrame containing data for orders.
+        time_period (list): Time periods in minutes, see `transformation`.
+        status_codes (list): Declared status codes, see `transformation`.
+        error_codes (list): Declared error codes, see `transformation`.
+        workers (int, optional): The number of worker processes. Defaults to the number of CPUs.
+        connectivity_windows (bool): If True, adds the connectivity window columns, see `transformation`.
+
+    Returns:
+        pd.DataFrame: The report, with the rows and columns in the same order as `transformation`.
+    """
+    global _FORKED_INPUTS
+
+    workers = workers or os.cpu_count()
+
+    # Every shard counts the codes found in all the polling events the transformation indexes,
+    # so they have the same columns
+    status_codes, error_codes = polling_event_codes(
+        df_polling.loc[indexed_events(df_polling), ["status_code", "error_code"]],
+        status_codes=status_codes,
+        error_codes=error_codes,
+    )
+    kwargs = dict(
+        time_period=time_period,
+        status_codes=status_codes,
+        error_codes=error_codes,
+        connectivity_windows=connectivity_windows,
+    )
+    if workers == 1:
+        return transformation(df_polling, df_connectivity_status, df_orders, **kwargs)
+
+    frames = (df_polling, df_connectivity_status, df_orders)
+    shard_positions = [shard_by_device(df, workers) for df in frames]
+    shards = [shard for shard in range(workers) if len(shard_positions[2][shard])]
+
+    if "fork" in multiprocessing.get_all_start_methods():
+        _FORKED_INPUTS = (frames, shard_positions, kwargs)
+        try:
+            with ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("fork")
+            ) as executor:
+                reports = list(executor.map(_transform_forked_shard, shards))
+        finally:
+            _FORKED_INPUTS = None
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(
+                    transformation,
+                    *[
+                        df.iloc[positions[shard]]
+                        for df, positions in zip(frames, shard_positions)
+                    ],
+                    **kwargs,
+                )
+                for shard in shards
+            ]
+            reports = [future.result() for future in futures]
+
+    if not reports:
+        return transformation(df_polling, df_connectivity_status, df_orders, **kwargs)
+
+    return sort_report_rows(pd.concat(reports, ignore_index=True), df_orders)
@@ -0,0 +1,424 @@
+import bisect
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from src.cache import cache_key, load_cached, read_cached, store_cached
+from src.extract import (
+    ARROW_CSV_AVAILABLE,
+    CONN_STATUS_COLUMNS,
+    ORDERS_COLUMNS,
+    POLLING_COLUMNS,
+    read_table,
+)
+from src.timestamps import TIMESTAMP_FORMATS, parse_timestamps
+from src.transform import (
+    ERROR_CODES,
+    STATUS_CODES,
+    TIME_PERIODS,
+    sort_report_rows,
+    time_period_bounds,
+    transformation,
+)
+
+
+logger = logging.getLogger(__name__)
+
+# Partition folders are named after their date, e.g. polling/date=2020-02-26/part-0.csv
+PARTITION_PREFIX = "date="
+DAY = pd.Timedelta(days=1)
+# Changed when the content of the cached edges changes, to ignore the older caches
+EDGES_VERSION = 1
+
+
+def list_partitions(path: str) -> dict:
+    """
+    Lists the date partitions of an input folder: its subfolders `date=YYYY-MM-DD`, with the files
+    of each partition. Hidden files and files starting with "_", e.g. `_SUCCESS` markers, are skipped.
+
+    Args:
+        path (str): The input folder.
+
+    Returns:
+        dict: The sorted paths of the files of each partition, by date as a pd.Timestamp, in date order.
+
+    Raises:
+        ValueError: If the folder does not exist.
+    """
+    if not os.path.isdir(path):
+        raise ValueError(f"The data path '{path}' does not exist")
+
+    partitions = {}
+    for entry in os.scandir(path):
+        if entry.is_dir() and entry.name.startswith(PARTITION_PREFIX):
+            date = pd.Timestamp(entry.name.removeprefix(PARTITION_PREFIX))
+            partitions[date] = sorted(
+                f.path
+                for f in os.scandir(entry.path)
+                if f.is_file() and not f.name.startswith((".", "_"))
+            )
+    return dict(sorted(partitions.items()))
+
+
+def read_files(paths: list, columns: list, cache_dir: str = None) -> pd.DataFrame:
+    """
+    Reads the files of partitions into one DataFrame, with their time columns parsed. The CSV files are
+    read with the multithreaded Arrow CSV reader when `pyarrow` is installed.
+
+    Args:
+        paths (list): The paths to the CSV, Parquet or Arrow IPC files, see `read_table`.
+        columns (list): The columns to read.
+        cache_dir (str, optional): If given, the files are read through the cache of `read_cached`.
+
+    Returns:
+        pd.DataFrame: The rows of the files, in the order of `paths`.
+    """
+    engine = "pyarrow" if ARROW_CSV_AVAILABLE else None
+
+    def read(path: str, columns: list) -> pd.DataFrame:
+        return read_table(path, columns, engine=engine)
+
+    frames = [] if paths else [pd.DataFrame(columns=columns)]
+    for path in paths:
+        if cache_dir:
+            frames.append(
+                read_cached(
+                    path, read, columns, cache_dir=cache_dir, reader=engine or "pandas"
+                )
+            )
+        else:
+            frames.append(read(path, columns))
+    df = pd.concat(frames, ignore_index=True)
+    return df.assign(
+        **{
+            column: parse_timestamps(df[column])
+            for column in df.columns
+            if column in TIMESTAMP_FORMATS
+        }
+    )
+
+
+def write_partitions(
+    df: pd.DataFrame, path: str, time_column: str, file_name: str = "part-0.csv"
+) -> list:
+    """
+    Splits the records of an input by the date of their time column into date partitions, e.g. to
+    partition a single `polling.csv` for `transformation_partitioned`. Records without a time are not written.
+
+    Args:
+        df (pd.DataFrame): The records.
+        path (str): The folder of the partitions, created if needed.
+        time_column (str): The time column the records are partitioned by.
+        file_name (str): The name of the file written in each partition. Defaults to "part-0.csv".
+
+    Returns:
+        list: The paths of the written files, in date order.
+    """
+    times = parse_timestamps(df[time_column])
+    paths = []
+    for date, df_date in df.groupby(times.dt.normalize(), sort=True):
+        folder = os.path.join(path, f"{PARTITION_PREFIX}{date.date()}")
+        os.makedirs(folder, exist_ok=True)
+        paths.append(os.path.join(folder, file_name))
+        df_date.to_csv(paths[-1], index=False)
+    return paths
+
+
+def _last_status(df_conn_status: pd.DataFrame) -> pd.DataFrame:
+    """Keeps the last connectivity status record of each device, as the backward lookups find it."""
+    return (
+        df_conn_status.dropna(subset=["device_id", "creation_time"])
+        .sort_values("creation_time", kind="stable")
+        .groupby("device_id", sort=False)
+        .tail(1)
+    )
+
+
+def partition_edges(
+    polling_files: list, conn_status_files: list, cache_dir: str = None
+) -> dict:
+    """
+    Summarizes the polling events and connectivity status records of a date partition: what the
+    partitions of the other days need to know about it to build their reports.
+
+    Args:
+        polling_files (list): The polling files of the partition.
+        conn_status_files (list): The connectivity status files of the partition.
+        cache_dir (str, optional): If given, the edges are cached in this folder under the content hashes
+            of the files, so the next runs only read the files of the partitions that changed.
+
+    Returns:
+        dict: A dictionary with the following entries:
+            - first_event: The time of the first polling event of each device, as a Series by device ID.
+            - last_event: The time of the last polling event of each device.
+            - last_status: The last connectivity status record of each device, see `_last_status`.
+            - status_codes: The status codes found in the polling events.
+            - error_codes: The error codes found in the polling events.
+    """
+    name = None
+    if cache_dir:
+        keys = [EDGES_VERSION]
+        keys += [cache_key(path, POLLING_COLUMNS, cache_dir) for path in polling_files]
+        keys += [
+            cache_key(path, CONN_STATUS_COLUMNS, cache_dir)
+            for path in conn_status_files
+        ]
+        digest = hashlib.blake2b(json.dumps(keys).encode(), digest_size=20)
+        name = f"edges_{digest.hexdigest()}"
+        edges = load_cached(name, cache_dir)
+        if edges is not None:
+            return edges
+
+    df_polling = read_files(polling_files, POLLING_COLUMNS, cache_dir)
+    df_conn_status = read_files(conn_status_files, CONN_STATUS_COLUMNS, cache_dir)
+    event_times = df_polling.groupby("device_id")["creation_time"]
+    edges = {
+        "first_event": event_times.min().dropna(),
+        "last_event": event_times.max().dropna(),
+        "last_status": _last_status(df_conn_status),
+        "status_codes": sorted(pd.unique(df_polling["status_code"].dropna())),
+        "error_codes": sorted(pd.unique(df_polling["error_code"].dropna())),
+    }
+    if name:
+        store_cached(name, edges, cache_dir)
+    return edges
+
+
+def _transform_day(
+    date: pd.Timestamp,
+    polling_files: list,
+    conn_status_files: list,
+    orders_files: list,
+    halo: tuple,
+    carry: dict,
+    cache_dir: str = None,
+    **kwargs,
+) -> tuple:
+    """
+    Builds the report of the orders of one date partition.
+
+    The polling events and connectivity status records are read from the partitions that overlap the
+    day and its halos, and only the rows inside the halos are kept. The rows of the other days that the
+    lookups can reach, i.e. the last events and statuses before the halos and the first events after
+    them, are given by `carry`, from the edges of the other partitions.
+
+    Args:
+        date (pd.Timestamp): The date of the partition.
+        polling_files (list): The polling files of the partitions overlapping the halos.
+        conn_status_files (list): The connectivity status files of the partitions overlapping the halos.
+        orders_files (list): The orders files of the partition.
+        halo (tuple): The start and end times of the events that can be in the windows of the orders.
+        carry (dict): The last polling event, first polling event and last connectivity status record
+            of each device, outside the partitions that are read.
+        cache_dir (str, optional): The cache folder of `read_files`.
+        **kwargs: The other arguments of `transformation`.
+
+    Returns:
+        tuple: The report and the orders of the partition.
+
+    Raises:
+        ValueError: If orders of the partition are not created on its date.
+    """
+    start, end = halo
+    df_orders = read_files(orders_files, ORDERS_COLUMNS, cache_dir)
+    order_times = df_orders["order_creation_time"]
+    if ((order_times < date) | (order_times >= date + DAY)).any():
+        raise ValueError(
+            f"Orders of the partition {date.date()} are created on another date"
+        )
+
+    df_polling = read_files(polling_files, POLLING_COLUMNS, cache_dir)
+    times = df_polling["creation_time"]
+    last_event = (
+        pd.concat(
+            [
+                carry["last_event"],
+                df_polling[times < start].groupby("device_id")["creation_time"].max(),
+            ]
+        )
+        .groupby(level=0)
+        .max()
+    )
+    first_event = (
+        pd.concat(
+            [
+                carry["first_event"],
+                df_polling[times > end].groupby("device_id")["creation_time"].min(),
+            ]
+        )
+        .groupby(level=0)
+        .min()
+    )
+    df_polling = df_polling[times.between(start, end)]
+
+    # The last status before the halo is kept as a record, as the connectivity windows start from it
+    df_conn_status = read_files(conn_status_files, CONN_STATUS_COLUMNS, cache_dir)
+    times = df_conn_status["creation_time"]
+    last_status = _last_status(
+        pd.concat([carry["last_status"], df_conn_status[times < start]])
+    )
+    df_conn_status = pd.concat(
+        [last_status, df_conn_status[times.between(start, end)]], ignore_index=True
+    )
+
+    df_report = transformation(df_polling, df_conn_status, df_orders, **kwargs)
+
+    # Orders without events in the halos take the nearest events of the other days
+    has_time = df_report["order_creation_time"].notna()
+    for column, events in [
+        ("preceding_event", last_event),
+        ("following_event", first_event),
+    ]:
+        missing = has_time & df_report[column].isna()
+        if missing.any():
+            df_report.loc[missing, column] = df_report.loc[missing, "device_id"].map(
+                events
+            )
+
+    return df_report, df_orders
+
+
+def transformation_partitioned(
+    path_polling: str,
+    path_conn_status: str,
+    path_orders: str,
+    dates: list = None,
+    time_period: list = TIME_PERIODS,
+    status_codes: list = STATUS_CODES,
+    error_codes: list = ERROR_CODES,
+    workers: int = None,
+    connectivity_windows: bool = False,
+    cache_dir: str = None,
+) -> pd.DataFrame:
+    """
+    Builds the same report as `transformation` from date-partitioned input folders, transforming each
+    day in its own process.
+
+    Each input folder has one subfolder per date, `date=YYYY-MM-DD`, with the files of the records created
+    on that date, see `list_partitions`. The orders of a day are reported from the polling events and
+    connectivity status records of the day and of its halos: the longest time period before the start of
+    the day and the longest time period after its end, e.g. 60 minutes of the previous day and 3 minutes of
+    the next day, so the windows at the day boundaries are exact. The nearest events and statuses outside
+    the halos come from the edges of the other days, see `partition_edges`, and every day counts the codes
+    found in all the days, so the combined report is the same as the report of the concatenated inputs.
+
+    Args:
+        path_polling (str): The folder of the polling event partitions.
+        path_conn_status (str): The folder of the connectivity status partitions.
+        path_orders (str): The folder of the orders partitions.
+        dates (list, optional): The dates to report, as "YYYY-MM-DD" strings. Defaults to all the dates
+            with orders.
+        time_period (list): Time periods in minutes, see `transformation`.
+        status_codes (list): Declared status codes, see `transformation`.
+        error_codes (list): Declared error codes, see `transformation`.
+        workers (int, optional): The number of worker processes. Defaults to the number of CPUs.
+        connectivity_windows (bool): If True, adds the connectivity window columns, see `transformation`.
+        cache_dir (str, optional): If given, the files and the edges of the partitions are cached in this
+            folder, so reporting a day again only reads the partitions of the day and of its halos, and the
+            partitions of the other days that changed. Otherwise, they are cached in a temporary folder for
+            the run, so each partition is parsed once.
+
+    Returns:
+        pd.DataFrame: The report of the orders of the dates, with the rows in the same order as `transformation`.
+
+    Raises:
+        ValueError: If a folder does not exist, if there are no orders partitions to report, or if
+            orders of a partition are created on another date.
+    """
+    polling = list_partitions(path_polling)
+    conn_status = list_partitions(path_conn_status)
+    orders = list_partitions(path_orders)
+    days = list(orders) if dates is None else sorted(pd.Timestamp(d) for d in dates)
+    if not days:
+        raise ValueError(f"There are no orders partitions in '{path_orders}'")
+    for date in days:
+        if date not in orders:
+            raise ValueError(f"There is no orders partition for {date.date()}")
+
+    max_before, max_after = time_period_bounds(time_period)
+    event_days = sorted(set(polling) | set(conn_status))
+
+    with contextlib.ExitStack() as stack:
+        if not cache_dir:
+            # The edges of every day are needed for the nearest events and the codes, and the halos read the
+            # partitions of the neighbouring days again, so the run caches the parsed partitions in a
+            # temporary folder: each partition is parsed once
+            cache_dir = stack.enter_context(tempfile.TemporaryDirectory())
+        executor = stack.enter_context(
+            ProcessPoolExecutor(max_workers=workers or os.cpu_count())
+        )
+        futures = [
+            executor.submit(
+                partition_edges,
+                polling.get(date, []),
+                conn_status.get(date, []),
+                cache_dir,
+            )
+            for date in event_days
+        ]
+        edges = dict(zip(event_days, (future.result() for future in futures)))
+
+        # Every day counts the codes found in all the days, so the reports have the same columns
+        status_codes = list(status_codes) + sorted(
+            set().union(*(e["status_codes"] for e in edges.values()))
+            - set(status_codes)
+        )
+        error_codes = list(error_codes) + sorted(
+            set().union(*(e["error_codes"] for e in edges.values())) - set(error_codes)
+        )
+
+        # Running edges of the partitions before and after each partition, so each day only reads
+        # the partitions of its halos
+        empty = pd.Series(dtype="datetime64[ns]")
+        before = [{"last_event": empty, "last_status": None}]
+        for e in edges.values():
+            before.append(
+                {
+                    "last_event": pd.concat([before[-1]["last_event"], e["last_event"]])
+                    .groupby(level=0)
+                    .max(),
+                    "last_status": _last_status(
+                        pd.concat([before[-1]["last_status"], e["last_status"]])
+                    ),
+                }
+            )
+        after = [empty]
+        for e in reversed(edges.values()):
+            after.append(
+                pd.concat([e["first_event"], after[-1]]).groupby(level=0).min()
+            )
+        after.reverse()
+
+        futures = []
+        for date in days:
+            start, end = date - max_before, date + DAY + max_after
+            first = bisect.bisect_right(event_days, start - DAY)
+            last = bisect.bisect_right(event_days, end)
+            read = event_days[first:last]
+            carry = before[first] | {"first_event": after[last]}
+            futures.append(
+                executor.submit(
+                    _transform_day,
+                    date,
+                    [path for d in read for path in polling.get(d, [])],
+                    [path for d in read for path in conn_status.get(d, [])],
+                    orders[date],
+                    (start, end),
+                    carry,
+                    cache_dir,
+                    time_period=time_period,
+                    status_codes=status_codes,
+                    error_codes=error_codes,
+                    connectivity_windows=connectivity_windows,
+                )
+            )
+        reports, day_orders = zip(*(future.result() for future in futures))
+
+    logger.info(f"Transformed the orders of {len(days)} days")
+    return sort_report_rows(
+        pd.concat(reports, ignore_index=True), pd.concat(day_orders, ignore_index=True)
+    )
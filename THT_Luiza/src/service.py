@@ -0,0 +1,590 @@
+import asyncio
+import bisect
+import csv
+import heapq
+import itertools
+import json
+import logging
+import math
+import operator
+import time
+from collections import deque
+import pandas as pd
+from src.stream import REPORT_COLUMNS
+from src.transform import (
+    ERROR_CODES,
+    MINUTE,
+    STATUS_CODES,
+    TIME_PERIODS,
+    _count_names,
+    time_period_bounds,
+    time_period_suffix,
+)
+
+
+logger = logging.getLogger(__name__)
+
+SECOND = pd.Timedelta(seconds=1).value
+
+# Types of the messages of the local socket, and the input file each one mirrors
+MESSAGE_TYPES = ["polling", "connectivity_status", "order"]
+
+# Cap of the events kept per device, whatever their times
+MAX_EVENTS_PER_DEVICE = 10_000
+
+# Time of a buffered event, the key the buffers are sorted by
+_event_time = operator.itemgetter(0)
+
+
+def _is_null(value) -> bool:
+    """Tells if a field of a message is missing, i.e. None or NaN."""
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+def _timestamp(value) -> int:
+    """Converts a message time to int64 nanoseconds, or None if it is missing or invalid."""
+    try:
+        timestamp = pd.Timestamp(value)
+    except (TypeError, ValueError):
+        return None
+    return None if pd.isna(timestamp) else timestamp.value
+
+
+def _status_code(value):
+    """Converts a status code to a number as in the CSV inputs, e.g. '200' or 200.0 -> 200, or keeps it if it is not one."""
+    if _is_null(value):
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return value
+    return int(number) if number.is_integer() else number
+
+
+def _csv_value(value: str):
+    """Converts a CSV field to None if empty, to a number if numeric, e.g. '200' -> 200, or keeps the string."""
+    if value == "":
+        return None
+    for number in (int, float):
+        try:
+            return number(value)
+        except ValueError:
+            pass
+    return value
+
+
+class ReportService:
+    """
+    Keeps the recent events of each device and computes the report row of each order once
+    its longest time period after the order creation time has closed.
+
+    The polling events and connectivity status records of each device are kept in a ring buffer
+    sorted by time, which covers the longest time period before and after an order. Older events
+    leave the buffer, but the last one of each device is kept, to find the preceding polling event and
+    the previous status of the next orders. The last events of the devices idle for longer than
+    `max_idle_minutes` are dropped too, so the memory depends on the number of active devices and not on
+    the history, and the next orders of these devices have no preceding event or previous status.
+
+    The time of the service is the watermark: the oldest of the newest times read from each source,
+    e.g. each input file, minus the allowed lateness of the messages, so a source that is behind
+    the others holds it back. An order is reported as soon as the watermark passes the end of its
+    windows. Its following polling event is the first one received by then, so it is missing if the
+    device did not poll before the windows closed.
+
+    The rows have the count columns of the declared codes, then of the codes found in the polling events
+    received so far, so a code found later adds count columns to the next rows only: the rows written
+    before it do not have them, and their counts of the code are 0.
+
+    Args:
+        time_period (list): Time periods in minutes, see `transformation`.
+        status_codes (list): Declared status codes, see `transformation`. The codes found in the
+            polling events are added as they are received.
+        error_codes (list): Declared error codes, see `transformation`.
+        lateness (float): The seconds a message may arrive after newer messages of its source. Defaults to 0.
+        max_events_per_device (int): The size of the ring buffers of each device. A warning is logged for
+            the devices whose buffers drop events that can still be in open windows.
+        max_idle_minutes (float, optional): How long the last events of a device without events in its
+            buffers are kept. Defaults to the longest time period.
+    """
+
+    def __init__(
+        self,
+        time_period: list = TIME_PERIODS,
+        status_codes: list = STATUS_CODES,
+        error_codes: list = ERROR_CODES,
+        lateness: float = 0.0,
+        max_events_per_device: int = MAX_EVENTS_PER_DEVICE,
+        max_idle_minutes: float = None,
+    ):
+        self.time_period = list(time_period)
+        self.declared_codes = (list(status_codes), list(error_codes))
+        self.found_codes = (set(), set())
+        self.status_codes, self.error_codes = self.declared_codes
+        self.max_events_per_device = max_events_per_device
+        self.lateness = int(lateness * SECOND)
+        self.before, self.after = (
+            bound.value for bound in time_period_bounds(self.time_period)
+        )
+        self.max_idle = (
+            max(self.before, self.after)
+            if max_idle_minutes is None
+            else max_idle_minutes * MINUTE
+        )
+        self.watermark = None
+        # Newest message time of each source that has not been idle since, None before its first message
+        self.source_times = {}
+
+        # Per device: the buffered (time, status_code, error_code) polling events and (time, status)
+        # connectivity status records sorted by time, and the last event that left each buffer
+        self.polling = {}
+        self.conn_status = {}
+        self.last_polling = {}
+        self.last_conn_status = {}
+        # Pending orders as (closing time, arrival number, order_id, device_id, order time)
+        self.pending = []
+        self._arrivals = itertools.count()
+        self._last_sweep = None
+        # Devices whose full buffers dropped events of open windows, warned about once
+        self.capped_devices = set()
+
+    def add_polling(self, creation_time, device_id, status_code=None, error_code=None):
+        """Adds a polling event, and returns its time in nanoseconds, or None if it has no time or device."""
+        time_ns = _timestamp(creation_time)
+        if time_ns is None or _is_null(device_id):
+            return None
+        # The status codes of JSON messages can be strings, e.g. "200"
+        status_code = _status_code(status_code)
+        for code, declared, found in zip(
+            (status_code, error_code), self.declared_codes, self.found_codes
+        ):
+            if not _is_null(code) and code not in declared and code not in found:
+                # The declared codes, then the codes found so far, as `polling_event_codes`
+                found.add(code)
+                self.status_codes, self.error_codes = (
+                    codes + sorted(new_codes)
+                    for codes, new_codes in zip(self.declared_codes, self.found_codes)
+                )
+        self._insert(
+            self.polling,
+            self.last_polling,
+            device_id,
+            time_ns,
+            (status_code, error_code),
+        )
+        return time_ns
+
+    def add_connectivity_status(self, creation_time, device_id, status=None):
+        """Adds a connectivity status record, and returns its time in nanoseconds, as `add_polling`."""
+        time_ns = _timestamp(creation_time)
+        if time_ns is None or _is_null(device_id):
+            return None
+        self._insert(
+            self.conn_status, self.last_conn_status, device_id, time_ns, (status,)
+        )
+        return time_ns
+
+    def add_order(self, order_id, device_id, order_creation_time):
+        """
+        Adds an order, which is reported by `close_windows` once its windows have closed, and
+        returns its time in nanoseconds. Orders without a device are not reported, as in `transformation`.
+        """
+        time_ns = _timestamp(order_creation_time)
+        if _is_null(device_id):
+            return None
+        if time_ns is None:
+            # Reported right away, without events as in `transformation`
+            closing = -(2**63)
+        else:
+            closing = time_ns + self.after
+            if self.watermark is not None and time_ns < self.horizon():
+                logger.warning(
+                    f"Order {order_id} arrived after the events of its windows left the buffers"
+                )
+        heapq.heappush(
+            self.pending,
+            (closing, next(self._arrivals), order_id, device_id, time_ns),
+        )
+        return time_ns
+
+    def horizon(self) -> int:
+        """Returns the time before which the events leave the buffers, as no open window starts before it."""
+        return self.watermark - self.before - self.after
+
+    def _insert(
+        self, buffers: dict, last: dict, device_id, time_ns: int, fields: tuple
+    ):
+        """Inserts an event in the buffer of its device, after the events with the same time."""
+        buffer = buffers.setdefault(device_id, deque())
+        event = (time_ns,) + fields
+        if not buffer or buffer[-1][0] <= time_ns:
+            buffer.append(event)
+        else:
+            buffer.insert(bisect.bisect_right(buffer, time_ns, key=_event_time), event)
+        if len(buffer) > self.max_events_per_device:
+            last[device_id] = buffer.popleft()
+            in_window = self.watermark is None or last[device_id][0] >= self.horizon()
+            if in_window and device_id not in self.capped_devices:
+                self.capped_devices.add(device_id)
+                logger.warning(
+                    f"Device {device_id} has more than {self.max_events_per_device} events in open windows, "
+                    "the oldest ones are dropped and not counted in the report rows"
+                )
+
+    def _evict(self, device_id) -> None:
+        """Moves the events older than the horizon out of the buffers of a device."""
+        horizon = self.horizon()
+        for buffers, last in [
+            (self.polling, self.last_polling),
+            (self.conn_status, self.last_conn_status),
+        ]:
+            buffer = buffers.get(device_id)
+            if buffer is None:
+                continue
+            while buffer and buffer[0][0] < horizon:
+                last[device_id] = buffer.popleft()
+            if not buffer:
+                del buffers[device_id]
+
+    def close_windows(self, final: bool = False) -> list:
+        """
+        Reports the orders whose windows have closed, and evicts the old events of their devices.
+        The buffers of the other devices are swept once per horizon, and the idle devices are then forgotten.
+
+        Args:
+            final (bool): If True, all the pending orders are reported, e.g. at the end of the inputs.
+
+        Returns:
+            list: The report rows as dictionaries, in the order the windows closed.
+        """
+        rows = []
+        while self.pending and (
+            final
+            or (self.watermark is not None and self.pending[0][0] < self.watermark)
+        ):
+            _, _, order_id, device_id, time_ns = heapq.heappop(self.pending)
+            rows.append(self.report_row(order_id, device_id, time_ns))
+        if self.watermark is None:
+            return rows
+
+        sweep = (
+            self._last_sweep is None
+            or self.watermark - self._last_sweep > self.before + self.after
+        )
+        if sweep:
+            devices = set(self.polling) | set(self.conn_status)
+            self._last_sweep = self.watermark
+        else:
+            devices = {row["device_id"] for row in rows}
+        for device_id in devices:
+            self._evict(device_id)
+        if sweep:
+            self._forget_idle_devices()
+
+        return rows
+
+    def _forget_idle_devices(self) -> None:
+        """Drops the last events of the devices without buffered events and idle for longer than `max_idle`."""
+        cutoff = self.watermark - self.max_idle
+        for buffers, last in [
+            (self.polling, self.last_polling),
+            (self.conn_status, self.last_conn_status),
+        ]:
+            idle = [
+                device_id
+                for device_id, event in last.items()
+                if event[0] < cutoff and device_id not in buffers
+            ]
+            for device_id in idle:
+                del last[device_id]
+                self.capped_devices.discard(device_id)
+
+    def report_row(self, order_id, device_id, time_ns: int) -> dict:
+        """
+        Computes the report row of an order from the buffered events of its device.
+
+        Returns:
+            dict: The columns of the `transformation` report, with the count columns of the declared codes
+            and of the codes received so far. Missing events and statuses are None.
+        """
+        names = _count_names(self.status_codes, self.error_codes)
+        row = dict.fromkeys(REPORT_COLUMNS)
+        row.update(order_id=order_id, device_id=device_id)
+        if time_ns is None:
+            row.update(
+                {
+                    name + time_period_suffix(t): 0
+                    for t in self.time_period
+                    for name in names
+                }
+            )
+            return row
+
+        row["order_creation_time"] = pd.Timestamp(time_ns)
+        # The buffers are searched by time, without copying their times
+        polling = self.polling.get(device_id, ())
+        left = bisect.bisect_left(polling, time_ns, key=_event_time)
+        right = bisect.bisect_right(polling, time_ns, key=_event_time)
+        if right > 0:
+            row["preceding_event"] = pd.Timestamp(polling[right - 1][0])
+        elif device_id in self.last_polling:
+            row["preceding_event"] = pd.Timestamp(self.last_polling[device_id][0])
+        if left < len(polling):
+            row["following_event"] = pd.Timestamp(polling[left][0])
+
+        # Windows before the order are [order + t, order] and windows after it are [order, order + t]
+        for t in self.time_period:
+            if t <= 0:
+                lower = bisect.bisect_left(
+                    polling, time_ns + t * MINUTE, lo=0, hi=right, key=_event_time
+                )
+                upper = right
+            else:
+                lower = left
+                upper = bisect.bisect_right(
+                    polling, time_ns + t * MINUTE, lo=left, key=_event_time
+                )
+            counts = dict.fromkeys(names, 0)
+            for _, status_code, error_code in itertools.islice(polling, lower, upper):
+                if not _is_null(status_code):
+                    counts["count_total_events"] += 1
+                    counts[names[1 + self.status_codes.index(status_code)]] += 1
+                if _is_null(error_code):
+                    counts["count_no_error_code"] += 1
+                else:
+                    index = (
+                        1 + len(self.status_codes) + self.error_codes.index(error_code)
+                    )
+                    counts[names[index]] += 1
+            suffix = time_period_suffix(t)
+            row.update({name + suffix: n for name, n in counts.items()})
+
+        conn_status = self.conn_status.get(device_id, ())
+        position = bisect.bisect_right(conn_status, time_ns, key=_event_time)
+        record = (
+            conn_status[position - 1]
+            if position > 0
+            else self.last_conn_status.get(device_id)
+        )
+        if record is not None:
+            row["status_time"] = pd.Timestamp(record[0])
+            row["previous_status"] = None if _is_null(record[1]) else record[1]
+
+        return row
+
+    def add(self, message: dict, source: str = None) -> None:
+        """
+        Adds a message of one of the `MESSAGE_TYPES`, with the columns of its input file,
+        and advances the watermark to its time.
+
+        Args:
+            message (dict): The message.
+            source (str, optional): The name of the source of the message, e.g. its file.
+        """
+        kind = message.get("type")
+        if kind == "polling":
+            time_ns = self.add_polling(
+                message.get("creation_time"),
+                message.get("device_id"),
+                message.get("status_code"),
+                message.get("error_code"),
+            )
+        elif kind == "connectivity_status":
+            time_ns = self.add_connectivity_status(
+                message.get("creation_time"),
+                message.get("device_id"),
+                message.get("status"),
+            )
+        elif kind == "order":
+            time_ns = self.add_order(
+                message.get("order_id"),
+                message.get("device_id"),
+                message.get("order_creation_time"),
+            )
+        else:
+            logger.warning(f"Unknown message type '{kind}'")
+            return
+
+        current = self.source_times.get(source)
+        if time_ns is not None and (current is None or time_ns > current):
+            self.source_times[source] = time_ns
+            self._advance_watermark()
+
+    def register(self, source: str) -> None:
+        """Holds back the watermark until a source, e.g. a file that is not read yet, has sent a message."""
+        self.source_times.setdefault(source, None)
+
+    def idle(self, source: str) -> None:
+        """Stops holding back the watermark for a source without new messages, e.g. at the end of its file."""
+        if self.source_times.pop(source, None) is not None:
+            self._advance_watermark()
+
+    def _advance_watermark(self) -> None:
+        """Moves the watermark to the oldest newest time of the sources, if it is later."""
+        times = list(self.source_times.values())
+        if times and None not in times:
+            watermark = min(times) - self.lateness
+            if self.watermark is None or watermark > self.watermark:
+                self.watermark = watermark
+
+
+# Message of a source without new messages, see `ReportService.idle`
+IDLE = {"type": "idle"}
+
+
+async def tail_csv(
+    path: str,
+    kind: str,
+    queue: asyncio.Queue,
+    follow: bool = False,
+    interval: float = 0.1,
+) -> None:
+    """
+    Reads the rows of a CSV input file as messages of a type, and puts them in a queue as
+    `(path, message)` pairs. An `IDLE` message is put each time the end of the file is reached.
+
+    Args:
+        path (str): The path to the CSV file, with a header.
+        kind (str): The type of the messages, one of `MESSAGE_TYPES`.
+        queue (asyncio.Queue): The queue of the messages.
+        follow (bool): If True, waits for new rows at the end of the file, as `tail -f`.
+            Defaults to False, i.e. stops at the end of the file.
+        interval (float): The seconds to wait before reading the end of the file again.
+    """
+    header = None
+    idle = False
+    with open(path, newline="") as f:
+        line = ""
+        while True:
+            read = f.readline()
+            line += read
+            if read and not read.endswith("\n"):
+                # A line being written is completed by the next reads
+                continue
+            if not read and (follow or not line):
+                if not idle:
+                    await queue.put((path, IDLE))
+                    idle = True
+                if not follow:
+                    return
+                await asyncio.sleep(interval)
+                continue
+
+            values, line = next(csv.reader([line]), None), ""
+            if not values:
+                continue
+            if header is None:
+                header = values
+                continue
+            message = {
+                column: _csv_value(value) for column, value in zip(header, values)
+            }
+            await queue.put((path, dict(message, type=kind)))
+            idle = False
+
+
+async def serve_socket(path: str, queue: asyncio.Queue) -> asyncio.AbstractServer:
+    """
+    Listens on a local Unix socket for messages, one JSON object per line with a "type" among
+    `MESSAGE_TYPES` and the columns of its input file. Each connection is a source of the
+    `(source, message)` pairs put in the queue, and is idle once closed.
+
+    Args:
+        path (str): The path to the socket.
+        queue (asyncio.Queue): The queue of the messages.
+
+    Returns:
+        asyncio.AbstractServer: The server, which is closed by the caller.
+    """
+    connections = itertools.count()
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        source = f"{path}#{next(connections)}"
+        try:
+            async for line in reader:
+                if not line.strip():
+                    continue
+                try:
+                    message = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"Invalid message {line[:100]!r}")
+                    continue
+                await queue.put((source, message))
+        finally:
+            await queue.put((source, IDLE))
+            writer.close()
+
+    return await asyncio.start_unix_server(handle, path=path)
+
+
+def _json_row(row: dict) -> str:
+    """Formats a report row as a JSON line, with the times as strings and the missing values as null."""
+    return json.dumps(
+        {
+            key: str(value) if isinstance(value, pd.Timestamp) else value
+            for key, value in row.items()
+        }
+    )
+
+
+async def run_service(
+    service: ReportService, queue: asyncio.Queue, output, sources: list
+) -> int:
+    """
+    Applies the messages of a queue to a `ReportService` and writes the rows of the orders
+    as JSON lines, flushed right after the message that closes their windows.
+
+    Args:
+        service (ReportService): The state of the service.
+        queue (asyncio.Queue): The queue filled by `tail_csv` or `serve_socket`.
+        output: A text file to write the report rows to.
+        sources (list): The tasks filling the queue. When they are all done and the queue is empty,
+            the pending orders are reported and the service stops. A socket server is never done, and
+            the pending orders are then reported when the service is cancelled, e.g. by a signal.
+
+    Returns:
+        int: The number of report rows written.
+    """
+    written = 0
+
+    def write(rows: list) -> None:
+        nonlocal written
+        if rows:
+            output.write("".join(_json_row(row) + "\n" for row in rows))
+            output.flush()
+            written += len(rows)
+
+    # A single pending get, as `asyncio.wait_for` can lose a cancellation that arrives with a message
+    getter = None
+    try:
+        while not (queue.empty() and all(source.done() for source in sources)):
+            if getter is None:
+                getter = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait([getter], timeout=0.5)
+            if not done:
+                continue
+            source, message = getter.result()
+            getter = None
+            if message is IDLE:
+                service.idle(source)
+            else:
+                service.add(message, source=source)
+            if service.pending:
+                start = time.perf_counter()
+                rows = service.close_windows()
+                write(rows)
+                if rows:
+                    logger.debug(
+                        f"Reported {len(rows)} orders in "
+                        f"{(time.perf_counter() - start) * 1000:.2f} ms"
+                    )
+        # Raises the errors of the sources, e.g. a missing file
+        for source in sources:
+            source.result()
+    except asyncio.CancelledError:
+        logger.info("The service was stopped")
+    finally:
+        if getter is not None:
+            getter.cancel()
+        write(service.close_windows(final=True))
+
+    return written
@@ -0,0 +1,210 @@
+import pandas as pd
+from typing import Iterable, Iterator
+from src.timestamps import parse_timestamps
+from src.transform import (
+    ERROR_CODES,
+    STATUS_CODES,
+    TIME_PERIODS,
+    count_columns,
+    polling_event_codes,
+    sort_report_rows,
+    time_period_bounds,
+    transformation,
+)
+
+
+REPORT_COLUMNS = [
+    "order_id",
+    "device_id",
+    "order_creation_time",
+    "preceding_event",
+    "following_event",
+    "previous_status",
+    "status_time",
+]
+
+
+def stream_transformation(
+    polling_chunks: Iterable[pd.DataFrame],
+    df_connectivity_status: pd.DataFrame,
+    df_orders: pd.DataFrame,
+    time_period: list = TIME_PERIODS,
+    status_codes: list = STATUS_CODES,
+    error_codes: list = ERROR_CODES,
+) -> Iterator[pd.DataFrame]:
+    """
+    Applies the report transformation to polling events read in chunks ordered by creation time,
+    and yields the report rows of the orders as soon as their whole time periods have been read.
+
+    Only an overlap buffer of polling events is kept in memory: the events at most as old as the
+    longest time period before the oldest pending order. The last event of each device that left the
+    buffer is kept to find the preceding polling event of the next orders, and the rows whose
+    following polling event has not been read yet are held back until it is.
+
+    Args:
+        polling_chunks (Iterable[pd.DataFrame]): The polling events, in chunks ordered by creation time,
+            e.g. the reader returned by `extract(..., chunksize=...)`.
+        df_connectivity_status (pd.DataFrame): Input DataFrame containing internet connectivity status logs.
+        df_orders (pd.DataFrame): Input DataFrame containing data for orders.
+        time_period (list): Time periods in minutes to count the polling events in, negative before and
+            positive after the order creation time.
+        status_codes (list): Declared status codes, see `transformation`.
+        error_codes (list): Declared error codes, see `transformation`.
+
+    Yields:
+        pd.DataFrame: Report rows, with the columns of `transformation`. The count columns of the codes
+        found in the polling events are those of the codes read so far.
+
+    Raises:
+        ValueError: If a chunk has polling events older than the newest event of the previous chunks.
+    """
+    max_before, max_after = time_period_bounds(time_period)
+
+    df_connectivity_status = df_connectivity_status.assign(
+        creation_time=parse_timestamps(df_connectivity_status["creation_time"])
+    )
+    df_pending = df_orders.loc[
+        df_orders["device_id"].notna(), ["order_id", "device_id", "order_creation_time"]
+    ].assign(order_creation_time=lambda df: parse_timestamps(df["order_creation_time"]))
+    df_pending = df_pending.sort_values("order_creation_time", kind="stable")
+
+    df_buffer = None
+    df_waiting = None
+    last_evicted = pd.Series(dtype="datetime64[ns]")
+    watermark = None
+
+    def report(df_ready: pd.DataFrame) -> pd.DataFrame:
+        df_report = transformation(
+            df_polling=df_buffer,
+            df_connectivity_status=df_connectivity_status,
+            df_orders=df_ready,
+            time_period=time_period,
+            status_codes=status_codes,
+            error_codes=error_codes,
+        )
+        # The preceding event may have left the buffer already
+        evicted = df_report["device_id"].map(last_evicted)
+        df_report["preceding_event"] = df_report["preceding_event"].fillna(evicted)
+        return df_report
+
+    for df_chunk in polling_chunks:
+        df_chunk = df_chunk.assign(
+            creation_time=parse_timestamps(df_chunk["creation_time"])
+        ).dropna(subset=["creation_time"])
+        if df_chunk.empty:
+            continue
+        if watermark is not None and df_chunk["creation_time"].min() < watermark:
+            raise ValueError("The polling events are not ordered by creation_time")
+
+        status_codes, error_codes = polling_event_codes(
+            df_chunk, status_codes=status_codes, error_codes=error_codes
+        )
+
+        # The first event of a device in this chunk is the following event of its waiting rows
+        if df_waiting is not None:
+            first_events = df_chunk.groupby("device_id")["creation_time"].min()
+            df_waiting = df_waiting.assign(
+                following_event=df_waiting["device_id"].map(first_events)
+            )
+            found = df_waiting["following_event"].notna()
+            if found.any():
+                yield df_waiting[found]
+            df_waiting = df_waiting[~found] if not found.all() else None
+
+        df_buffer = pd.concat([df_buffer, df_chunk], ignore_index=True)
+        watermark = df_chunk["creation_time"].max()
+
+        # Events at the watermark may continue in the next chunk, so only strictly older windows are closed
+        is_ready = df_pending["order_creation_time"] + max_after < watermark
+        if is_ready.any():
+            df_report = report(df_pending[is_ready])
+            waiting = df_report["following_event"].isna()
+            if waiting.any():
+                df_waiting = pd.concat([df_waiting, df_report[waiting]])
+            if not waiting.all():
+                yield df_report[~waiting]
+            df_pending = df_pending[~is_ready]
+
+        # Drop the events that are older than every window of the pending orders
+        cutoff = (
+            df_pending["order_creation_time"].min() if len(df_pending) else watermark
+        ) - max_before
+        is_evicted = df_buffer["creation_time"] < cutoff
+        if is_evicted.any():
+            last_evicted = (
+                pd.concat(
+                    [
+                        last_evicted,
+                        df_buffer[is_evicted]
+                        .groupby("device_id")["creation_time"]
+                        .max(),
+                    ]
+                )
+                .groupby(level=0)
+                .max()
+            )
+            df_buffer = df_buffer[~is_evicted].reset_index(drop=True)
+
+    # All the polling events have been read: the remaining orders and waiting rows are final
+    if df_buffer is None:
+        df_buffer = pd.DataFrame(
+            columns=["creation_time", "device_id", "error_code", "status_code"]
+        ).astype({"creation_time": "datetime64[ns]"})
+    if len(df_pending):
+        yield report(df_pending)
+    if df_waiting is not None:
+        yield df_waiting
+
+
+def transformation_chunked(
+    polling_chunks: Iterable[pd.DataFrame],
+    df_connectivity_status: pd.DataFrame,
+    df_orders: pd.DataFrame,
+    time_period: list = TIME_PERIODS,
+    status_codes: list = STATUS_CODES,
+    error_codes: list = ERROR_CODES,
+) -> pd.DataFrame:
+    """
+    Builds the same report as `transformation`, reading the polling events in chunks ordered by
+    creation time with `stream_transformation`.
+
+    Args:
+        polling_chunks (Iterable[pd.DataFrame]): The polling events, in chunks ordered by creation time.
+        df_connectivity_status (pd.DataFrame): Input DataFrame containing internet connectivity status logs.
+        df_orders (pd.DataFrame): Input DataFrame containing data for orders.
+        time_period (list): Time periods in minutes, see `transformation`.
+        status_codes (list): Declared status codes, see `transformation`.
+        error_codes (list): Declared error codes, see `transformation`.
+
+    Returns:
+        pd.DataFrame: The report, with the rows and columns in the same order as `transformation`.
+    """
+    found_codes = [set(), set()]
+
+    def chunks_with_codes():
+        for df_chunk in polling_chunks:
+            for codes, column in zip(found_codes, ["status_code", "error_code"]):
+                codes.update(pd.unique(df_chunk[column].dropna()))
+            yield df_chunk
+
+    batches = list(
+        stream_transformation(
+            polling_chunks=chunks_with_codes(),
+            df_connectivity_status=df_connectivity_status,
+            df_orders=df_orders,
+            time_period=time_period,
+            status_codes=status_codes,
+            error_codes=error_codes,
+        )
+    )
+
+    # The codes found in the whole file give the count columns of the report
+    status_codes = list(status_codes) + sorted(found_codes[0] - set(status_codes))
+    error_codes = list(error_codes) + sorted(found_codes[1] - set(error_codes))
+    counts = count_columns(time_period, status_codes, error_codes)
+    df_report = pd.concat(batches, ignore_index=True).reindex(
+        columns=REPORT_COLUMNS + counts
+    )
+    df_report[counts] = df_report[counts].fillna(0).astype("int64")
+
+    return sort_report_rows(df_report, df_orders)
@@ -0,0 +1,137 @@
+import os
+import uuid
+import numpy as np
+import pandas as pd
+
+
+def _device_ids(rng: np.random.Generator, n_devices: int) -> np.ndarray:
+    """Generates random UUID4 device IDs, as in the real inputs."""
+    return np.array(
+        [str(uuid.UUID(bytes=rng.bytes(16), version=4)) for _ in range(n_devices)]
+    )
+
+
+def generate_inputs(
+    n_devices: int = 200,
+    n_orders: int = 2000,
+    polling_rate: float = 2.0,
+    hours: float = 24.0,
+    offline_rate: float = 1.0,
+    error_rate: float = 0.005,
+    missing_device_rate: float = 0.01,
+    start: str = "2020-02-26",
+    sort_by_time: bool = False,
+    seed: int = 0,
+) -> tuple:
+    """
+    Generates synthetic polling events, connectivity status logs and orders with the schema
+    of the files in `data/input`. The same arguments always generate the same data.
+
+    Each device polls the server `polling_rate` times per minute during `hours` hours, with some
+    jitter, so there are about `n_devices * polling_rate * 60 * hours` polling events. A share
+    `error_rate` of the polls fail with status code 0 and an error code. Each device goes offline
+    about `offline_rate` times per hour, logging an OFFLINE and then an ONLINE status.
+
+    Args:
+        n_devices (int): The number of devices.
+        n_orders (int): The number of orders.
+        polling_rate (float): The number of polling events of each device per minute.
+        hours (float): The duration covered by the events and the orders, in hours.
+        offline_rate (float): The number of offline periods of each device per hour.
+        error_rate (float): The share of the polling events that failed.
+        missing_device_rate (float): The share of the orders without a device_id.
+        start (str): The start time of the events and orders.
+        sort_by_time (bool): If True, the polling events are ordered by creation_time, as needed by the
+            streaming mode. Defaults to False, i.e. they are grouped by device.
+        seed (int): The seed of the random generator.
+
+    Returns:
+        tuple: A tuple with the polling events, the connectivity status logs and the orders DataFrames.
+    """
+    rng = np.random.default_rng(seed)
+    devices = _device_ids(rng, n_devices)
+    start = pd.Timestamp(start).value
+    duration = int(hours * 3600 * 1000)
+
+    # Polling events: a regular poll of each device with a random phase and jitter, in milliseconds
+    interval = 60_000 / polling_rate
+    n_polls = int(duration // interval)
+    phases = rng.uniform(0, interval, n_devices)
+    offsets = phases[:, None] + np.arange(n_polls) * interval
+    offsets += rng.uniform(-0.1, 0.1, offsets.shape) * interval
+    is_error = rng.random(offsets.size) < error_rate
+    df_polling = pd.DataFrame(
+        {
+            "creation_time": pd.to_datetime(
+                start + np.round(offsets.ravel()).astype(np.int64) * 1_000_000
+            ),
+            "device_id": np.repeat(devices, n_polls),
+            "error_code": np.where(
+                is_error,
+                rng.choice(["ECONNABORTED", "GENERIC_ERROR"], offsets.size),
+                None,
+            ),
+            "status_code": np.where(is_error, 0, 200),
+        }
+    )
+    if sort_by_time:
+        df_polling = df_polling.sort_values("creation_time", kind="stable")
+
+    # Connectivity status: an OFFLINE log and an ONLINE log a few seconds later for each offline period
+    n_offline = rng.poisson(offline_rate * hours, n_devices)
+    offline_devices = np.repeat(devices, n_offline)
+    offline_times = rng.integers(0, duration, len(offline_devices))
+    online_times = offline_times + rng.exponential(30_000, len(offline_devices)).astype(
+        np.int64
+    )
+    df_conn_status = pd.DataFrame(
+        {
+            "creation_time": pd.to_datetime(
+                start + np.concatenate([offline_times, online_times]) * 1_000_000
+            ),
+            "status": np.repeat(["OFFLINE", "ONLINE"], len(offline_devices)),
+            "device_id": np.tile(offline_devices, 2),
+        }
+    ).sort_values(["device_id", "creation_time"], kind="stable")
+
+    # Orders, created at whole seconds
+    order_devices = rng.choice(devices, n_orders).astype(object)
+    order_devices[rng.random(n_orders) < missing_device_rate] = None
+    df_orders = pd.DataFrame(
+        {
+            "order_id": 102_500_000 + np.arange(n_orders),
+            "device_id": order_devices,
+            "order_creation_time": pd.to_datetime(
+                start + rng.integers(0, duration // 1000, n_orders) * 1_000_000_000
+            ),
+        }
+    )
+
+    return (
+        df_polling.reset_index(drop=True),
+        df_conn_status.reset_index(drop=True),
+        df_orders,
+    )
+
+
+def write_inputs(output_dir: str, **kwargs) -> tuple:
+    """
+    Generates synthetic inputs with `generate_inputs` and writes them as
+    `polling.csv`, `connectivity_status.csv` and `orders.csv`.
+
+    Args:
+        output_dir (str): The folder to write the files to. It is created if it does not exist.
+        **kwargs: The arguments of `generate_inputs`.
+
+    Returns:
+        tuple: The paths to the polling, connectivity status and orders files.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    paths = tuple(
+        os.path.join(output_dir, f"{name}.csv")
+        for name in ["polling", "connectivity_status", "orders"]
+    )
+    for df, path in zip(generate_inputs(**kwargs), paths):
+        df.to_csv(path, index=False)
+
+    return paths
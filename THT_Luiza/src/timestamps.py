@@ -0,0 +1,64 @@
+import logging
+import numpy as np
+import pandas as pd
+
+
+logger = logging.getLogger(__name__)
+
+# Declared format of each time column. "ISO8601" uses the pandas ISO parser, which accepts
+# both "2020-02-26 19:31:29" and "2020-02-26 19:31:29.998"
+TIMESTAMP_FORMATS = {
+    "creation_time": "ISO8601",
+    "order_creation_time": "ISO8601",
+    "preceding_event": "ISO8601",
+    "following_event": "ISO8601",
+    "status_time": "ISO8601",
+}
+DEFAULT_FORMAT = "ISO8601"
+
+# Repeated strings are parsed once when at most this share of a sample of the values is unique
+MAX_UNIQUE_RATIO = 0.5
+SAMPLE_SIZE = 10_000
+
+
+def parse_timestamps(values: pd.Series, format: str = None) -> pd.Series:
+    """
+    Parses a column of timestamp strings with an explicit format, instead of letting pandas infer it.
+
+    When the values repeat a lot, e.g. order times with a precision of one second, each distinct
+    string is parsed only once. The values that cannot be parsed are converted to NaT, and their
+    number is logged.
+
+    Args:
+        values (pd.Series): The timestamps to parse. Datetime columns are returned as they are, and
+            integer columns are read as nanoseconds since the epoch.
+        format (str, optional): The format of the strings, "ISO8601" or a `strftime` format.
+            Defaults to the format declared for the column name in `TIMESTAMP_FORMATS`, or "ISO8601".
+
+    Returns:
+        pd.Series: The timestamps as datetime64[ns], with the same index and name as `values`.
+    """
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    if pd.api.types.is_integer_dtype(values):
+        return pd.to_datetime(values, unit="ns", errors="coerce")
+
+    format = format or TIMESTAMP_FORMATS.get(values.name, DEFAULT_FORMAT)
+
+    sample = values.iloc[:: max(1, len(values) // SAMPLE_SIZE)]
+    if len(sample) and sample.nunique() <= MAX_UNIQUE_RATIO * len(sample):
+        codes, uniques = pd.factorize(values)
+        parsed = pd.to_datetime(uniques, format=format, errors="coerce").to_numpy()
+        # The code -1 of the missing values takes the NaT appended at the end
+        parsed = np.append(parsed, np.datetime64("NaT", "ns"))
+        timestamps = pd.Series(parsed[codes], index=values.index, name=values.name)
+    else:
+        timestamps = pd.to_datetime(values, format=format, errors="coerce")
+
+    invalid = int((timestamps.isna() & values.notna()).sum())
+    if invalid:
+        logger.warning(
+            f"{invalid} invalid values in '{values.name}' were converted to NaT (format '{format}')"
+        )
+
+    return timestamps
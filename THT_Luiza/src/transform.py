@@ -1,6 +1,48 @@
+import hashlib
+import json
+import logging
 import pandas as pd
-import datetime as dt
 import numpy as np
+import re
+import tracemalloc
+from src.cache import load_cached, store_cached
+from src.metrics import stage
+from src.timestamps import parse_timestamps
+
+# Default time periods of the report, in minutes: negative before and positive after the order
+TIME_PERIODS = [-3, 3, -60]
+# One minute in nanoseconds, the unit of the int64 times
+MINUTE = pd.Timedelta(minutes=1).value
+
+# Declared polling codes, always reported even when absent from the data
+STATUS_CODES = [0, 200, 401]
+ERROR_CODES = ["ECONNABORTED", "GENERIC_ERROR"]
+
+logger = logging.getLogger(__name__)
+
+# Approximate working memory of `transformation` per input event, for the sort keys, the sort
+# order and the sorted columns, and per report value of an order, which is held in up to three frames
+EVENT_BYTES = 100
+REPORT_VALUE_BYTES = 24
+# Number of rows hashed at once by `transformation_within_budget`
+BLOCK_ROWS = 100_000
+
+# Columns of the events kept by the device index of `transformation`
+POLLING_EVENT_COLUMNS = ["creation_time", "status_code", "error_code"]
+CONN_STATUS_EVENT_COLUMNS = ["creation_time", "status"]
+
+# Connectivity status of a device that is offline
+OFFLINE_STATUS = "OFFLINE"
+
+# Report rows kept by the device cache of `report_rows_with_cache`, the least recently used devices are
+# evicted above it. The version is changed when the report values change, to ignore the older caches
+MAX_REPORT_CACHE_ROWS = 1_000_000
+REPORT_CACHE_VERSION = 1
+# Columns of the report copied from the orders, the other columns are cached
+ORDER_COLUMNS = ["order_id", "device_id", "order_creation_time"]
+
+# Key of `DataFrame.attrs` with the columns the rows are sorted by, see `events_order`
+SORTED_BY = "sorted_by"
 
 
 def find_near_events(orders: pd.DataFrame, events: pd.DataFrame) -> pd.DataFrame:
@@ -114,7 +156,744 @@ def find_connectivity_status(
     return df_connect_status
 
 
-def count_polling_events(df: pd.DataFrame, time_ref: str) -> pd.DataFrame:
+def device_index(*device_ids: pd.Series) -> pd.Index:
+    """
+    Builds the sorted index of the device IDs found in the given columns.
+
+    Args:
+        *device_ids (pd.Series): device_id columns, e.g. of the polling events and the connectivity status.
+
+    Returns:
+        pd.Index: The device IDs. If all the columns are dictionary-encoded with the same categories,
+        as returned by `extract(typed=True)`, the categories are returned without hashing the values.
+    """
+    dtypes = {column.dtype for column in device_ids}
+    if len(dtypes) == 1 and isinstance(next(iter(dtypes)), pd.CategoricalDtype):
+        return pd.Index(device_ids[0].cat.categories)
+
+    return pd.Index(pd.unique(pd.concat(device_ids).dropna())).sort_values()
+
+
+def device_codes(device_id: pd.Series, devices: pd.Index) -> np.ndarray:
+    """
+    Finds the position of each device ID in a device index.
+
+    Args:
+        device_id (pd.Series): The device IDs to look up.
+        devices (pd.Index): The device index, see `device_index`.
+
+    Returns:
+        np.ndarray: The int64 position of each device ID in `devices`, or -1 if it is missing or unknown.
+        The integer codes of a dictionary-encoded column with the same categories are used as they are.
+    """
+    if isinstance(
+        device_id.dtype, pd.CategoricalDtype
+    ) and device_id.cat.categories.equals(devices):
+        return device_id.cat.codes.to_numpy(dtype=np.int64)
+
+    return devices.get_indexer(device_id)
+
+
+def _replace_column(df: pd.DataFrame, column: str, values: pd.Series) -> pd.DataFrame:
+    """Returns a shallow copy of a DataFrame with one column replaced, leaving the DataFrame unchanged."""
+    if df[column] is values:
+        return df
+    df = df.copy(deep=False)
+    df[column] = values
+    return df
+
+
+def events_order(codes: np.ndarray, times: np.ndarray, hint: list = None) -> str:
+    """
+    Checks in linear time how events are already ordered, so that they are sorted only if needed.
+
+    Args:
+        codes (np.ndarray): The position of the device of each event in the device index.
+        times (np.ndarray): The int64 time of each event.
+        hint (list, optional): The columns the events are expected to be sorted by, e.g. the
+            `SORTED_BY` attribute recorded by `extract`. Only the order it names is checked first.
+
+    Returns:
+        str: "device" if the events are sorted by device and time, "time" if they are sorted by time
+        only, or None otherwise.
+    """
+    by_device = hint is None or len(hint) != 1
+
+    def sorted_by_device() -> bool:
+        new_device = np.diff(codes)
+        return bool(
+            (new_device >= 0).all() and (np.diff(times)[new_device == 0] >= 0).all()
+        )
+
+    def sorted_by_time() -> bool:
+        return bool((np.diff(times) >= 0).all())
+
+    checks = [("device", sorted_by_device), ("time", sorted_by_time)]
+    for order, check in checks if by_device else checks[::-1]:
+        if check():
+            return order
+    return None
+
+
+def _argsort_codes(codes: np.ndarray) -> np.ndarray:
+    """Stable argsort of non-negative integer codes, in 16-bit passes of the numpy radix sort."""
+    if len(codes) and codes.max() >= 2**32:
+        return np.argsort(codes, kind="stable")
+    order = np.argsort((codes & 0xFFFF).astype(np.uint16), kind="stable")
+    high = (codes >> 16).astype(np.uint16)
+    if high.any():
+        order = order[np.argsort(high[order], kind="stable")]
+    return order
+
+
+def sortedness(df: pd.DataFrame, time_column: str) -> list:
+    """
+    Finds the columns an input is already sorted by, without sorting it.
+
+    Only the int64 or datetime times of `extract(typed=True)` or of the input cache are checked, and the
+    device IDs when they are dictionary-encoded, as the codes then follow the sorted device IDs.
+
+    Args:
+        df (pd.DataFrame): The input, e.g. the polling events.
+        time_column (str): The name of the time column.
+
+    Returns:
+        list: ["device_id", time_column] or [time_column], or None if the order is unknown.
+    """
+    times = df[time_column]
+    if not (
+        pd.api.types.is_integer_dtype(times) or pd.api.types.is_datetime64_dtype(times)
+    ):
+        return None
+    times = times.to_numpy().view("int64")
+    if isinstance(df["device_id"].dtype, pd.CategoricalDtype):
+        order = events_order(df["device_id"].cat.codes.to_numpy(), times)
+    else:
+        order = "time" if (np.diff(times) >= 0).all() else None
+
+    return {"device": ["device_id", time_column], "time": [time_column]}.get(order)
+
+
+def index_events_by_device(
+    events: pd.DataFrame,
+    time_column: str = "creation_time",
+    devices: pd.Index = None,
+    columns: list = None,
+) -> tuple:
+    """
+    Sorts the events once by device ID and time, so that the events of each device
+    form a contiguous block ordered by time.
+
+    Args:
+        events (pd.DataFrame): A Pandas DataFrame containing events associated with each device ID.
+        It must have the following columns:
+            - device_id
+            - the column given by `time_column`
+        time_column (str): The name of the datetime column to sort the events by.
+        devices (pd.Index, optional): The device IDs to index the events by, e.g. to share the same
+            device grouping between polling and connectivity events. Events of other devices are dropped.
+            Defaults to the sorted device IDs of `events`.
+        columns (list, optional): The columns to keep in the sorted events. Defaults to all the columns.
+
+    The events are only sorted if they are not in this order yet, which is checked in linear time, and
+    events already sorted by time, as written by the producers, are only sorted by device.
+
+    Returns:
+        tuple: A tuple with the following elements:
+            - events_sorted (pd.DataFrame): The events with a device ID and a valid time, sorted by device ID and time.
+            - devices (pd.Index): The device IDs, in the same order as their blocks.
+            - offsets (np.ndarray): The events of `devices[i]` are the rows `offsets[i]:offsets[i + 1]`.
+    """
+    if devices is None:
+        devices = device_index(events["device_id"])
+    codes = device_codes(events["device_id"], devices)
+    times = events[time_column].to_numpy(dtype="datetime64[ns]")
+    times = times.view("int64")
+    valid = np.flatnonzero((codes >= 0) & (times != np.iinfo(np.int64).min))
+    all_valid = len(valid) == len(events)
+    if not all_valid:
+        codes, times = codes[valid], times[valid]
+
+    # The sorts are stable, so events with the same device and time keep their input order
+    current_order = events_order(codes, times, events.attrs.get(SORTED_BY))
+    if current_order == "device":
+        order = valid
+    elif current_order == "time":
+        order = valid[_argsort_codes(codes)]
+    else:
+        order = valid[np.lexsort((times, codes))]
+
+    # The valid events are filtered and sorted with a single take of each kept column,
+    # or shared with the input if they are all valid and already sorted
+    columns = events.columns if columns is None else columns
+    if current_order == "device" and all_valid:
+        events_sorted = pd.DataFrame(
+            {column: events[column].array for column in columns}, copy=False
+        )
+    else:
+        events_sorted = pd.DataFrame(
+            {
+                column: pd.api.extensions.take(events[column].array, order)
+                for column in columns
+            },
+            copy=False,
+        )
+    events_sorted.attrs[SORTED_BY] = ["device_id", time_column]
+
+    offsets = np.zeros(len(devices) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(codes, minlength=len(devices)), out=offsets[1:])
+
+    return events_sorted, devices, offsets
+
+
+def locate_orders(orders: pd.DataFrame, devices: pd.Index) -> tuple:
+    """
+    Finds the device of each order in a device index and groups the orders by device.
+
+    Args:
+        orders (pd.DataFrame): A Pandas DataFrame containing orders data. It must have the following columns:
+            - device_id
+            - order_creation_time
+        devices (pd.Index): The device IDs returned by `index_events_by_device`.
+
+    Returns:
+        tuple: A tuple with the following elements:
+            - order_times (np.ndarray): The order creation times as int64 nanoseconds.
+            - device_codes (np.ndarray): The position of each order's device in `devices`, or -1 if the
+              device has no events or the order has no creation time.
+            - groups (list): The positions of the orders of each known device, as `(device_code, positions)` pairs.
+    """
+    order_times = orders["order_creation_time"].to_numpy(dtype="datetime64[ns]")
+    codes = device_codes(orders["device_id"], devices)
+    codes[np.isnat(order_times)] = -1
+
+    order = np.argsort(codes, kind="stable")
+    groups = [
+        (codes[group[0]], group)
+        for group in np.split(order, np.flatnonzero(np.diff(codes[order])) + 1)
+        if len(group) and codes[group[0]] >= 0
+    ]
+
+    return order_times.view("int64"), codes, groups
+
+
+def searchsorted_by_device(
+    times: np.ndarray,
+    offsets: np.ndarray,
+    groups: list,
+    values: np.ndarray,
+    side: str = "left",
+) -> np.ndarray:
+    """
+    Finds, for each value, its insertion position inside the time-sorted block of its device.
+
+    Args:
+        times (np.ndarray): The event times as int64 nanoseconds, sorted by device and time.
+        offsets (np.ndarray): The block offsets returned by `index_events_by_device`.
+        groups (list): The positions of the values of each device, as returned by `locate_orders`.
+        values (np.ndarray): The times to look up as int64 nanoseconds, one row per order.
+        side (str): Same meaning as in `np.searchsorted`, either "left" or "right".
+
+    Returns:
+        np.ndarray: The positions in `times`, with the same shape as `values`. Values of unknown devices get
+        the position 0, so any window between two of them is empty.
+    """
+    positions = np.zeros(values.shape, dtype=np.int64)
+
+    # Each device block is searched only once, for all the values of its orders
+    for code, group in groups:
+        start, end = offsets[code], offsets[code + 1]
+        positions[group] = start + np.searchsorted(
+            times[start:end], values[group], side=side
+        )
+
+    return positions
+
+
+def find_near_events_and_status(
+    orders: pd.DataFrame,
+    events_sorted: pd.DataFrame,
+    event_offsets: np.ndarray,
+    conn_status_sorted: pd.DataFrame,
+    conn_status_offsets: np.ndarray,
+    devices: pd.Index,
+) -> pd.DataFrame:
+    """
+    Finds, in a single pass over the orders of each device, the nearest preceding and following
+    polling event and the nearest previous connectivity status of each order. It gives the same
+    result as `find_near_events` followed by `find_connectivity_status`, without sorting the events again.
+
+    Args:
+        orders (pd.DataFrame): A Pandas DataFrame containing orders data. It must have the following columns:
+            - order_id
+            - device_id
+            - order_creation_time
+        events_sorted (pd.DataFrame): The polling events sorted by `index_events_by_device`.
+        event_offsets (np.ndarray): The block offsets of the polling events.
+        conn_status_sorted (pd.DataFrame): The connectivity status records sorted by `index_events_by_device`
+            with the same `devices` as the polling events.
+        conn_status_offsets (np.ndarray): The block offsets of the connectivity status records.
+        devices (pd.Index): The device IDs shared by both indexes.
+
+    Returns:
+        pd.DataFrame: A Pandas DataFrame sorted by order_creation_time, with the following columns:
+            - order_id
+            - device_id
+            - order_creation_time
+            - preceding_event
+            - following_event
+            - previous_status
+            - status_time
+    """
+    order_times, codes, groups = locate_orders(orders, devices)
+    known = codes >= 0
+
+    def nearest(df_sorted, offsets, side, columns):
+        # Takes the columns of the last record at or before each order (side="right")
+        # or of the first record at or after it (side="left"), or nulls if there is none
+        times = df_sorted["creation_time"].to_numpy(dtype="datetime64[ns]")
+        positions = searchsorted_by_device(
+            times.view("int64"), offsets, groups, order_times, side
+        )
+        if side == "right":
+            positions -= 1
+        start = np.where(known, offsets[codes], 0)
+        end = np.where(known, offsets[codes + 1], 0)
+        positions[(positions < start) | (positions >= end)] = -1
+
+        # The position -1 takes a missing value
+        return {
+            column: pd.api.extensions.take(
+                df_sorted[column].array, positions, allow_fill=True
+            )
+            for column in columns
+        }
+
+    preceding = nearest(events_sorted, event_offsets, "right", ["creation_time"])
+    following = nearest(events_sorted, event_offsets, "left", ["creation_time"])
+    status = nearest(
+        conn_status_sorted, conn_status_offsets, "right", ["status", "creation_time"]
+    )
+
+    result = pd.DataFrame(
+        {
+            "order_id": orders["order_id"].to_numpy(),
+            "device_id": orders["device_id"].array,
+            "order_creation_time": orders["order_creation_time"].to_numpy(),
+            "preceding_event": np.asarray(preceding["creation_time"]),
+            "following_event": np.asarray(following["creation_time"]),
+            "previous_status": np.asarray(status["status"], dtype=object),
+            "status_time": np.asarray(status["creation_time"]),
+        }
+    )
+
+    # Keep the row order of the merge_asof based lookups, i.e. sorted by order creation time.
+    # Orders with distinct increasing times are already in this order
+    if not (np.diff(order_times) > 0).all():
+        result = result.sort_values("order_creation_time")
+        result.index = pd.RangeIndex(len(result))
+    return result
+
+
+def indexed_events(
+    events: pd.DataFrame, time_column: str = "creation_time"
+) -> np.ndarray:
+    """
+    Finds the events `transformation` indexes with `index_events_by_device`: the events with a device ID
+    and a valid time.
+
+    Args:
+        events (pd.DataFrame): A Pandas DataFrame containing events, with the columns device_id and `time_column`.
+        time_column (str): The name of the time column.
+
+    Returns:
+        np.ndarray: A boolean mask of the indexed events.
+    """
+    return (
+        events["device_id"].notna().to_numpy()
+        & parse_timestamps(events[time_column]).notna().to_numpy()
+    )
+
+
+def polling_event_codes(
+    df: pd.DataFrame,
+    status_codes: list = STATUS_CODES,
+    error_codes: list = ERROR_CODES,
+) -> tuple:
+    """
+    Lists the status and error codes to count: the declared codes followed by any other code
+    found in the polling events.
+
+    Args:
+        df (pd.DataFrame): A DataFrame containing polling events, with the columns status_code and error_code.
+        status_codes (list): The declared status codes.
+        error_codes (list): The declared error codes.
+
+    Returns:
+        tuple: A tuple with the list of status codes and the list of error codes.
+    """
+    codes = []
+    for column, declared in [
+        ("status_code", status_codes),
+        ("error_code", error_codes),
+    ]:
+        found = set(pd.unique(df[column].dropna())) - set(declared)
+        codes.append(list(declared) + sorted(found))
+
+    return tuple(codes)
+
+
+def python_value(value):
+    """Converts a numpy scalar, e.g. a status code read as 200.0, to a Python scalar, e.g. to serialize it as JSON."""
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def time_period_bounds(time_period: list = TIME_PERIODS) -> tuple:
+    """
+    Finds how far the time periods reach before and after the order creation time.
+
+    Args:
+        time_period (list): Time periods in minutes, negative before and positive after the order creation time.
+
+    Returns:
+        tuple: A tuple with the longest time period before and the longest time period after the order,
+        as non-negative `pd.Timedelta`.
+    """
+    max_before = pd.Timedelta(minutes=-min([0] + [t for t in time_period if t < 0]))
+    max_after = pd.Timedelta(minutes=max([0] + [t for t in time_period if t > 0]))
+    return max_before, max_after
+
+
+def _code_name(code) -> str:
+    """Formats a status or error code for a column name, e.g. 200.0 -> '200' and 'GENERIC_ERROR' -> 'generic_error'."""
+    if isinstance(code, (float, np.floating)) and float(code).is_integer():
+        code = int(code)
+    return re.sub(r"\W+", "_", str(code).lower())
+
+
+def _count_names(status_codes: list, error_codes: list) -> list:
+    """Lists the count column names of one time period, without the time period suffix."""
+    return (
+        ["count_total_events"]
+        + [f"count_status_code_{_code_name(code)}" for code in status_codes]
+        + [f"count_error_{_code_name(code)}" for code in error_codes]
+        + ["count_no_error_code"]
+    )
+
+
+def time_period_suffix(t) -> str:
+    """Formats a time period for a column name, e.g. -3 -> '_before_3min' and 3 -> '_after_3min'."""
+    return f"_after_{abs(t)}min" if t > 0 else f"_before_{abs(t)}min"
+
+
+def count_columns(
+    time_period: list = TIME_PERIODS,
+    status_codes: list = STATUS_CODES,
+    error_codes: list = ERROR_CODES,
+) -> list:
+    """
+    Lists the count columns of the report, in the order they are written.
+
+    Args:
+        time_period (list): The time periods in minutes.
+        status_codes (list): The status codes to count.
+        error_codes (list): The error codes to count.
+
+    Returns:
+        list: The names of the count columns, grouped by time period.
+    """
+    names = _count_names(status_codes, error_codes)
+    return [name + time_period_suffix(t) for t in time_period for name in names]
+
+
+def encode_polling_events(
+    df: pd.DataFrame,
+    status_codes: list = STATUS_CODES,
+    error_codes: list = ERROR_CODES,
+) -> pd.DataFrame:
+    """
+    One-hot encodes the polling events into one indicator column per count of the report.
+
+    The status and error codes are converted to categoricals once, and each indicator is a
+    comparison of the integer category codes.
+
+    Args:
+        df (pd.DataFrame): A DataFrame containing polling events, with the columns status_code and error_code.
+        status_codes (list): The status codes to count, see `polling_event_codes`.
+        error_codes (list): The error codes to count, see `polling_event_codes`.
+
+    Returns:
+        pd.DataFrame: A DataFrame with the same index as `df` and the following int8 columns:
+            - count_total_events
+            - count_status_code_<code> for each status code
+            - count_error_<code> for each error code
+            - count_no_error_code
+    """
+    status = pd.Categorical(df["status_code"], categories=status_codes).codes
+    error = pd.Categorical(df["error_code"], categories=error_codes).codes
+
+    indicators = (
+        [df["status_code"].notna().to_numpy()]
+        + [status == i for i in range(len(status_codes))]
+        + [error == i for i in range(len(error_codes))]
+        + [df["error_code"].isnull().to_numpy()]
+    )
+    names = _count_names(status_codes, error_codes)
+
+    return pd.DataFrame(dict(zip(names, indicators)), index=df.index).astype(np.int8)
+
+
+def cumulative_polling_counts(
+    events_sorted: pd.DataFrame,
+    status_codes: list = STATUS_CODES,
+    error_codes: list = ERROR_CODES,
+) -> dict:
+    """
+    Computes the running counts of each type of polling event over the sorted polling events.
+
+    The number of events of a type between the positions `lower` and `upper` is then
+    `cumulative[upper] - cumulative[lower]`.
+
+    Args:
+        events_sorted (pd.DataFrame): The polling events sorted by `index_events_by_device`.
+        status_codes (list): The status codes to count, see `polling_event_codes`.
+        error_codes (list): The error codes to count, see `polling_event_codes`.
+
+    Returns:
+        dict: A dictionary mapping each count column name (without the time period suffix) to
+        an array of `len(events_sorted) + 1` running counts.
+    """
+    indicators = encode_polling_events(events_sorted, status_codes, error_codes)
+
+    return {
+        name: np.concatenate(([0], np.cumsum(indicator.to_numpy(), dtype=np.int64)))
+        for name, indicator in indicators.items()
+    }
+
+
+def count_polling_events_in_windows(
+    orders: pd.DataFrame,
+    events_sorted: pd.DataFrame,
+    devices: pd.Index,
+    offsets: np.ndarray,
+    time_period: list = TIME_PERIODS,
+    status_codes: list = STATUS_CODES,
+    error_codes: list = ERROR_CODES,
+) -> pd.DataFrame:
+    """
+    Computes the counts of polling events of each order across all the time periods in a single pass.
+
+    The bounds of every window are located with one grouped search per side. The bound at the order
+    creation time is shared by all the windows, and its running counts are read only once, so each
+    extra window only costs one more lookup per order.
+
+    Args:
+        orders (pd.DataFrame): A Pandas DataFrame containing orders data. It must have the following columns:
+            - order_id
+            - device_id
+            - order_creation_time
+        events_sorted (pd.DataFrame): The polling events sorted by `index_events_by_device`.
+        devices (pd.Index): The device IDs returned by `index_events_by_device`.
+        offsets (np.ndarray): The block offsets returned by `index_events_by_device`.
+        time_period (list): The time periods in minutes. Negative periods are counted before the order
+            creation time and positive periods after it.
+        status_codes (list): The status codes to count, see `polling_event_codes`.
+        error_codes (list): The error codes to count, see `polling_event_codes`.
+
+    Returns:
+        pd.DataFrame: A DataFrame with the order_id and, for each time period in the given order, the count
+        columns described in `count_polling_events` suffixed with `_before_<t>min` or `_after_<t>min`.
+    """
+    times = (
+        events_sorted["creation_time"].to_numpy(dtype="datetime64[ns]").view("int64")
+    )
+    order_times, _, groups = locate_orders(orders, devices)
+
+    # Windows before the order are [order + t, order] and windows after it are [order, order + t].
+    # Column 0 of the bounds is the order creation time, shared by all the windows
+    before = [t for t in time_period if t <= 0]
+    after = [t for t in time_period if t > 0]
+    window_starts = [order_times + pd.Timedelta(minutes=t).value for t in before]
+    window_ends = [order_times + pd.Timedelta(minutes=t).value for t in after]
+    with stage("window_bounds", rows_in=len(orders)):
+        left = searchsorted_by_device(
+            times, offsets, groups, np.column_stack([order_times] + window_starts)
+        )
+        right = searchsorted_by_device(
+            times,
+            offsets,
+            groups,
+            np.column_stack([order_times] + window_ends),
+            side="right",
+        )
+
+    # The running counts of one type of polling event at a time, so only one array as long as
+    # the polling events is alive on top of them
+    columns = {"order_id": orders["order_id"].to_numpy()}
+    with stage("count_windows", rows_in=len(orders)):
+        for name, indicator in encode_polling_events(
+            events_sorted, status_codes, error_codes
+        ).items():
+            counts = np.concatenate(
+                ([0], np.cumsum(indicator.to_numpy(), dtype=np.int64))
+            )
+            for i, t in enumerate(before, start=1):
+                columns[name + time_period_suffix(t)] = (
+                    counts[right[:, 0]] - counts[left[:, i]]
+                )
+            for i, t in enumerate(after, start=1):
+                columns[name + time_period_suffix(t)] = (
+                    counts[right[:, i]] - counts[left[:, 0]]
+                )
+
+    # Order the columns by time period, as the report lists them
+    df_counts = pd.DataFrame(columns)[
+        ["order_id"] + count_columns(time_period, status_codes, error_codes)
+    ]
+
+    return df_counts
+
+
+def connectivity_columns(time_period: list = TIME_PERIODS) -> list:
+    """Lists the connectivity window columns of the report, in the order they are written."""
+    return [
+        name + time_period_suffix(t)
+        for t in time_period
+        for name in ["offline_seconds", "count_connectivity_transitions"]
+    ]
+
+
+def connectivity_intervals(
+    conn_status_sorted: pd.DataFrame, offsets: np.ndarray
+) -> dict:
+    """
+    Represents the connectivity status records of each device as consecutive intervals.
+
+    Each record starts an interval with its status, which lasts until the next record of the device.
+    The last interval of a device has no end. Before its first record, a device is considered ONLINE,
+    as the records are logged when a device goes offline. A transition is a record whose OFFLINE or
+    ONLINE state differs from the state before it, so repeated records of the same status are not transitions.
+
+    Args:
+        conn_status_sorted (pd.DataFrame): The connectivity status records sorted by `index_events_by_device`.
+        offsets (np.ndarray): The block offsets of the connectivity status records.
+
+    Returns:
+        dict: A dictionary with the following arrays:
+            - time: The start of each interval as int64 nanoseconds.
+            - offline: True for the OFFLINE intervals.
+            - offline_time: The running OFFLINE duration in nanoseconds before each interval, of length
+              `len(conn_status_sorted) + 1`. Only differences inside the block of a device are meaningful.
+            - transitions: The running number of transitions before each interval, of length
+              `len(conn_status_sorted) + 1`.
+    """
+    times = (
+        conn_status_sorted["creation_time"]
+        .to_numpy(dtype="datetime64[ns]")
+        .view("int64")
+    )
+    offline = (conn_status_sorted["status"] == OFFLINE_STATUS).to_numpy(dtype=bool)
+    blocks = np.flatnonzero(np.diff(offsets) > 0)
+    first, last = offsets[blocks], offsets[blocks + 1] - 1
+
+    durations = np.diff(times, append=times[-1:])
+    durations[last] = 0
+    previous = np.concatenate(([False], offline[:-1]))
+    previous[first] = False
+
+    return {
+        "time": times,
+        "offline": offline,
+        "offline_time": np.concatenate(
+            ([0], np.cumsum(np.where(offline, durations, 0), dtype=np.int64))
+        ),
+        "transitions": np.concatenate(
+            ([0], np.cumsum(offline != previous, dtype=np.int64))
+        ),
+    }
+
+
+def connectivity_in_windows(
+    orders: pd.DataFrame,
+    conn_status_sorted: pd.DataFrame,
+    conn_status_offsets: np.ndarray,
+    devices: pd.Index,
+    time_period: list = TIME_PERIODS,
+) -> pd.DataFrame:
+    """
+    Computes how long the device of each order was OFFLINE, and how many times it went OFFLINE or back ONLINE,
+    in each time period around the order, from the intervals of `connectivity_intervals`.
+
+    The OFFLINE time up to any instant is the running OFFLINE duration at the start of the interval
+    containing it, plus the elapsed part of that interval if it is OFFLINE. The windows are the same as
+    the ones of `count_polling_events_in_windows`, and their bounds are located with one grouped search
+    per side for all the orders.
+
+    Args:
+        orders (pd.DataFrame): A Pandas DataFrame containing orders data. It must have the following columns:
+            - device_id
+            - order_creation_time
+        conn_status_sorted (pd.DataFrame): The connectivity status records sorted by `index_events_by_device`.
+        conn_status_offsets (np.ndarray): The block offsets of the connectivity status records.
+        devices (pd.Index): The device IDs returned by `index_events_by_device`.
+        time_period (list): The time periods in minutes, see `count_polling_events_in_windows`.
+
+    Returns:
+        pd.DataFrame: One row per order, in the order of `orders`, with the columns of `connectivity_columns`:
+            - offline_seconds_<period>: The seconds the device was OFFLINE in the window.
+            - count_connectivity_transitions_<period>: The number of transitions logged in the window.
+    """
+    intervals = connectivity_intervals(conn_status_sorted, conn_status_offsets)
+    order_times, codes, groups = locate_orders(orders, devices)
+
+    # Column 0 of the bounds is the order creation time, then one column per time period
+    bounds = np.column_stack(
+        [order_times]
+        + [order_times + pd.Timedelta(minutes=t).value for t in time_period]
+    )
+    times = intervals["time"]
+    left = searchsorted_by_device(times, conn_status_offsets, groups, bounds)
+    right = searchsorted_by_device(
+        times, conn_status_offsets, groups, bounds, side="right"
+    )
+
+    # Running OFFLINE time at each bound. Bounds before the first record of the device get
+    # the running time at the start of its block
+    start = np.where(codes >= 0, conn_status_offsets[np.maximum(codes, 0)], 0)[:, None]
+    interval = right - 1
+    offline_time = np.broadcast_to(intervals["offline_time"][start], bounds.shape)
+    if len(times):
+        inside = interval >= start
+        interval = np.maximum(interval, 0)
+        offline_time = np.where(
+            inside,
+            intervals["offline_time"][interval]
+            + intervals["offline"][interval] * (bounds - times[interval]),
+            offline_time,
+        )
+
+    transitions = intervals["transitions"]
+    columns = {}
+    for i, t in enumerate(time_period, start=1):
+        suffix = time_period_suffix(t)
+        # Windows before the order are [order + t, order] and windows after it are [order, order + t]
+        lower, upper = (i, 0) if t <= 0 else (0, i)
+        columns["offline_seconds" + suffix] = (
+            offline_time[:, upper] - offline_time[:, lower]
+        ) / 1e9
+        columns["count_connectivity_transitions" + suffix] = (
+            transitions[right[:, upper]] - transitions[left[:, lower]]
+        )
+
+    return pd.DataFrame(columns, index=pd.RangeIndex(len(orders)))
+
+
+def count_polling_events(
+    df: pd.DataFrame,
+    time_ref: str,
+    status_codes: list = None,
+    error_codes: list = None,
+) -> pd.DataFrame:
     """
     Computes number of pooling events related to orders in the input DataFrame
     across the already filtered period of time. The output is a DataFrame with
@@ -127,51 +906,390 @@ def count_polling_events(df: pd.DataFrame, time_ref: str) -> pd.DataFrame:
     Args:
         df (pd.DataFrame): A DataFrame containing the orders and their related polling events.
         time_ref (str): A suffix to be added to the output column names indicating the time period.
+        status_codes (list, optional): The status codes to count. Defaults to the declared codes and
+            the codes found in `df`.
+        error_codes (list, optional): The error codes to count. Defaults to the declared codes and
+            the codes found in `df`.
 
     Returns:
         pd.DataFrame: A DataFrame containing the counts for each of the 3 periods of time, with the following columns:
           - order_id: The ID of the order
           - count_total_events_{time_ref}: The total number of polling events for the order within the time period.
-          - count_status_code_0_{time_ref}: The number of polling events with a status_code of 0 within the time period.
-          - count_status_code_200_{time_ref}: The number of polling events with a status_code of 200 within the time period.
-          - count_status_code_401_{time_ref}: The number of polling events with a status_code of 401 within the time period.
-          - count_error_econnaborted_{time_ref}: The number of polling events with an error_code of 'ECONNABORTED' within the time period.
-          - count_error_generic_error_{time_ref}: The number of polling events with an error_code of 'GENERIC_ERROR' within the time period.
+          - count_status_code_<code>_{time_ref}: The number of polling events with each status_code within the time period,
+            e.g. count_status_code_200_{time_ref}.
+          - count_error_<code>_{time_ref}: The number of polling events with each error_code within the time period,
+            e.g. count_error_econnaborted_{time_ref} for 'ECONNABORTED'.
           - count_no_error_code_{time_ref}: The number of polling events with no error_code within the time period.
     """
+    found_status_codes, found_error_codes = polling_event_codes(df)
+    indicators = encode_polling_events(
+        df,
+        status_codes=found_status_codes if status_codes is None else status_codes,
+        error_codes=found_error_codes if error_codes is None else error_codes,
+    )
+
+    events_count = indicators.astype(np.int64).groupby(df["order_id"].to_numpy()).sum()
+    events_count.columns = [col + time_ref for col in events_count.columns]
+    events_count = events_count.rename_axis("order_id").reset_index()
+
+    return events_count
+
+
+def sort_report_rows(df_report: pd.DataFrame, df_orders: pd.DataFrame) -> pd.DataFrame:
+    """
+    Sorts report rows computed in parts, e.g. per chunk or per shard, in the same order
+    as the report built by `transformation` over all the orders at once.
+
+    Args:
+        df_report (pd.DataFrame): The report rows, with the columns order_id and order_creation_time.
+        df_orders (pd.DataFrame): The orders the report was computed for, in their input order.
+
+    Returns:
+        pd.DataFrame: The report rows in the input order of the orders, then sorted by order creation time.
+    """
+    # Ties of order creation time are then broken the same way as in `transformation`.
+    # Both orders are composed, so the rows are taken only once
+    order_ids = pd.Index(df_orders.loc[df_orders["device_id"].notna(), "order_id"])
+    positions = order_ids.get_indexer(df_report["order_id"]).argsort(kind="stable")
+    order_times = pd.Series(df_report["order_creation_time"].to_numpy()[positions])
+    positions = positions[order_times.sort_values().index.to_numpy()]
+
+    df_report = df_report.take(positions)
+    df_report.index = pd.RangeIndex(len(df_report))
+    return df_report
+
+
+def _report_rows(
+    df_base: pd.DataFrame,
+    events_sorted: pd.DataFrame,
+    offsets: np.ndarray,
+    conn_status_sorted: pd.DataFrame,
+    conn_status_offsets: np.ndarray,
+    devices: pd.Index,
+    time_period: list,
+    status_codes: list,
+    error_codes: list,
+    connectivity_windows: bool,
+    polling_buckets: dict,
+) -> pd.DataFrame:
+    """Computes the report rows of the orders of `df_base` from the indexed events, see `transformation`."""
+    # Gathering report information
+    with stage("find_near_events_and_status", rows_in=len(df_base)) as metrics:
+        df_stg_phase2 = find_near_events_and_status(
+            orders=df_base,
+            events_sorted=events_sorted,
+            event_offsets=offsets,
+            conn_status_sorted=conn_status_sorted,
+            conn_status_offsets=conn_status_offsets,
+            devices=devices,
+        )
+        metrics["rows_out"] = len(df_stg_phase2)
+
+    # Count the polling events of all the time periods
+    with stage("count_polling_events_in_windows", rows_in=len(df_base)) as metrics:
+        if polling_buckets is not None:
+            from src.buckets import count_polling_events_in_buckets
+
+            df_counts = count_polling_events_in_buckets(
+                orders=df_base, buckets=polling_buckets, time_period=time_period
+            )
+        else:
+            df_counts = count_polling_events_in_windows(
+                orders=df_base,
+                events_sorted=events_sorted,
+                devices=devices,
+                offsets=offsets,
+                time_period=time_period,
+                status_codes=status_codes,
+                error_codes=error_codes,
+            )
+        metrics["rows_out"] = len(df_counts)
+
+    # OFFLINE time and transitions of the connectivity status in the same windows
+    if connectivity_windows:
+        with stage("connectivity_in_windows", rows_in=len(df_base)) as metrics:
+            df_connectivity = connectivity_in_windows(
+                orders=df_base,
+                conn_status_sorted=conn_status_sorted,
+                conn_status_offsets=conn_status_offsets,
+                devices=devices,
+                time_period=time_period,
+            )
+            df_counts = pd.concat([df_counts, df_connectivity], axis=1)
+            metrics["rows_out"] = len(df_connectivity)
+
+    # Merge final information
+    with stage("merge", rows_in=len(df_stg_phase2) + len(df_counts)) as metrics:
+        df_output = pd.merge(df_stg_phase2, df_counts, on="order_id")
+        metrics["rows_out"] = len(df_output)
+
+    return df_output
+
+
+def _block_hashes(hashes: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """
+    Combines the row hashes of each block of rows into order-sensitive uint64 sums.
 
-    events_count = (
-        df.groupby("order_id")
-        .agg(
-            count_total_events=("status_code", "count"),
-            count_status_code_0=("status_code", lambda x: np.sum(x == 0)),
-            count_status_code_200=("status_code", lambda x: np.sum(x == 200)),
-            count_status_code_401=("status_code", lambda x: np.sum(x == 401)),
-            count_error_econnaborted=(
-                "error_code",
-                lambda x: np.sum(x == "ECONNABORTED"),
+    Args:
+        hashes (np.ndarray): The uint64 hash of each row, grouped in blocks.
+        offsets (np.ndarray): The rows of block `i` are `offsets[i]:offsets[i + 1]`.
+
+    Returns:
+        np.ndarray: A uint64 array with one row per block: two sums of the hashes weighted by
+        their rank in the block, and the number of rows.
+    """
+    ranks = np.arange(len(hashes), dtype=np.uint64) - np.repeat(
+        offsets[:-1], np.diff(offsets)
+    ).astype(np.uint64)
+    mixes = [
+        hashes * (2 * ranks + np.uint64(1)),
+        (hashes ^ (hashes >> np.uint64(29))) * (ranks + np.uint64(0x9E3779B97F4A7C15)),
+    ]
+    sums = []
+    for mix in mixes:
+        cumulative = np.concatenate(([np.uint64(0)], np.cumsum(mix, dtype=np.uint64)))
+        sums.append(cumulative[offsets[1:]] - cumulative[offsets[:-1]])
+
+    return np.column_stack(sums + [np.diff(offsets).astype(np.uint64)])
+
+
+def device_fingerprints(
+    df_base: pd.DataFrame,
+    codes: np.ndarray,
+    events_sorted: pd.DataFrame,
+    offsets: np.ndarray,
+    conn_status_sorted: pd.DataFrame,
+    conn_status_offsets: np.ndarray,
+) -> tuple:
+    """
+    Fingerprints the orders, polling events and connectivity status records of each device, so that
+    a device whose fingerprint is unchanged has the same report rows.
+
+    Args:
+        df_base (pd.DataFrame): The orders with a device ID.
+        codes (np.ndarray): The position of the device of each order, see `locate_orders`.
+        events_sorted (pd.DataFrame): The polling events sorted by `index_events_by_device`.
+        offsets (np.ndarray): The block offsets of the polling events.
+        conn_status_sorted (pd.DataFrame): The connectivity status records sorted by `index_events_by_device`.
+        conn_status_offsets (np.ndarray): The block offsets of the connectivity status records.
+
+    Returns:
+        tuple: A tuple with the following elements:
+            - fingerprints (np.ndarray): Two uint64 hashes per device, one row per device of the index.
+            - order_positions (np.ndarray): The positions in `df_base` of the orders with a known device,
+              grouped by device and in their input order.
+            - order_offsets (np.ndarray): The orders of device `i` are `order_positions[order_offsets[i]:order_offsets[i + 1]]`.
+    """
+    known = np.flatnonzero(codes >= 0)
+    order_positions = known[np.argsort(codes[known], kind="stable")]
+    order_offsets = np.zeros(len(offsets), dtype=np.int64)
+    np.cumsum(
+        np.bincount(codes[known], minlength=len(offsets) - 1), out=order_offsets[1:]
+    )
+
+    def row_hashes(df: pd.DataFrame) -> np.ndarray:
+        return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+    blocks = np.hstack(
+        [
+            _block_hashes(
+                row_hashes(df_base[["order_id", "order_creation_time"]])[
+                    order_positions
+                ],
+                order_offsets,
             ),
-            count_error_generic_error=(
-                "error_code",
-                lambda x: np.sum(x == "GENERIC_ERROR"),
+            _block_hashes(row_hashes(events_sorted[POLLING_EVENT_COLUMNS]), offsets),
+            _block_hashes(
+                row_hashes(conn_status_sorted[CONN_STATUS_EVENT_COLUMNS]),
+                conn_status_offsets,
             ),
-            count_no_error_code=("error_code", lambda x: np.sum(x.isnull())),
+        ]
+    )
+    df_blocks = pd.DataFrame(blocks)
+    fingerprints = np.column_stack(
+        [
+            pd.util.hash_pandas_object(df_blocks, index=False).to_numpy(),
+            pd.util.hash_pandas_object(
+                df_blocks, index=False, hash_key="device-fragments"
+            ).to_numpy(),
+        ]
+    )
+
+    return fingerprints, order_positions, order_offsets
+
+
+def report_rows_with_cache(
+    df_base: pd.DataFrame,
+    df_orders: pd.DataFrame,
+    cache_dir: str,
+    max_rows: int = MAX_REPORT_CACHE_ROWS,
+    **indexed,
+) -> pd.DataFrame:
+    """
+    Computes the report rows of the orders, reusing the rows of the devices whose orders and events did not
+    change since a previous run.
+
+    The rows of each device are cached with the fingerprint of `device_fingerprints`, in one cache entry per
+    window configuration (time periods, codes and connectivity windows) of `src.cache`. Only the devices
+    whose fingerprint is not in the cache are computed with `_report_rows`. The rows of the least recently
+    used devices are evicted above `max_rows`, and the hits and misses are logged. The order IDs must be unique.
+
+    Args:
+        df_base (pd.DataFrame): The orders with a device ID.
+        df_orders (pd.DataFrame): The orders, in their input order.
+        cache_dir (str): The cache folder.
+        max_rows (int): The maximum number of cached report rows.
+        **indexed: The indexed events and the window configuration, see `_report_rows`.
+
+    Returns:
+        pd.DataFrame: The same report as `_report_rows`.
+    """
+    config = json.dumps(
+        [
+            REPORT_CACHE_VERSION,
+            indexed["time_period"],
+            indexed["status_codes"],
+            indexed["error_codes"],
+            indexed["connectivity_windows"],
+        ],
+        default=lambda value: value.item()
+        if isinstance(value, np.generic)
+        else str(value),
+    )
+    name = "report_" + hashlib.blake2b(config.encode(), digest_size=10).hexdigest()
+
+    with stage("device_fingerprints", rows_in=len(df_base)):
+        _, codes, _ = locate_orders(df_base, indexed["devices"])
+        fingerprints, order_positions, order_offsets = device_fingerprints(
+            df_base,
+            codes,
+            indexed["events_sorted"],
+            indexed["offsets"],
+            indexed["conn_status_sorted"],
+            indexed["conn_status_offsets"],
+        )
+    n_orders = np.diff(order_offsets)
+    ordered_devices = np.flatnonzero(n_orders)
+
+    # Cached rows of a device form a block, with the orders in their input order
+    cache = load_cached(name, cache_dir)
+    hit_blocks = np.full(len(ordered_devices), -1)
+    if cache is not None and len(cache):
+        keys = cache[["fp1", "fp2"]].to_numpy()
+        block_starts = np.flatnonzero(
+            np.append(True, (keys[1:] != keys[:-1]).any(axis=1))
+        )
+        block_lengths = np.diff(np.append(block_starts, len(cache)))
+        hit_blocks = pd.MultiIndex.from_arrays(
+            [keys[block_starts, 0], keys[block_starts, 1]]
+        ).get_indexer(
+            pd.MultiIndex.from_arrays(
+                [
+                    fingerprints[ordered_devices, 0],
+                    fingerprints[ordered_devices, 1],
+                ]
+            )
+        )
+        hit_blocks[
+            (hit_blocks >= 0) & (block_lengths[hit_blocks] != n_orders[ordered_devices])
+        ] = -1
+    hits = hit_blocks >= 0
+    hit_devices, missed_devices = ordered_devices[hits], ordered_devices[~hits]
+
+    def order_rows(devices: np.ndarray) -> np.ndarray:
+        # The positions of the orders of the devices, grouped by device
+        return order_positions[
+            np.repeat(np.isin(np.arange(len(n_orders)), devices), n_orders)
+        ]
+
+    # The orders of the missed devices and of the devices without events are computed
+    missed = np.sort(
+        np.concatenate([order_rows(missed_devices), np.flatnonzero(codes < 0)])
+    )
+    frames = []
+    if len(missed) or not hits.any():
+        frames.append(_report_rows(df_base.iloc[missed], **indexed))
+    if hits.any():
+        starts, lengths = (
+            block_starts[hit_blocks[hits]],
+            block_lengths[hit_blocks[hits]],
         )
-        .reset_index()
+        cache_rows = np.repeat(
+            starts - (np.cumsum(lengths) - lengths), lengths
+        ) + np.arange(lengths.sum())
+        positions = order_rows(hit_devices)
+        value_columns = [
+            column
+            for column in cache.columns
+            if column not in ("fp1", "fp2", "last_used")
+        ]
+        df_hits = pd.DataFrame(
+            {
+                column: pd.api.extensions.take(df_base[column].array, positions)
+                for column in ORDER_COLUMNS
+            }
+            | {
+                column: pd.api.extensions.take(cache[column].array, cache_rows)
+                for column in value_columns
+            },
+            copy=False,
+        )
+        frames.append(df_hits)
+    df_report = (
+        frames[0]
+        if len(frames) == 1 and not hits.any()
+        else sort_report_rows(pd.concat(frames, ignore_index=True), df_orders)
     )
 
-    new_column_names = [
-        col + time_ref if col != "order_id" else col for col in events_count.columns
-    ]
-    events_count.columns = new_column_names
+    # New cache: the rows of the computed devices, then the hit and other cached devices by last use
+    run = 0 if cache is None or not len(cache) else int(cache["last_used"].max()) + 1
+    computed = frames[0] if len(missed) or not hits.any() else df_report.iloc[:0]
+    positions = pd.Index(df_base["order_id"]).get_indexer(computed["order_id"])
+    computed_codes = codes[positions]
+    rows = np.flatnonzero(computed_codes >= 0)
+    rows = rows[np.lexsort((positions[rows], computed_codes[rows]))]
+    df_new = computed.drop(columns=ORDER_COLUMNS).take(rows)
+    df_new.insert(0, "fp1", fingerprints[computed_codes[rows], 0])
+    df_new.insert(1, "fp2", fingerprints[computed_codes[rows], 1])
+    df_new.insert(2, "last_used", run)
+    entries = [df_new]
+    if cache is not None and len(cache):
+        last_used = cache["last_used"].to_numpy().copy()
+        last_used[cache_rows if hits.any() else []] = run
+        entries.append(cache.assign(last_used=last_used))
+    df_cache = pd.concat(entries, ignore_index=True)
+    # The most recently used rows are kept, and the blocks of a device are never split
+    keys = df_cache[["fp1", "fp2"]].to_numpy()
+    block_starts = np.flatnonzero(np.append(True, (keys[1:] != keys[:-1]).any(axis=1)))
+    block_lengths = np.diff(np.append(block_starts, len(df_cache)))
+    by_use = np.argsort(-df_cache["last_used"].to_numpy()[block_starts], kind="stable")
+    kept_blocks = np.zeros(len(block_starts), dtype=bool)
+    kept_blocks[by_use] = np.cumsum(block_lengths[by_use]) <= max_rows
+    if not kept_blocks.all():
+        df_cache = df_cache[np.repeat(kept_blocks, block_lengths)]
+    store_cached(name, df_cache.reset_index(drop=True), cache_dir)
 
-    return events_count
+    logger.info(
+        f"Report cache: {hits.sum()} devices hit, {len(missed_devices)} missed, "
+        f"{(~kept_blocks).sum()} evicted, {len(df_cache)} rows cached"
+    )
+    return df_report
 
 
 def transformation(
     df_polling: pd.DataFrame,
     df_connectivity_status: pd.DataFrame,
     df_orders: pd.DataFrame,
+    time_period: list = TIME_PERIODS,
+    status_codes: list = STATUS_CODES,
+    error_codes: list = ERROR_CODES,
+    engine: str = "pandas",
+    max_memory: int = None,
+    connectivity_windows: bool = False,
+    bucket_minutes: int = None,
+    polling_buckets: dict = None,
+    report_cache_dir: str = None,
+    report_cache_max_rows: int = MAX_REPORT_CACHE_ROWS,
 ) -> pd.DataFrame:
     """
     Applies a series of transformations to the input DataFrames in order to
@@ -186,76 +1304,355 @@ def transformation(
           a device goes offline whilst running the application
       df_orders (pd.DataFrame): Input DataFrame containing data for orders that
           have been dispatched to devices running the above web application
+      time_period (list): Time periods in minutes to count the polling events in,
+          negative before and positive after the order creation time
+      status_codes (list): Declared status codes, reported even if absent from the
+          polling events. Other status codes found in the data are added to them
+      error_codes (list): Declared error codes, reported even if absent from the
+          polling events. Other error codes found in the data are added to them
+      engine (str): "pandas", or "duckdb" to run the same report as SQL in DuckDB with
+          `transformation_duckdb`, which also accepts paths to the input files
+      max_memory (int, optional): Memory budget in bytes of the pandas engine, see
+          `transformation_within_budget`. Defaults to None, i.e. no budget
+      connectivity_windows (bool): If True, the report also has the OFFLINE seconds and
+          the number of connectivity transitions of each time period, see
+          `connectivity_in_windows`. Only supported by the pandas engine
+      bucket_minutes (int, optional): If given, the polling events are first aggregated into
+          per-device buckets of this many minutes, and the windows are counted from the buckets
+          with `count_polling_events_in_buckets`. The counts are the same
+      polling_buckets (dict, optional): Buckets of the same polling events built beforehand with
+          `bucket_polling_events`, e.g. read from a previous run with `read_polling_buckets`, to
+          count the windows from instead of aggregating the polling events again. Without the
+          report cache, `df_polling` is then not read and the nearest polling events are found
+          from the events of the buckets around the orders, see `near_polling_events`
+      report_cache_dir (str, optional): If given, the report rows of each device are cached in
+          this folder and reused by the next runs while the orders and events of the device
+          do not change, see `report_rows_with_cache`. The order IDs must be unique
+      report_cache_max_rows (int): The maximum number of report rows kept in the report
+          cache, the rows of the least recently used devices are evicted above it
 
     Returns:
       pd.DataFrame :  DataFrame with columns for order information, preceding and
       following polling events, connectivity status and polling events counts.
+
+    Raises:
+      ValueError: If the engine is unknown, if the connectivity windows are
+          requested from the duckdb engine, or if `polling_buckets` were built
+          with other status or error codes.
     """
+    if engine == "duckdb" and connectivity_windows:
+        raise ValueError("The duckdb engine does not compute the connectivity windows")
+    if engine == "duckdb":
+        from src.duckdb_engine import transformation_duckdb
 
-    # Convert creation_time to datetime
-    df_polling["creation_time"] = pd.to_datetime(
-        df_polling["creation_time"], errors="coerce"
-    )
-    df_connectivity_status["creation_time"] = pd.to_datetime(
-        df_connectivity_status["creation_time"], errors="coerce"
-    )
-    df_orders["order_creation_time"] = pd.to_datetime(
-        df_orders["order_creation_time"], errors="coerce"
-    )
+        return transformation_duckdb(
+            df_polling,
+            df_connectivity_status,
+            df_orders,
+            time_period=time_period,
+            status_codes=status_codes,
+            error_codes=error_codes,
+        )
+    if engine != "pandas":
+        raise ValueError(f"Unknown engine '{engine}'")
+    if max_memory is not None:
+        return transformation_within_budget(
+            df_polling,
+            df_connectivity_status,
+            df_orders,
+            max_memory=max_memory,
+            time_period=time_period,
+            status_codes=status_codes,
+            error_codes=error_codes,
+            connectivity_windows=connectivity_windows,
+            bucket_minutes=bucket_minutes,
+            polling_buckets=polling_buckets,
+            report_cache_dir=report_cache_dir,
+            report_cache_max_rows=report_cache_max_rows,
+        )
 
-    # Sort dataframes by time
-    df_polling = df_polling.sort_index().sort_index(axis=1)
-    df_connectivity_status = df_connectivity_status.sort_index(axis=1)
-    df_orders = df_orders.sort_index().sort_index(axis=1)
+    # With polling buckets, the polling events that can be the nearest events of the orders are taken
+    # from the buckets instead of sorting all the polling events. The report cache fingerprints all the
+    # events of each device, so it still needs them
+    near_events_only = polling_buckets is not None and not report_cache_dir
 
-    # Create base of orders for the output df
-    df_base = df_orders[["order_id", "device_id", "order_creation_time"]]
+    # Convert creation_time to datetime. The inputs are not modified: the other columns
+    # are shared with shallow copies
+    with stage("parse_timestamps"):
+        if not near_events_only:
+            df_polling = _replace_column(
+                df_polling,
+                "creation_time",
+                parse_timestamps(df_polling["creation_time"]),
+            )
+        df_connectivity_status = _replace_column(
+            df_connectivity_status,
+            "creation_time",
+            parse_timestamps(df_connectivity_status["creation_time"]),
+        )
+        df_orders = _replace_column(
+            df_orders,
+            "order_creation_time",
+            parse_timestamps(df_orders["order_creation_time"]),
+        )
 
-    # Drop orders that don't have a corresponding device_id
-    df_base = df_base[df_base["device_id"].notna()]
+    # Events with the same device and time are kept in their input order
+    if not df_polling.index.is_monotonic_increasing:
+        df_polling = df_polling.sort_index()
+    if not df_orders.index.is_monotonic_increasing:
+        df_orders = df_orders.sort_index()
 
-    # Gathering report information
-    df_stg_phase1 = find_near_events(orders=df_base, events=df_polling)
-    df_stg_phase2 = find_connectivity_status(
-        orders=df_stg_phase1, conn_status=df_connectivity_status
-    )
+    # Base of orders for the output df, without the orders that don't have a corresponding device_id
+    df_base = df_orders.loc[
+        df_orders["device_id"].notna(), ["order_id", "device_id", "order_creation_time"]
+    ]
+    if near_events_only:
+        from src.buckets import near_polling_events
 
-    # Merge original orders base with pooling events to perform the counts
-    df_merged = pd.merge(df_base, df_polling, on="device_id")
-
-    # Define time periods and compute the counts on the data filtered by time
-    time_period = [-3, 3, -60]
-    df_counts = df_base[["order_id"]]
-
-    for t in time_period:
-        if t > 0:
-            ref = f"_after_{abs(t)}min"
-            merged_df_filtered = df_merged[
-                (df_merged["creation_time"] >= df_merged["order_creation_time"])
-                & (
-                    df_merged["creation_time"]
-                    <= df_merged["order_creation_time"] + dt.timedelta(minutes=t)
-                )
-            ]
-        else:
-            ref = f"_before_{abs(t)}min"
-            merged_df_filtered = df_merged[
-                (
-                    df_merged["creation_time"]
-                    >= df_merged["order_creation_time"] + dt.timedelta(minutes=t)
-                )
-                & (df_merged["creation_time"] <= df_merged["order_creation_time"])
+        with stage("near_polling_events", rows_in=len(df_base)) as metrics:
+            df_polling = near_polling_events(df_base, polling_buckets)
+            metrics["rows_out"] = len(df_polling)
+
+    # Sort the polling and connectivity events once, grouped by the same device index
+    with stage(
+        "index_events_by_device",
+        rows_in=len(df_polling) + len(df_connectivity_status),
+    ) as metrics:
+        devices = device_index(
+            df_polling["device_id"], df_connectivity_status["device_id"]
+        )
+        events_sorted, devices, offsets = index_events_by_device(
+            df_polling,
+            devices=devices,
+            columns=["creation_time"] if near_events_only else POLLING_EVENT_COLUMNS,
+        )
+        conn_status_sorted, _, conn_status_offsets = index_events_by_device(
+            df_connectivity_status, devices=devices, columns=CONN_STATUS_EVENT_COLUMNS
+        )
+        metrics["rows_out"] = len(events_sorted) + len(conn_status_sorted)
+
+    if near_events_only:
+        # The codes found in the polling events are the codes of the buckets
+        status_codes, error_codes = (
+            list(declared) + sorted(set(found) - set(declared))
+            for declared, found in [
+                (status_codes, polling_buckets["status_codes"]),
+                (error_codes, polling_buckets["error_codes"]),
             ]
+        )
+    else:
+        status_codes, error_codes = polling_event_codes(
+            events_sorted, status_codes=status_codes, error_codes=error_codes
+        )
+    if polling_buckets is None and bucket_minutes:
+        from src.buckets import bucket_sorted_events
 
-        count_events = count_polling_events(df=merged_df_filtered, time_ref=ref)
+        with stage("bucket_polling_events", rows_in=len(events_sorted)) as metrics:
+            polling_buckets = bucket_sorted_events(
+                events_sorted,
+                devices,
+                offsets,
+                bucket_minutes=bucket_minutes,
+                status_codes=status_codes,
+                error_codes=error_codes,
+            )
+            metrics["rows_out"] = len(polling_buckets["bucket_start"])
+    if polling_buckets is not None and (
+        polling_buckets["status_codes"],
+        polling_buckets["error_codes"],
+    ) != (status_codes, error_codes):
+        raise ValueError(
+            "The polling buckets were built with other status or error codes"
+        )
 
-        df_counts = pd.merge(
-            df_counts, count_events, how="left", left_on="order_id", right_on="order_id"
+    indexed = dict(
+        events_sorted=events_sorted,
+        offsets=offsets,
+        conn_status_sorted=conn_status_sorted,
+        conn_status_offsets=conn_status_offsets,
+        devices=devices,
+        time_period=time_period,
+        status_codes=status_codes,
+        error_codes=error_codes,
+        connectivity_windows=connectivity_windows,
+        polling_buckets=polling_buckets,
+    )
+    if report_cache_dir:
+        return report_rows_with_cache(
+            df_base,
+            df_orders,
+            report_cache_dir,
+            max_rows=report_cache_max_rows,
+            **indexed,
         )
+    return _report_rows(df_base, **indexed)
 
-    df_counts.iloc[:, 1:] = df_counts.iloc[:, 1:].fillna(0).astype(int)
 
-    # Merge final information
-    df_output = pd.merge(df_stg_phase2, df_counts, on="order_id")
+def estimate_memory(
+    df_polling: pd.DataFrame,
+    df_connectivity_status: pd.DataFrame,
+    df_orders: pd.DataFrame,
+    n_count_columns: int,
+) -> int:
+    """
+    Estimates the memory `transformation` allocates on top of its inputs.
 
-    return df_output
+    Args:
+        df_polling (pd.DataFrame): Input DataFrame containing polling events.
+        df_connectivity_status (pd.DataFrame): Input DataFrame containing internet connectivity status logs.
+        df_orders (pd.DataFrame): Input DataFrame containing data for orders.
+        n_count_columns (int): The number of count columns of the report.
+
+    Returns:
+        int: The estimated peak memory in bytes.
+    """
+    n_events = len(df_polling) + len(df_connectivity_status)
+    # The 7 columns of the order and the nearest events and status, then the counts
+    n_report_values = len(df_orders) * (7 + n_count_columns)
+
+    return n_events * EVENT_BYTES + n_report_values * REPORT_VALUE_BYTES
+
+
+def _row_blocks(n_rows: int) -> list:
+    """Splits the positions of `n_rows` rows into (start, end) blocks of at most `BLOCK_ROWS` rows."""
+    return [
+        (start, min(start + BLOCK_ROWS, n_rows))
+        for start in range(0, n_rows, BLOCK_ROWS)
+    ]
+
+
+def _shard_by_device_in_blocks(df: pd.DataFrame, n_shards: int) -> list:
+    """Runs `shard_by_device` on blocks of rows, so that its hash table is not as long as `df`."""
+    # Imported here, as src.parallel imports this module
+    from src.parallel import shard_by_device
+
+    shards = [[np.zeros(0, dtype=np.int64)] for _ in range(n_shards)]
+    for start, end in _row_blocks(len(df)):
+        for positions, block in zip(
+            shards, shard_by_device(df.iloc[start:end], n_shards)
+        ):
+            positions.append(start + block)
+
+    return [np.concatenate(positions) for positions in shards]
+
+
+def transformation_within_budget(
+    df_polling: pd.DataFrame,
+    df_connectivity_status: pd.DataFrame,
+    df_orders: pd.DataFrame,
+    max_memory: int,
+    time_period: list = TIME_PERIODS,
+    status_codes: list = STATUS_CODES,
+    error_codes: list = ERROR_CODES,
+    connectivity_windows: bool = False,
+    bucket_minutes: int = None,
+    polling_buckets: dict = None,
+    report_cache_dir: str = None,
+    report_cache_max_rows: int = MAX_REPORT_CACHE_ROWS,
+) -> pd.DataFrame:
+    """
+    Builds the same report as `transformation` while trying to allocate at most `max_memory` bytes.
+
+    When the memory estimated by `estimate_memory` exceeds the budget, the inputs are hash-partitioned
+    by device ID, as in `transformation_parallel`, and the shards are transformed one after the other.
+    The peak memory allocated during the run is traced with `tracemalloc` and logged against the budget.
+
+    Args:
+        df_polling (pd.DataFrame): Input DataFrame containing polling events.
+        df_connectivity_status (pd.DataFrame): Input DataFrame containing internet connectivity status logs.
+        df_orders (pd.DataFrame): Input DataFrame containing data for orders.
+        max_memory (int): The memory budget in bytes, on top of the inputs.
+        time_period (list): Time periods in minutes, see `transformation`.
+        status_codes (list): Declared status codes, see `transformation`.
+        error_codes (list): Declared error codes, see `transformation`.
+        connectivity_windows (bool): If True, adds the connectivity window columns, see `transformation`.
+        bucket_minutes (int, optional): Counts the windows from buckets, see `transformation`.
+        polling_buckets (dict, optional): Buckets built beforehand, see `transformation`.
+        report_cache_dir (str, optional): The cache folder of the device report rows, see `transformation`.
+        report_cache_max_rows (int): The maximum number of cached report rows, see `transformation`.
+
+    Returns:
+        pd.DataFrame: The report, with the rows and columns in the same order as `transformation`.
+    """
+    # The codes and the shards are found one block of rows at a time, so that their hash tables
+    # are not as long as the inputs. Every shard counts the codes found in all the polling events
+    # the transformation indexes, so they have the same columns
+    code_columns = ["status_code", "error_code"]
+    distinct_codes = pd.concat(
+        [df_polling.iloc[:0][code_columns]]
+        + [
+            block.loc[indexed_events(block), code_columns].drop_duplicates()
+            for block in (
+                df_polling.iloc[start:end]
+                for start, end in _row_blocks(len(df_polling))
+            )
+        ]
+    )
+    status_codes, error_codes = polling_event_codes(
+        distinct_codes, status_codes=status_codes, error_codes=error_codes
+    )
+    kwargs = dict(
+        time_period=time_period,
+        status_codes=status_codes,
+        error_codes=error_codes,
+        connectivity_windows=connectivity_windows,
+        bucket_minutes=bucket_minutes,
+        polling_buckets=polling_buckets,
+        report_cache_dir=report_cache_dir,
+        report_cache_max_rows=report_cache_max_rows,
+    )
+    n_count_columns = len(count_columns(time_period, status_codes, error_codes))
+    estimate = estimate_memory(
+        df_polling, df_connectivity_status, df_orders, n_count_columns
+    )
+    # A device is never split, so there are at most as many shards as devices with orders
+    n_shards = max(1, min(-(-estimate // max_memory), df_orders["device_id"].nunique()))
+
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.reset_peak()
+    else:
+        tracemalloc.start()
+    try:
+        if n_shards == 1 or df_orders.empty:
+            df_report = transformation(
+                df_polling, df_connectivity_status, df_orders, **kwargs
+            )
+        else:
+            logger.info(
+                f"Estimated memory {estimate / 2**20:.1f} MiB exceeds the budget of "
+                f"{max_memory / 2**20:.1f} MiB, transforming {n_shards} device shards"
+            )
+            frames = (df_polling, df_connectivity_status, df_orders)
+            shard_positions = [
+                _shard_by_device_in_blocks(df, n_shards) for df in frames
+            ]
+            reports = [
+                transformation(
+                    *[
+                        df.iloc[positions[shard]]
+                        for df, positions in zip(frames, shard_positions)
+                    ],
+                    **kwargs,
+                )
+                for shard in range(n_shards)
+                if len(shard_positions[2][shard])
+            ]
+            df_report = sort_report_rows(
+                pd.concat(reports, ignore_index=True), df_orders
+            )
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        if not tracing:
+            tracemalloc.stop()
+
+    message = (
+        f"Peak memory of the transformation {peak / 2**20:.1f} MiB "
+        f"for a budget of {max_memory / 2**20:.1f} MiB"
+    )
+    if peak > max_memory:
+        logger.warning(message)
+    else:
+        logger.info(message)
+
+    return df_report
@@ -0,0 +1,119 @@
+import sys
+
+sys.path.insert(0, ".")
+
+import numpy as np
+import pandas as pd
+import pytest
+from src.buckets import (
+    bucket_polling_events,
+    cached_polling_buckets,
+    read_polling_buckets,
+    write_polling_buckets,
+)
+from src.metrics import collect_metrics
+from src.transform import transformation
+
+
+def read_sample_inputs() -> tuple:
+    """Reads the sample inputs, with some orders on a bucket edge."""
+    df_polling = pd.read_csv("test/resources/sample_polling.csv")
+    df_conn_status = pd.read_csv("test/resources/sample_connectivity_status.csv")
+    df_orders = pd.read_csv("test/resources/sample_orders.csv")
+    order_times = pd.to_datetime(df_orders["order_creation_time"])
+    df_orders["order_creation_time"] = order_times.where(
+        df_orders.index % 2 == 0, order_times.dt.floor("min")
+    )
+    return df_polling, df_conn_status, df_orders
+
+
+@pytest.mark.parametrize("bucket_minutes", [1, 2, 7])
+@pytest.mark.parametrize("time_period", [[-3, 3, -60], [-1, 1, 5, -90]])
+def test_transformation_with_buckets(bucket_minutes, time_period):
+    """
+    Test that the report counted from buckets is the same as the report counted from the polling events,
+    for buckets longer and shorter than the windows.
+    """
+    # data
+    df_polling, df_conn_status, df_orders = read_sample_inputs()
+    # expected
+    expected = transformation(
+        df_polling, df_conn_status, df_orders, time_period=time_period
+    )
+    # computed
+    computed = transformation(
+        df_polling,
+        df_conn_status,
+        df_orders,
+        time_period=time_period,
+        bucket_minutes=bucket_minutes,
+    )
+    # tests
+    pd.testing.assert_frame_equal(computed, expected)
+
+
+def test_polling_buckets_reused(tmp_path):
+    """
+    Test that buckets written to a folder or cached for a polling file give the same report,
+    that the cached buckets are read on the next run and that fewer buckets than events are counted.
+    """
+    # data
+    df_polling, df_conn_status, df_orders = read_sample_inputs()
+    path_polling = str(tmp_path / "polling.csv")
+    df_polling.to_csv(path_polling, index=False)
+    cache_dir = str(tmp_path / "cache")
+    # expected
+    expected = transformation(df_polling, df_conn_status, df_orders)
+    # computed
+    buckets = bucket_polling_events(df_polling, bucket_minutes=5)
+    written = read_polling_buckets(
+        write_polling_buckets(buckets, str(tmp_path / "buckets"))
+    )
+    cached = cached_polling_buckets(path_polling, df_polling, 5, cache_dir=cache_dir)
+    cached_again = cached_polling_buckets(
+        path_polling, df_polling.iloc[:0], 5, cache_dir=cache_dir
+    )
+    # tests
+    assert len(buckets["bucket_start"]) < len(df_polling) / 2
+    for polling_buckets in [written, cached, cached_again]:
+        computed = transformation(
+            df_polling, df_conn_status, df_orders, polling_buckets=polling_buckets
+        )
+        pd.testing.assert_frame_equal(computed, expected)
+    with pytest.raises(ValueError):
+        transformation(
+            df_polling,
+            df_conn_status,
+            df_orders,
+            status_codes=[500],
+            polling_buckets=buckets,
+        )
+
+
+def test_transformation_with_buckets_indexes_near_events_only(tmp_path):
+    """
+    Test that with cached buckets, the report is computed from the memory-mapped events of the buckets
+    around the orders instead of indexing all the polling events.
+    """
+    # data
+    df_polling, df_conn_status, df_orders = read_sample_inputs()
+    path_polling = str(tmp_path / "polling.csv")
+    df_polling.to_csv(path_polling, index=False)
+    cache_dir = str(tmp_path / "cache")
+    cached_polling_buckets(path_polling, df_polling, 1, cache_dir=cache_dir)
+    buckets = cached_polling_buckets(path_polling, df_polling, 1, cache_dir=cache_dir)
+    # expected
+    expected = transformation(df_polling, df_conn_status, df_orders)
+    # computed
+    with collect_metrics() as records:
+        computed = transformation(
+            df_polling, df_conn_status, df_orders, polling_buckets=buckets
+        )
+    rows_out = {record["stage"]: record["rows_out"] for record in records}
+    # tests
+    pd.testing.assert_frame_equal(computed, expected)
+    assert isinstance(buckets["event_time"].base, np.memmap)
+    assert rows_out["near_polling_events"] < len(df_polling) / 10
+    assert rows_out["index_events_by_device"] == rows_out["near_polling_events"] + len(
+        df_conn_status
+    )
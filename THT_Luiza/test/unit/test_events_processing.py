@@ -0,0 +1,61 @@
+import sys
+
+sys.path.insert(0, ".")
+
+import glob
+import os
+import pstats
+import pandas as pd
+import pytest
+from events_processing import main
+from src.transform import transformation
+
+
+@pytest.fixture
+def inputs(tmp_path, monkeypatch):
+    """Copies the sample inputs to `data/input` in a temporary working directory."""
+    df_polling = pd.read_csv("test/resources/sample_polling.csv")
+    df_conn_status = pd.read_csv("test/resources/sample_connectivity_status.csv")
+    df_orders = pd.read_csv("test/resources/sample_orders.csv")
+    os.makedirs(tmp_path / "data" / "input")
+    os.makedirs(tmp_path / "data" / "output")
+    # The streaming mode reads the polling events ordered by creation time
+    df_polling.sort_values("creation_time", kind="stable").to_csv(
+        tmp_path / "data" / "input" / "polling.csv", index=False
+    )
+    df_conn_status.to_csv(
+        tmp_path / "data" / "input" / "connectivity_status.csv", index=False
+    )
+    df_orders.to_csv(tmp_path / "data" / "input" / "orders.csv", index=False)
+    monkeypatch.chdir(tmp_path)
+    return df_polling, df_conn_status, df_orders
+
+
+@pytest.mark.parametrize(
+    "mode", [{"workers": 2}, {"incremental": True}, {"chunksize": 1000}]
+)
+def test_main_duckdb_engine_runs_other_modes_with_pandas(inputs, mode):
+    """
+    Test that the streaming, parallel and incremental modes still read the inputs with pandas
+    when the duckdb engine is asked for, and write the report of all the orders.
+    """
+    pytest.importorskip("duckdb")
+    # expected
+    expected = transformation(*inputs)
+    # computed
+    main(engine="duckdb", cache=False, **mode)
+    (output_path,) = glob.glob("data/output/events_report*.csv")
+    computed = pd.read_csv(output_path)
+    # tests
+    assert computed["order_id"].tolist() == expected["order_id"].tolist()
+
+
+def test_main_profile_path_in_new_folder(inputs):
+    """
+    Test that the profile stats are dumped to a folder that does not exist yet.
+    """
+    # computed
+    main(profile_path="data/profiles/main.prof")
+    stats = pstats.Stats("data/profiles/main.prof")
+    # tests
+    assert stats.total_calls > 0
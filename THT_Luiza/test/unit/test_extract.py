@@ -2,8 +2,14 @@ import sys
 
 sys.path.insert(0, ".")
 
+import os
+import shutil
+from unittest import mock
+import pandas as pd
 import pytest
+from src.cache import evict
 from src.extract import extract
+from src.transform import transformation
 
 
 def test_extract_path_not_exist():
@@ -18,3 +24,119 @@ def test_extract_path_not_exist():
         extract(path_polling=path, path_conn_status=path, path_orders=path)
 
     assert str(e.value) == f"The data path '{path}' does not exist"
+
+
+def test_extract_typed_shares_device_dictionary():
+    """
+    Test that the typed extraction encodes the device IDs with the same dictionary in the 3 DataFrames,
+    and that the report built from the typed DataFrames is the same.
+    """
+    # data
+    paths = dict(
+        path_polling="test/resources/sample_polling.csv",
+        path_conn_status="test/resources/sample_connectivity_status.csv",
+        path_orders="test/resources/sample_orders.csv",
+    )
+    # computed
+    df_polling, df_conn_status, df_orders = extract(**paths, typed=True)
+    # tests
+    assert df_polling["device_id"].dtype == df_conn_status["device_id"].dtype
+    assert df_polling["device_id"].dtype == df_orders["device_id"].dtype
+    assert df_polling["creation_time"].dtype == "int64"
+    assert isinstance(df_polling["error_code"].dtype, pd.CategoricalDtype)
+    assert transformation(df_polling, df_conn_status, df_orders).to_csv(
+        index=False
+    ) == transformation(*extract(**paths)).to_csv(index=False)
+
+
+@pytest.mark.parametrize("extension", ["parquet", "arrow"])
+def test_extract_columnar_files(tmp_path, extension):
+    """
+    Test that Parquet and Arrow IPC inputs are picked by their extension and give the same report
+    as the CSV inputs.
+    """
+    pytest.importorskip("pyarrow")
+    # data
+    paths = {}
+    for argument, name in [
+        ("path_polling", "polling"),
+        ("path_conn_status", "connectivity_status"),
+        ("path_orders", "orders"),
+    ]:
+        df = pd.read_csv(f"test/resources/sample_{name}.csv")
+        paths[argument] = str(tmp_path / f"{name}.{extension}")
+        if extension == "parquet":
+            df.to_parquet(paths[argument])
+        else:
+            df.to_feather(paths[argument])
+    # expected
+    expected = transformation(
+        *extract(
+            path_polling="test/resources/sample_polling.csv",
+            path_conn_status="test/resources/sample_connectivity_status.csv",
+            path_orders="test/resources/sample_orders.csv",
+        )
+    )
+    # computed
+    computed = transformation(*extract(**paths))
+    # tests
+    assert computed.to_csv(index=False) == expected.to_csv(index=False)
+
+
+def test_extract_concurrent():
+    """
+    Test that the concurrent extraction returns the same DataFrames, in the same order,
+    as the sequential extraction.
+    """
+    # data
+    paths = dict(
+        path_polling="test/resources/sample_polling.csv",
+        path_conn_status="test/resources/sample_connectivity_status.csv",
+        path_orders="test/resources/sample_orders.csv",
+    )
+    # expected
+    expected = extract(**paths)
+    # computed
+    computed = extract(**paths, concurrent=True)
+    # tests
+    for df_computed, df_expected in zip(computed, expected):
+        pd.testing.assert_frame_equal(df_computed, df_expected, check_like=True)
+
+
+def test_extract_cache(tmp_path):
+    """
+    Test that the cached extraction gives the same typed DataFrames, that the second extraction
+    reads the cache, that the files read untyped are cached apart, that a changed file is parsed again
+    and that the cache is evicted above its size.
+    """
+    # data
+    paths = {}
+    for argument, name in [
+        ("path_polling", "polling"),
+        ("path_conn_status", "connectivity_status"),
+        ("path_orders", "orders"),
+    ]:
+        paths[argument] = str(tmp_path / f"{name}.csv")
+        shutil.copy(f"test/resources/sample_{name}.csv", paths[argument])
+    cache_dir = str(tmp_path / "cache")
+    # expected
+    expected = extract(**paths, typed=True)
+    # computed
+    first = extract(**paths, typed=True, cache_dir=cache_dir)
+    cached = sorted(os.listdir(cache_dir))
+    with mock.patch("src.extract.read_table") as read_table:
+        second = extract(**paths, typed=True, cache_dir=cache_dir)
+    untyped = extract(**paths, cache_dir=cache_dir)
+    df_orders = pd.read_csv(paths["path_orders"]).iloc[:10]
+    df_orders.to_csv(paths["path_orders"], index=False)
+    third = extract(**paths, typed=True, cache_dir=cache_dir)
+    # tests
+    for computed in [first, second]:
+        for df_computed, df_expected in zip(computed, expected):
+            pd.testing.assert_frame_equal(df_computed, df_expected)
+    assert read_table.call_count == 0
+    assert len([name for name in cached if name.endswith(".pkl")]) == 3
+    assert untyped[0]["device_id"].dtype == object
+    assert len(third[2]) == 10
+    assert len(evict(cache_dir, max_bytes=0)) == 7
+    assert not [name for name in os.listdir(cache_dir) if name.endswith(".pkl")]
@@ -0,0 +1,171 @@
+import sys
+
+sys.path.insert(0, ".")
+
+import pandas as pd
+from pandas.testing import assert_frame_equal
+from src.incremental import read_state, transformation_incremental, write_state
+from src.transform import transformation
+
+
+def test_transformation_incremental_matches_full_run(tmp_path):
+    """
+    Test that a report updated in two incremental runs, the second one with more orders and
+    polling events, is the same as the report computed over all the inputs at once.
+    """
+    # data
+    df_polling = pd.read_csv("test/resources/sample_polling.csv")
+    df_conn_status = pd.read_csv("test/resources/sample_connectivity_status.csv")
+    df_orders = pd.read_csv("test/resources/sample_orders.csv")
+    split_time = "2020-02-26 21:00:00"
+    path_state = str(tmp_path / "state.json")
+
+    # expected
+    expected = transformation(df_polling.copy(), df_conn_status, df_orders.copy())
+
+    # computed: first run on the inputs until the split time, then on all the inputs
+    df_report, state = transformation_incremental(
+        df_polling=df_polling[df_polling["creation_time"] < split_time],
+        df_connectivity_status=df_conn_status,
+        df_orders=df_orders[df_orders["order_creation_time"] < split_time],
+    )
+    write_state(path_state, state)
+    df_report.to_csv(tmp_path / "events_report.csv", index=False)
+
+    computed, state = transformation_incremental(
+        df_polling=df_polling,
+        df_connectivity_status=df_conn_status,
+        df_orders=df_orders,
+        df_report=pd.read_csv(tmp_path / "events_report.csv"),
+        state=read_state(path_state),
+    )
+
+    # tests
+    assert len(read_state(path_state)["open_order_ids"]) < len(df_report)
+    assert_frame_equal(computed, expected)
+
+
+def test_transformation_incremental_closes_orders_of_silent_devices():
+    """
+    Test that the order of a device that never polls again stays open without a following event
+    only until it is older than the maximum open time.
+    """
+    # data
+    df_polling = pd.DataFrame(
+        {
+            "creation_time": [
+                "2020-02-26 10:00:00",
+                "2020-02-26 10:01:00",
+                "2020-02-26 10:00:00",
+                "2020-02-26 10:30:00",
+                "2020-02-26 12:00:00",
+            ],
+            "device_id": ["silent", "silent", "active", "active", "active"],
+            "error_code": [None] * 5,
+            "status_code": [200] * 5,
+        }
+    )
+    df_conn_status = pd.DataFrame(
+        {
+            "creation_time": ["2020-02-26 09:00:00"],
+            "status": ["ONLINE"],
+            "device_id": ["silent"],
+        }
+    )
+    df_orders = pd.DataFrame(
+        {
+            "order_id": [1],
+            "device_id": ["silent"],
+            "order_creation_time": ["2020-02-26 10:02:00"],
+        }
+    )
+    is_first_run = df_polling["creation_time"] <= "2020-02-26 10:30:00"
+
+    # expected
+    expected_open_order_ids = [[1], [1], []]
+
+    # computed: a first run, then a run two hours later with the default and a one hour maximum open time
+    df_report, state = transformation_incremental(
+        df_polling=df_polling[is_first_run],
+        df_connectivity_status=df_conn_status,
+        df_orders=df_orders,
+    )
+    computed = [state["open_order_ids"]]
+    for max_open_minutes in [24 * 60, 60]:
+        computed_report, computed_state = transformation_incremental(
+            df_polling=df_polling,
+            df_connectivity_status=df_conn_status,
+            df_orders=df_orders,
+            df_report=df_report,
+            state=state,
+            max_open_minutes=max_open_minutes,
+        )
+        computed.append(computed_state["open_order_ids"])
+
+    # tests
+    assert computed == expected_open_order_ids
+    assert computed_report["following_event"].isna().all()
+    assert computed_report["preceding_event"].tolist() == [
+        pd.Timestamp("2020-02-26 10:01:00")
+    ]
+
+
+def test_transformation_incremental_keeps_the_codes_of_the_persisted_report(tmp_path):
+    """
+    Test that the open orders computed again count the codes of the persisted report, even when their
+    devices have no event with these codes, so the count columns keep their order.
+    """
+    # data
+    df_polling = pd.DataFrame(
+        {
+            "creation_time": [
+                "2020-02-26 10:00:00",
+                "2020-02-26 10:05:00",
+                "2020-02-26 10:00:00",
+                "2020-02-26 10:10:00",
+                "2020-02-26 10:20:00",
+            ],
+            "device_id": ["a", "a", "b", "b", "b"],
+            "error_code": [None] * 5,
+            "status_code": [503, 200, 200, 200, 200],
+        }
+    )
+    df_conn_status = pd.DataFrame(
+        {
+            "creation_time": ["2020-02-26 09:00:00"] * 2,
+            "status": ["ONLINE"] * 2,
+            "device_id": ["a", "b"],
+        }
+    )
+    df_orders = pd.DataFrame(
+        {
+            "order_id": [1, 2],
+            "device_id": ["a", "b"],
+            "order_creation_time": ["2020-02-26 10:02:00", "2020-02-26 10:09:00"],
+        }
+    )
+    path_state = str(tmp_path / "state.json")
+
+    # expected
+    expected = transformation(df_polling.copy(), df_conn_status, df_orders.copy())
+
+    # computed: the order of "b" is still open after the first run
+    df_report, state = transformation_incremental(
+        df_polling=df_polling.iloc[:4],
+        df_connectivity_status=df_conn_status,
+        df_orders=df_orders,
+    )
+    write_state(path_state, state)
+    df_report.to_csv(tmp_path / "events_report.csv", index=False)
+
+    computed, state = transformation_incremental(
+        df_polling=df_polling,
+        df_connectivity_status=df_conn_status,
+        df_orders=df_orders,
+        df_report=pd.read_csv(tmp_path / "events_report.csv"),
+        state=read_state(path_state),
+    )
+
+    # tests
+    assert read_state(path_state)["open_order_ids"] == [2]
+    assert_frame_equal(computed, expected)
@@ -0,0 +1,63 @@
+import sys
+
+sys.path.insert(0, ".")
+
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+from src.index import build_event_index, load_event_index, lookup_order
+from src.transform import transformation
+
+
+@pytest.mark.parametrize("time_period", [[-3, 3, -60, 10], [-1.5, 0.5, -59.75]])
+def test_lookup_order_matches_transformation(tmp_path, time_period):
+    """
+    Test that the report rows looked up one order at a time in the event index are the
+    rows of the report computed by `transformation`, also for fractional minutes.
+    """
+    # data
+    df_polling = pd.read_csv("test/resources/sample_polling.csv")
+    df_conn_status = pd.read_csv("test/resources/sample_connectivity_status.csv")
+    df_orders = pd.read_csv("test/resources/sample_orders.csv")
+
+    # expected
+    expected = transformation(
+        df_polling.copy(), df_conn_status.copy(), df_orders.copy(), time_period
+    )
+
+    # computed
+    build_event_index(df_polling, df_conn_status, str(tmp_path / "index"))
+    index = load_event_index(str(tmp_path / "index"))
+    computed = pd.DataFrame(
+        [
+            lookup_order(index, *order, time_period=time_period)
+            for order in expected[["order_id", "device_id", "order_creation_time"]]
+            .astype({"order_creation_time": str})
+            .itertuples(index=False)
+        ]
+    )
+
+    # tests
+    assert_frame_equal(computed, expected)
+
+
+def test_lookup_order_unknown_device(tmp_path):
+    """
+    Test that an order of a device without events has no events, no status and counts of 0.
+    """
+    # data
+    df_polling = pd.read_csv("test/resources/sample_polling.csv")
+    df_conn_status = pd.read_csv("test/resources/sample_connectivity_status.csv")
+
+    # computed
+    build_event_index(df_polling, df_conn_status, str(tmp_path / "index"))
+    computed = lookup_order(
+        load_event_index(str(tmp_path / "index")),
+        1,
+        "unknown-device",
+        "2020-02-26 19:31:29",
+    )
+
+    # tests
+    assert pd.isna(computed["preceding_event"]) and pd.isna(computed["status_time"])
+    assert computed["count_total_events_before_60min"] == 0
@@ -1,4 +1,5 @@
 import sys
+import gzip
 import os
 import pandas as pd
 import pytest
@@ -41,3 +42,64 @@ def test_if_exception_if_df_empty():
         load(df=df, path_to_write=path_to_write)
 
     assert str(e.value) == "The dataframe is empty"
+
+
+def test_if_parquet_is_written_with_encoded_device_id(tmp_path):
+    """Test that a report path ending with .parquet is written as Parquet with a dictionary-encoded device_id."""
+    pytest.importorskip("pyarrow")
+    # data
+    path_to_write = str(tmp_path / "events_report.parquet")
+    df = pd.DataFrame(
+        [
+            {"order_id": 1, "device_id": "device-1", "count_total_events_": 2},
+            {"order_id": 2, "device_id": "device-1", "count_total_events_": 0},
+        ]
+    )
+    # call the function
+    load(df=df, path_to_write=path_to_write)
+    # tests
+    df_written = pd.read_parquet(path_to_write)
+    assert isinstance(df_written["device_id"].dtype, pd.CategoricalDtype)
+    assert df_written.astype({"device_id": object}).equals(df)
+
+
+def test_csv_is_written_in_chunks_and_compressed(tmp_path):
+    """Test that the report written in chunks, with and without gzip, has the content of `df.to_csv`."""
+    # data
+    df = pd.DataFrame(
+        {
+            "order_id": [1, 2, 3],
+            "order_creation_time": pd.to_datetime(["2020-02-26 19:31:29"] * 3),
+            "preceding_event": pd.to_datetime(
+                ["2020-02-26 19:31:28", None, "2020-02-26 19:31:28.998"],
+                format="ISO8601",
+            ),
+            "previous_status": ["ONLINE", None, "OFFLINE"],
+        }
+    )
+    # expected
+    expected = df.to_csv(index=False)
+    # call the function
+    load(df=df, path_to_write=str(tmp_path / "events_report.csv"), chunksize=1)
+    load(df=df, path_to_write=str(tmp_path / "events_report.csv.gz"), chunksize=2)
+    # tests
+    assert (tmp_path / "events_report.csv").read_text() == expected
+    with gzip.open(tmp_path / "events_report.csv.gz", "rt") as f:
+        assert f.read() == expected
+    assert sorted(os.listdir(tmp_path)) == ["events_report.csv", "events_report.csv.gz"]
+
+
+def test_no_partial_file_if_writing_fails(tmp_path):
+    """Test that no file is left at the path when the writing fails after some chunks."""
+
+    class Unprintable:
+        def __str__(self):
+            raise RuntimeError("cannot be formatted")
+
+    # data
+    df = pd.DataFrame({"order_id": [1, 2, 3], "value": ["a", "b", Unprintable()]})
+    # test
+    with pytest.raises(RuntimeError):
+        load(df=df, path_to_write=str(tmp_path / "events_report.csv"), chunksize=1)
+
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,72 @@
+import sys
+
+sys.path.insert(0, ".")
+
+import numpy as np
+import pandas as pd
+from src.metrics import collect_metrics, stage
+from src.transform import transformation
+
+
+def test_collect_metrics_of_transformation_sub_steps():
+    """
+    Test that the sub-steps of the transformation are recorded under the enclosing stage,
+    with their row counts.
+    """
+    # data
+    df_polling = pd.read_csv("test/resources/sample_polling.csv")
+    df_conn_status = pd.read_csv("test/resources/sample_connectivity_status.csv")
+    df_orders = pd.read_csv("test/resources/sample_orders.csv")
+
+    # computed
+    with collect_metrics() as records:
+        with stage("transform", rows_in=len(df_orders)) as metrics:
+            df_report = transformation(df_polling, df_conn_status, df_orders)
+            metrics["rows_out"] = len(df_report)
+    stages = {record["stage"]: record for record in records}
+
+    # tests
+    assert stages["transform"]["rows_out"] == len(df_report)
+    assert stages["transform.merge"]["rows_out"] == len(df_report)
+    assert "transform.count_polling_events_in_windows.count_windows" in stages
+    assert all(
+        record["seconds"] >= 0 and record["peak_memory_bytes"] > 0 for record in records
+    )
+
+
+def test_stage_peak_memory_is_its_own():
+    """
+    Test that the peak memory of a stage is the memory it allocates, that it includes the peaks of its
+    sub-steps, and that it is not the peak of the stages run before.
+    """
+    # data
+    size = 50 * 2**20
+
+    # computed
+    with collect_metrics() as records:
+        with stage("transform"):
+            with stage("large"):
+                np.ones(size, dtype=np.uint8)
+            with stage("small"):
+                np.ones(size // 100, dtype=np.uint8)
+    stages = {record["stage"]: record["peak_memory_bytes"] for record in records}
+
+    # tests
+    assert size <= stages["transform.large"] < 2 * size
+    assert size // 100 <= stages["transform.small"] < size // 2
+    assert stages["transform"] >= stages["transform.large"]
+
+
+def test_stage_without_collect_metrics():
+    """
+    Test that the stages are not recorded when the metrics are disabled.
+    """
+    # computed
+    with collect_metrics() as records:
+        pass
+    with stage("transform") as metrics:
+        metrics["rows_out"] = 1
+
+    # tests
+    assert records == []
+    assert metrics == {"rows_out": 1}
@@ -0,0 +1,76 @@
+import sys
+
+sys.path.insert(0, ".")
+
+import pandas as pd
+from pandas.testing import assert_frame_equal
+from src.parallel import shard_by_device, transformation_parallel
+from src.transform import transformation
+
+
+def test_shard_by_device_keeps_devices_together():
+    """
+    Test that all the rows of a device are in the same shard, and that every row is in one shard.
+    """
+    # data
+    df = pd.read_csv("test/resources/sample_polling.csv")
+    # computed
+    shards = shard_by_device(df, n_shards=4)
+    # tests
+    assert sorted(p for positions in shards for p in positions) == list(range(len(df)))
+    for positions in shards:
+        devices = set(df["device_id"].iloc[positions])
+        others = df.drop(index=df.index[positions])
+        assert devices.isdisjoint(others["device_id"])
+
+
+def test_transformation_parallel_matches_transformation():
+    """
+    Test that the report built on device shards in several processes is the same as the
+    report built in a single process.
+    """
+    # data
+    df_polling = pd.read_csv("test/resources/sample_polling.csv")
+    df_conn_status = pd.read_csv("test/resources/sample_connectivity_status.csv")
+    df_orders = pd.read_csv("test/resources/sample_orders.csv")
+    # expected
+    expected = transformation(
+        df_polling=df_polling.copy(),
+        df_connectivity_status=df_conn_status.copy(),
+        df_orders=df_orders.copy(),
+    )
+    # computed
+    computed = transformation_parallel(
+        df_polling=df_polling,
+        df_connectivity_status=df_conn_status,
+        df_orders=df_orders,
+        workers=3,
+    )
+    # tests
+    assert_frame_equal(computed, expected)
+
+
+def test_transformation_parallel_ignores_codes_of_dropped_events():
+    """
+    Test that the codes of polling events without a time or a device, which the transformation drops,
+    do not add columns to the report built on device shards.
+    """
+    # data
+    df_polling = pd.read_csv("test/resources/sample_polling.csv")
+    df_conn_status = pd.read_csv("test/resources/sample_connectivity_status.csv")
+    df_orders = pd.read_csv("test/resources/sample_orders.csv")
+    df_dropped = pd.DataFrame(
+        {
+            "creation_time": [None, "2020-02-26 10:00:00"],
+            "device_id": [df_polling["device_id"].iloc[0], None],
+            "error_code": ["TIMEOUT", "NO_DEVICE"],
+            "status_code": [500, 503],
+        }
+    )
+    df_polling = pd.concat([df_polling, df_dropped], ignore_index=True)
+    # expected
+    expected = transformation(df_polling, df_conn_status, df_orders)
+    # computed
+    computed = transformation_parallel(df_polling, df_conn_status, df_orders, workers=2)
+    # tests
+    assert_frame_equal(computed, expected)
@@ -0,0 +1,137 @@
+import sys
+
+sys.path.insert(0, ".")
+
+import collections
+import glob
+import pandas as pd
+import pytest
+import src.partitions
+from pandas.testing import assert_frame_equal
+from src.partitions import list_partitions, transformation_partitioned, write_partitions
+from src.synthetic import generate_inputs
+from src.transform import transformation
+
+
+def write_days(path, time_period):
+    """Writes 3 days of sparse synthetic inputs as date partitions, and returns the report of their concatenation."""
+    inputs = generate_inputs(
+        n_devices=10, n_orders=150, polling_rate=0.01, hours=72, offline_rate=0.05
+    )
+    names = ["polling", "connectivity_status", "orders"]
+    for df, name, column in zip(
+        inputs, names, ["creation_time", "creation_time", "order_creation_time"]
+    ):
+        write_partitions(df, str(path / name), column)
+    # The files of the partitions are concatenated in date order
+    df_polling, df_conn_status, df_orders = (
+        pd.concat(
+            [pd.read_csv(f) for f in sorted(glob.glob(f"{path}/{name}/*/*.csv"))],
+            ignore_index=True,
+        )
+        for name in names
+    )
+    return transformation(
+        df_polling, df_conn_status, df_orders, time_period, connectivity_windows=True
+    )
+
+
+@pytest.mark.parametrize("time_period", [[-3, 3, -60], [-1500, 10]])
+def test_transformation_partitioned_matches_transformation(tmp_path, time_period):
+    """
+    Test that the days transformed with their halos and the edges of the other days build the same report
+    as the concatenated inputs, with and without the cache, and that a single day can be reported again.
+    """
+    # data
+    paths = [
+        str(tmp_path / name) for name in ["polling", "connectivity_status", "orders"]
+    ]
+    # expected
+    expected = write_days(tmp_path, time_period)
+    expected_day = expected[
+        expected["order_creation_time"].dt.strftime("%Y-%m-%d") == "2020-02-27"
+    ]
+    # computed
+    computed = [
+        transformation_partitioned(
+            *paths,
+            time_period=time_period,
+            workers=2,
+            connectivity_windows=True,
+            cache_dir=cache_dir,
+        )
+        for cache_dir in [None, tmp_path / "cache", tmp_path / "cache"]
+    ]
+    computed_day = transformation_partitioned(
+        *paths,
+        dates=["2020-02-27"],
+        time_period=time_period,
+        workers=2,
+        connectivity_windows=True,
+        cache_dir=tmp_path / "cache",
+    )
+    # tests
+    for report in computed:
+        assert_frame_equal(report, expected)
+    assert_frame_equal(
+        computed_day.sort_values("order_id", ignore_index=True),
+        expected_day.sort_values("order_id", ignore_index=True),
+    )
+
+
+@pytest.mark.parametrize("dates", [None, ["2020-02-27"]])
+def test_transformation_partitioned_parses_each_partition_once(
+    tmp_path, monkeypatch, dates
+):
+    """
+    Test that without a cache folder, each partition is parsed once for its edges and its halos, whether
+    all the days or a single day are reported.
+    """
+    # data
+    write_days(tmp_path, [-3, 3, -60])
+    paths = [
+        str(tmp_path / name) for name in ["polling", "connectivity_status", "orders"]
+    ]
+    # The worker processes are forked, so they append the paths they parse to a file
+    log = tmp_path / "parsed.txt"
+    read_table = src.partitions.read_table
+
+    def logged_read_table(path, *args, **kwargs):
+        with open(log, "a") as f:
+            f.write(f"{path}\n")
+        return read_table(path, *args, **kwargs)
+
+    monkeypatch.setattr(src.partitions, "read_table", logged_read_table)
+    # expected
+    event_files = glob.glob(f"{tmp_path}/polling/*/*.csv") + glob.glob(
+        f"{tmp_path}/connectivity_status/*/*.csv"
+    )
+    # computed
+    transformation_partitioned(*paths, dates=dates, workers=2)
+    parsed = collections.Counter(log.read_text().splitlines())
+    # tests
+    assert sorted(path for path in parsed if "/orders/" not in path) == sorted(
+        event_files
+    )
+    assert set(parsed.values()) == {1}
+
+
+def test_list_partitions_skips_markers(tmp_path):
+    """
+    Test that the partitions are listed in date order, without the hidden and marker files.
+    """
+    # data
+    for date in ["2020-02-27", "2020-02-26"]:
+        folder = tmp_path / f"date={date}"
+        folder.mkdir()
+        for name in ["part-1.csv", "part-0.csv", "_SUCCESS", ".part-0.csv.crc"]:
+            (folder / name).touch()
+    (tmp_path / "other").mkdir()
+    # computed
+    partitions = list_partitions(str(tmp_path))
+    # tests
+    assert list(partitions) == [pd.Timestamp("2020-02-26"), pd.Timestamp("2020-02-27")]
+    assert [p.rsplit("/", 1)[1] for p in partitions[pd.Timestamp("2020-02-26")]] == [
+        "part-0.csv",
+        "part-1.csv",
+    ]
@@ -0,0 +1,190 @@
+import sys
+
+sys.path.insert(0, ".")
+
+import asyncio
+import io
+import json
+import pandas as pd
+from src.service import ReportService, run_service, tail_csv
+from src.transform import transformation
+
+
+def test_report_service_matches_transformation():
+    """
+    Test that the rows reported by the service from time ordered messages are the rows of
+    `transformation`, except for the following polling events received after the windows closed.
+    """
+    # data
+    df_polling = pd.read_csv("test/resources/sample_polling.csv")
+    df_conn_status = pd.read_csv("test/resources/sample_connectivity_status.csv")
+    df_orders = pd.read_csv("test/resources/sample_orders.csv")
+    messages = []
+    for df, kind, time_column in [
+        (df_orders, "order", "order_creation_time"),
+        (df_conn_status, "connectivity_status", "creation_time"),
+        (df_polling, "polling", "creation_time"),
+    ]:
+        df = df.astype(object).where(df.notna(), None)
+        for message in df.to_dict("records"):
+            messages.append(
+                (pd.Timestamp(message[time_column]), dict(message, type=kind))
+            )
+    messages.sort(key=lambda x: x[0])
+    # expected
+    expected = transformation(df_polling, df_conn_status, df_orders)
+    expected = expected.set_index("order_id")
+    # computed
+    service = ReportService()
+    rows = []
+    for _, message in messages:
+        service.add(message)
+        rows += service.close_windows()
+    rows += service.close_windows(final=True)
+    computed = pd.DataFrame(rows).set_index("order_id").loc[expected.index]
+    # tests
+    assert list(computed.columns) == list(expected.columns)
+    closing = expected["order_creation_time"] + pd.Timedelta(minutes=3)
+    late = expected["following_event"] > closing
+    assert computed.loc[late, "following_event"].isna().all()
+    for column in expected.columns:
+        if column.startswith("count_"):
+            assert (computed[column] == expected[column]).all()
+        elif column.endswith(("_time", "_event")):
+            computed_times = pd.to_datetime(computed.loc[~late, column])
+            assert computed_times.equals(expected.loc[~late, column])
+        else:
+            assert computed[column].equals(
+                expected[column].where(expected[column].notna(), None)
+            )
+
+
+def test_run_service_reads_files(tmp_path):
+    """
+    Test that the service reports every order of the files, once each file has been read.
+    """
+    # data
+    (tmp_path / "polling.csv").write_text(
+        "creation_time,device_id,error_code,status_code\n"
+        "2020-02-26 10:00:00,A,,200\n"
+        "2020-02-26 10:02:00,A,ECONNABORTED,\n"
+        "2020-02-26 10:20:00,A,,200\n"
+    )
+    (tmp_path / "orders.csv").write_text(
+        "order_id,device_id,order_creation_time\n"
+        "1,A,2020-02-26 10:01:00\n"
+        "2,B,2020-02-26 10:30:00\n"
+    )
+    # expected
+    expected = {
+        1: {
+            "preceding_event": "2020-02-26 10:00:00",
+            "following_event": "2020-02-26 10:02:00",
+            "count_total_events_before_3min": 1,
+            "count_error_econnaborted_after_3min": 1,
+        },
+        2: {
+            "preceding_event": None,
+            "following_event": None,
+            "count_total_events_before_3min": 0,
+        },
+    }
+
+    # computed
+    async def serve():
+        service = ReportService()
+        queue = asyncio.Queue()
+        sources = []
+        for kind, path in [
+            ("polling", tmp_path / "polling.csv"),
+            ("order", tmp_path / "orders.csv"),
+        ]:
+            service.register(str(path))
+            sources.append(asyncio.create_task(tail_csv(str(path), kind, queue)))
+        output = io.StringIO()
+        written = await run_service(service, queue, output, sources)
+        return written, output.getvalue()
+
+    written, output = asyncio.run(serve())
+    computed = {row["order_id"]: row for row in map(json.loads, output.splitlines())}
+    # tests
+    assert written == 2
+    for order_id, values in expected.items():
+        for column, value in values.items():
+            assert computed[order_id][column] == value
+
+
+def test_report_service_normalises_codes_and_forgets_idle_devices():
+    """
+    Test that the status codes of JSON messages are counted as the numbers of the CSV inputs, and that
+    the last events of a device idle for longer than the maximum idle time are dropped.
+    """
+    # data
+    messages = [
+        {"type": "polling", "creation_time": "2020-02-26 10:00:00", "device_id": "A"},
+        {"type": "connectivity_status", "creation_time": "2020-02-26 10:00:00"},
+        {"type": "order", "order_id": 1, "order_creation_time": "2020-02-26 10:01:00"},
+        {"type": "polling", "creation_time": "2020-02-26 13:00:00", "device_id": "B"},
+    ]
+    messages[0].update(status_code="200")
+    messages[1].update(device_id="A", status="OFFLINE")
+    messages[2].update(device_id="A")
+    # expected
+    expected_devices = [set(), {"A"}]
+    # computed
+    computed_devices = []
+    for max_idle_minutes in [None, 24 * 60]:
+        service = ReportService(max_idle_minutes=max_idle_minutes)
+        rows = []
+        for message in messages:
+            service.add(message)
+            rows += service.close_windows()
+        computed_devices.append(
+            set(service.last_polling) | set(service.last_conn_status)
+        )
+    # tests
+    assert service.status_codes == [0, 200, 401]
+    assert rows[0]["count_status_code_200_before_3min"] == 1
+    assert computed_devices == expected_devices
+
+
+def test_report_service_adds_the_columns_of_found_codes_and_warns_about_full_buffers(
+    caplog,
+):
+    """
+    Test that the count columns of a code found in the polling events are added to the next rows only,
+    and that a warning is logged once when a full buffer drops events of open windows.
+    """
+    # data
+    times = pd.date_range("2020-02-26 10:00", periods=8, freq="min").astype(str)
+    messages = [
+        {"type": "order", "order_id": 1, "order_creation_time": times[0]},
+        {"type": "polling", "creation_time": times[1], "status_code": 200},
+    ]
+    messages += [
+        {"type": "polling", "creation_time": time, "status_code": 503}
+        for time in times[2:7]
+    ]
+    messages += [{"type": "order", "order_id": 2, "order_creation_time": times[7]}]
+    # expected
+    expected_counts = {"total": 3, "503": 3, "200": 0}
+    # computed
+    service = ReportService(time_period=[-60], max_events_per_device=3)
+    rows = []
+    for message in messages:
+        service.add(dict(message, device_id="A"))
+        rows += service.close_windows()
+    rows += service.close_windows(final=True)
+    computed_counts = {
+        code: rows[1][f"count_{column}_before_60min"]
+        for code, column in [
+            ("total", "total_events"),
+            ("503", "status_code_503"),
+            ("200", "status_code_200"),
+        ]
+    }
+    # tests
+    assert "count_status_code_503_before_60min" not in rows[0]
+    assert [column for column in rows[1] if column in rows[0]] == list(rows[0])
+    assert computed_counts == expected_counts
+    assert caplog.text.count("events in open windows") == 1
@@ -0,0 +1,61 @@
+import sys
+
+sys.path.insert(0, ".")
+
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+from src.stream import transformation_chunked
+from src.transform import transformation
+
+
+def read_sample_inputs() -> tuple:
+    """Reads the sample inputs, with the polling events ordered by creation time."""
+    df_polling = pd.read_csv("test/resources/sample_polling.csv")
+    df_polling = df_polling.sort_values("creation_time", kind="stable")
+    df_conn_status = pd.read_csv("test/resources/sample_connectivity_status.csv")
+    df_orders = pd.read_csv("test/resources/sample_orders.csv")
+    return df_polling.reset_index(drop=True), df_conn_status, df_orders
+
+
+@pytest.mark.parametrize("chunksize", [50, 333, 5000])
+def test_transformation_chunked_matches_transformation(chunksize):
+    """
+    Test that the report built from chunks of polling events is the same as the report
+    built from all the polling events at once.
+    """
+    # data
+    df_polling, df_conn_status, df_orders = read_sample_inputs()
+    chunks = (chunk for _, chunk in df_polling.groupby(df_polling.index // chunksize))
+    # expected
+    expected = transformation(
+        df_polling=df_polling.copy(),
+        df_connectivity_status=df_conn_status.copy(),
+        df_orders=df_orders.copy(),
+    )
+    # computed
+    computed = transformation_chunked(
+        polling_chunks=chunks,
+        df_connectivity_status=df_conn_status,
+        df_orders=df_orders,
+    )
+    # tests
+    assert_frame_equal(computed, expected)
+
+
+def test_transformation_chunked_unordered_polling_events():
+    """
+    Test that an error is raised when the polling events are not ordered by creation time.
+    """
+    # data
+    df_polling, df_conn_status, df_orders = read_sample_inputs()
+    chunks = [df_polling.iloc[1000:], df_polling.iloc[:1000]]
+    # test
+    with pytest.raises(ValueError) as e:
+        transformation_chunked(
+            polling_chunks=chunks,
+            df_connectivity_status=df_conn_status,
+            df_orders=df_orders,
+        )
+
+    assert str(e.value) == "The polling events are not ordered by creation_time"
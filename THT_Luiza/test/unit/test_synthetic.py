@@ -0,0 +1,46 @@
+import sys
+
+sys.path.insert(0, ".")
+
+import pandas as pd
+from pandas.testing import assert_frame_equal
+from src.synthetic import generate_inputs, write_inputs
+from src.transform import transformation
+
+
+def test_generate_inputs_is_seeded():
+    """
+    Test that the same seed generates the same inputs, with the expected number of rows.
+    """
+    # computed
+    first = generate_inputs(n_devices=5, n_orders=50, polling_rate=2.0, hours=1.0)
+    second = generate_inputs(n_devices=5, n_orders=50, polling_rate=2.0, hours=1.0)
+
+    # tests
+    for df_first, df_second in zip(first, second):
+        assert_frame_equal(df_first, df_second)
+    assert len(first[0]) == 5 * 2 * 60
+    assert len(first[2]) == 50
+
+
+def test_write_inputs_can_be_transformed(tmp_path):
+    """
+    Test that the written inputs have the columns of the real inputs and can be transformed.
+    """
+    # data
+    paths = write_inputs(str(tmp_path), n_devices=5, n_orders=50, hours=1.0)
+    df_polling, df_conn_status, df_orders = (pd.read_csv(path) for path in paths)
+
+    # computed
+    df_report = transformation(df_polling, df_conn_status, df_orders)
+
+    # tests
+    assert list(df_polling.columns) == [
+        "creation_time",
+        "device_id",
+        "error_code",
+        "status_code",
+    ]
+    assert list(df_conn_status.columns) == ["creation_time", "status", "device_id"]
+    assert len(df_report) == df_orders["device_id"].notna().sum()
+    assert df_report["count_total_events_before_60min"].gt(0).any()
@@ -0,0 +1,66 @@
+import sys
+
+sys.path.insert(0, ".")
+
+import logging
+import pandas as pd
+from pandas.testing import assert_series_equal
+from src.timestamps import parse_timestamps
+
+
+def test_parse_timestamps_with_and_without_milliseconds():
+    """
+    Test that timestamps with and without milliseconds are both parsed in the same column.
+    """
+    # data
+    values = pd.Series(
+        ["2020-02-26 19:31:29", "2020-02-26 19:31:29.998", None],
+        name="creation_time",
+    )
+    # expected
+    expected = pd.Series(
+        [
+            pd.Timestamp("2020-02-26 19:31:29"),
+            pd.Timestamp("2020-02-26 19:31:29.998"),
+            pd.NaT,
+        ],
+        name="creation_time",
+    )
+    # computed
+    computed = parse_timestamps(values)
+    # tests
+    assert_series_equal(computed, expected)
+
+
+def test_parse_timestamps_parses_repeated_values_once():
+    """
+    Test that parsing the distinct values of a column with repeated values gives the same timestamps.
+    """
+    # data
+    values = pd.Series(
+        ["2020-02-26 13:29:00", "2020-02-26 21:13:24", None] * 100,
+        name="order_creation_time",
+    )
+    # expected
+    expected = pd.to_datetime(values, format="ISO8601")
+    # computed
+    computed = parse_timestamps(values)
+    # tests
+    assert_series_equal(computed, expected)
+
+
+def test_parse_timestamps_logs_invalid_values(caplog):
+    """
+    Test that the number of values that cannot be parsed is logged.
+    """
+    # data
+    values = pd.Series(
+        ["2020-02-26 19:31:29", "not a time", "2020-02-30 10:00:00"],
+        name="creation_time",
+    )
+    # computed
+    with caplog.at_level(logging.WARNING):
+        computed = parse_timestamps(values)
+    # tests
+    assert computed.isna().tolist() == [False, True, True]
+    assert "2 invalid values in 'creation_time'" in caplog.text
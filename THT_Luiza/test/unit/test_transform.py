@@ -0,0 +1,484 @@
+import sys
+
+sys.path.insert(0, ".")
+
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+from src.extract import extract
+from src.transform import (
+    count_polling_events,
+    find_connectivity_status,
+    find_near_events,
+    find_near_events_and_status,
+    index_events_by_device,
+    sortedness,
+    transformation,
+)
+
+
+def test_transformation_matches_expected_report(tmp_path):
+    """
+    Test that the report row of an order with polling events in all the time periods
+    is written exactly as the expected report.
+    """
+    # data
+    df_polling, df_conn_status, df_orders = extract(
+        path_polling="test/resources/sample_polling.csv",
+        path_conn_status="test/resources/sample_connectivity_status.csv",
+        path_orders="test/resources/sample_orders.csv",
+    )
+    expected_path = "test/resources/expected_events_processing.csv"
+    output_path = tmp_path / "events_report.csv"
+
+    # computed
+    df_output = transformation(
+        df_polling=df_polling,
+        df_connectivity_status=df_conn_status,
+        df_orders=df_orders,
+    )
+    df_output[df_output["order_id"] == 102642694].to_csv(output_path, index=False)
+
+    # tests
+    with open(output_path) as computed, open(expected_path) as expected:
+        assert computed.read() == expected.read()
+
+
+def test_transformation_keeps_orders_without_polling_events():
+    """
+    Test that orders of devices without polling events are kept with zero counts.
+    """
+    # data
+    df_polling = pd.DataFrame(
+        [
+            {
+                "creation_time": "2020-02-26 10:00:00.500",
+                "device_id": "device-1",
+                "error_code": None,
+                "status_code": 200,
+            },
+        ]
+    )
+    df_conn_status = pd.DataFrame(
+        [
+            {
+                "creation_time": "2020-02-26 09:00:00",
+                "status": "ONLINE",
+                "device_id": "device-2",
+            },
+        ]
+    )
+    df_orders = pd.DataFrame(
+        [
+            {
+                "order_creation_time": "2020-02-26 10:01:00",
+                "order_id": 1,
+                "device_id": "device-1",
+            },
+            {
+                "order_creation_time": "2020-02-26 10:02:00",
+                "order_id": 2,
+                "device_id": "device-2",
+            },
+        ]
+    )
+
+    # computed
+    df_output = transformation(
+        df_polling=df_polling,
+        df_connectivity_status=df_conn_status,
+        df_orders=df_orders,
+    ).set_index("order_id")
+
+    # tests
+    assert df_output.loc[1, "count_total_events_before_3min"] == 1
+    assert df_output.loc[1, "count_total_events_after_3min"] == 0
+    assert df_output.loc[2, "count_total_events_before_60min"] == 0
+    assert df_output.loc[2, "previous_status"] == "ONLINE"
+
+
+def test_transformation_with_custom_time_periods():
+    """
+    Test that the counts are computed for each of the given time periods, in the given order.
+    """
+    # data
+    df_polling = pd.DataFrame(
+        [
+            {
+                "creation_time": f"2020-02-26 10:{minute:02d}:00",
+                "device_id": "device-1",
+                "error_code": None,
+                "status_code": 200,
+            }
+            for minute in [0, 9, 10, 11, 14, 16]
+        ]
+    )
+    df_conn_status = pd.DataFrame(
+        columns=["creation_time", "status", "device_id"],
+    )
+    df_orders = pd.DataFrame(
+        [
+            {
+                "order_creation_time": "2020-02-26 10:10:00",
+                "order_id": 1,
+                "device_id": "device-1",
+            },
+        ]
+    )
+
+    # computed
+    df_output = transformation(
+        df_polling=df_polling,
+        df_connectivity_status=df_conn_status,
+        df_orders=df_orders,
+        time_period=[5, -1, -15],
+    )
+    count_columns = [c for c in df_output.columns if c.startswith("count_total")]
+
+    # tests
+    assert count_columns == [
+        "count_total_events_after_5min",
+        "count_total_events_before_1min",
+        "count_total_events_before_15min",
+    ]
+    assert df_output[count_columns].values.tolist() == [[3, 2, 3]]
+
+
+def test_count_polling_events_adds_columns_for_new_codes():
+    """
+    Test that codes missing from the declared code lists get their own count columns,
+    and that the declared codes are reported even when absent from the data.
+    """
+    # data
+    df = pd.DataFrame(
+        [
+            {"order_id": 1, "status_code": 200, "error_code": None},
+            {"order_id": 1, "status_code": 504, "error_code": "ETIMEDOUT"},
+            {"order_id": 2, "status_code": 0, "error_code": "ECONNABORTED"},
+        ]
+    )
+    # expected
+    expected = pd.DataFrame(
+        [
+            {
+                "order_id": 1,
+                "count_total_events_x": 2,
+                "count_status_code_0_x": 0,
+                "count_status_code_200_x": 1,
+                "count_status_code_401_x": 0,
+                "count_status_code_504_x": 1,
+                "count_error_econnaborted_x": 0,
+                "count_error_generic_error_x": 0,
+                "count_error_etimedout_x": 1,
+                "count_no_error_code_x": 1,
+            },
+            {
+                "order_id": 2,
+                "count_total_events_x": 1,
+                "count_status_code_0_x": 1,
+                "count_status_code_200_x": 0,
+                "count_status_code_401_x": 0,
+                "count_status_code_504_x": 0,
+                "count_error_econnaborted_x": 1,
+                "count_error_generic_error_x": 0,
+                "count_error_etimedout_x": 0,
+                "count_no_error_code_x": 0,
+            },
+        ]
+    )
+    # computed
+    computed = count_polling_events(df=df, time_ref="_x")
+    # tests
+    assert_frame_equal(computed, expected)
+
+
+def test_find_near_events_and_status_matches_merge_asof_lookups():
+    """
+    Test that the single pass lookup finds the same preceding and following polling events
+    and previous connectivity status as the merge_asof based lookups.
+    """
+    # data
+    df_polling = pd.read_csv("test/resources/sample_polling.csv")
+    df_conn_status = pd.read_csv("test/resources/sample_connectivity_status.csv")
+    df_orders = pd.read_csv("test/resources/sample_orders.csv").dropna()
+    for df, column in [
+        (df_polling, "creation_time"),
+        (df_conn_status, "creation_time"),
+        (df_orders, "order_creation_time"),
+    ]:
+        df[column] = pd.to_datetime(df[column])
+    devices = pd.Index(
+        pd.concat([df_polling["device_id"], df_conn_status["device_id"]]).unique()
+    ).sort_values()
+    events_sorted, _, event_offsets = index_events_by_device(
+        df_polling, devices=devices
+    )
+    conn_status_sorted, _, conn_status_offsets = index_events_by_device(
+        df_conn_status, devices=devices
+    )
+
+    # expected
+    expected = find_connectivity_status(
+        orders=find_near_events(orders=df_orders, events=df_polling),
+        conn_status=df_conn_status,
+    )[
+        [
+            "order_id",
+            "device_id",
+            "order_creation_time",
+            "preceding_event",
+            "following_event",
+            "previous_status",
+            "status_time",
+        ]
+    ]
+
+    # computed
+    computed = find_near_events_and_status(
+        orders=df_orders,
+        events_sorted=events_sorted,
+        event_offsets=event_offsets,
+        conn_status_sorted=conn_status_sorted,
+        conn_status_offsets=conn_status_offsets,
+        devices=devices,
+    )
+
+    # tests
+    assert_frame_equal(computed, expected)
+
+
+@pytest.mark.parametrize("time_period", [[-3, 3, -60], [10, -1, 0]])
+def test_transformation_duckdb_engine_matches_pandas_engine(time_period):
+    """
+    Test that the DuckDB engine builds the same report as the pandas engine, from DataFrames
+    and from the input files.
+    """
+    pytest.importorskip("duckdb")
+    # data
+    paths = [
+        "test/resources/sample_polling.csv",
+        "test/resources/sample_connectivity_status.csv",
+        "test/resources/sample_orders.csv",
+    ]
+    df_polling, df_conn_status, df_orders = (pd.read_csv(path) for path in paths)
+
+    # expected
+    expected = transformation(
+        df_polling.copy(), df_conn_status.copy(), df_orders.copy(), time_period
+    )
+
+    # computed
+    computed = transformation(
+        df_polling, df_conn_status, df_orders, time_period, engine="duckdb"
+    )
+    computed_from_files = transformation(*paths, time_period, engine="duckdb")
+
+    # tests
+    assert_frame_equal(computed, expected)
+    assert_frame_equal(computed_from_files, expected)
+
+
+def test_transformation_within_memory_budget_matches_report():
+    """
+    Test that a memory budget too small for the inputs transforms device shards into the same report,
+    and that the inputs are not modified.
+    """
+    # data
+    df_polling = pd.read_csv("test/resources/sample_polling.csv")
+    df_conn_status = pd.read_csv("test/resources/sample_connectivity_status.csv")
+    df_orders = pd.read_csv("test/resources/sample_orders.csv")
+    inputs = [df_polling.copy(), df_conn_status.copy(), df_orders.copy()]
+
+    # expected
+    expected = transformation(df_polling, df_conn_status, df_orders)
+
+    # computed
+    computed = transformation(df_polling, df_conn_status, df_orders, max_memory=50_000)
+
+    # tests
+    assert_frame_equal(computed, expected)
+    for df, df_input in zip([df_polling, df_conn_status, df_orders], inputs):
+        assert_frame_equal(df, df_input)
+
+
+def test_transformation_within_memory_budget_ignores_codes_of_dropped_events():
+    """
+    Test that the codes of polling events without a time or a device, which the transformation drops,
+    do not add columns to the report transformed in device shards.
+    """
+    # data
+    df_polling = pd.read_csv("test/resources/sample_polling.csv")
+    df_conn_status = pd.read_csv("test/resources/sample_connectivity_status.csv")
+    df_orders = pd.read_csv("test/resources/sample_orders.csv")
+    df_dropped = pd.DataFrame(
+        {
+            "creation_time": [None, "2020-02-26 10:00:00"],
+            "device_id": [df_polling["device_id"].iloc[0], None],
+            "error_code": ["TIMEOUT", "NO_DEVICE"],
+            "status_code": [500, 503],
+        }
+    )
+    df_polling = pd.concat([df_polling, df_dropped], ignore_index=True)
+
+    # expected
+    expected = transformation(df_polling, df_conn_status, df_orders)
+
+    # computed
+    computed = transformation(df_polling, df_conn_status, df_orders, max_memory=50_000)
+
+    # tests
+    assert_frame_equal(computed, expected)
+
+
+def test_transformation_with_connectivity_windows():
+    """
+    Test the OFFLINE seconds and the connectivity transitions of each time period, where repeated
+    statuses are not transitions and the last interval of a device has no end.
+    """
+    # data
+    df_polling = pd.DataFrame(
+        {
+            "creation_time": ["2020-02-26 10:00:30", "2020-02-26 10:05:00"],
+            "device_id": ["A", "A"],
+            "error_code": [None, None],
+            "status_code": [200, 200],
+        }
+    )
+    df_conn_status = pd.DataFrame(
+        {
+            "creation_time": [
+                "2020-02-26 10:00:00",
+                "2020-02-26 10:01:00",
+                "2020-02-26 10:02:00",
+                "2020-02-26 10:10:00",
+                "2020-02-26 09:00:00",
+            ],
+            "status": ["OFFLINE", "OFFLINE", "ONLINE", "OFFLINE", "ONLINE"],
+            "device_id": ["A", "A", "A", "A", "B"],
+        }
+    )
+    df_orders = pd.DataFrame(
+        {
+            "order_creation_time": [
+                "2020-02-26 10:03:00",
+                "2020-02-26 10:11:00",
+                "2020-02-26 09:30:00",
+            ],
+            "order_id": [1, 2, 3],
+            "device_id": ["A", "A", "B"],
+        }
+    )
+
+    # expected
+    expected = pd.DataFrame(
+        {
+            "order_id": [3, 1, 2],
+            "offline_seconds_before_3min": [0.0, 120.0, 60.0],
+            "count_connectivity_transitions_before_3min": [0, 2, 1],
+            "offline_seconds_after_3min": [0.0, 0.0, 180.0],
+            "count_connectivity_transitions_after_3min": [0, 0, 0],
+            "offline_seconds_before_60min": [0.0, 120.0, 180.0],
+            "count_connectivity_transitions_before_60min": [0, 2, 3],
+        }
+    )
+
+    # computed
+    computed = transformation(
+        df_polling, df_conn_status, df_orders, connectivity_windows=True
+    )
+
+    # tests
+    assert_frame_equal(computed[expected.columns], expected)
+    assert list(computed.columns[-6:]) == list(expected.columns[1:])
+
+
+@pytest.mark.parametrize(
+    "sort_by", [None, ["creation_time"], ["device_id", "creation_time"]]
+)
+def test_index_events_by_device_skips_sorting_ordered_events(sort_by):
+    """
+    Test that events already sorted by time, or by device and time, are indexed in the same order
+    as unordered events, and that the order found by the typed extraction is recorded.
+    """
+    # data
+    df_polling, _, _ = extract(
+        path_polling="test/resources/sample_polling.csv",
+        path_conn_status="test/resources/sample_connectivity_status.csv",
+        path_orders="test/resources/sample_orders.csv",
+        typed=True,
+    )
+    df_events = df_polling.sample(frac=1, random_state=0)
+    if sort_by:
+        df_events = df_events.sort_values(sort_by, kind="stable")
+    df_events = df_events.reset_index(drop=True)
+    # expected
+    expected, _, expected_offsets = index_events_by_device(
+        df_polling.sort_values(["device_id", "creation_time"], kind="stable")
+    )
+    # computed
+    computed, _, offsets = index_events_by_device(df_events)
+    # tests
+    assert sortedness(df_events, "creation_time") == sort_by
+    assert (offsets == expected_offsets).all()
+    assert_frame_equal(
+        computed[["device_id", "creation_time"]],
+        expected[["device_id", "creation_time"]],
+    )
+    assert computed.attrs["sorted_by"] == ["device_id", "creation_time"]
+
+
+def test_transformation_with_report_cache_recomputes_changed_devices(tmp_path, caplog):
+    """
+    Test that the report rows reused from the report cache are the same as the computed ones,
+    that only the devices with a late polling event or a new order are computed again, and that
+    no rows are kept above the maximum number of cached rows.
+    """
+    # data
+    df_polling = pd.read_csv("test/resources/sample_polling.csv")
+    df_conn_status = pd.read_csv("test/resources/sample_connectivity_status.csv")
+    df_orders = pd.read_csv("test/resources/sample_orders.csv")
+    # one late polling event of a device and one new order of another device with orders
+    device = "da7f8319-6c44-4a4e-a8aa-d759f89556d2"
+    late_event = df_polling[df_polling["device_id"] == device].iloc[[0]]
+    late_event = late_event.assign(creation_time="2020-02-26 21:16:00")
+    new_order = df_orders[df_orders["order_id"] == 102550635]
+    new_order = new_order.assign(order_id=1, order_creation_time="2020-02-26 22:00:00")
+    df_polling_late = pd.concat([df_polling, late_event], ignore_index=True)
+    df_orders_new = pd.concat([df_orders, new_order], ignore_index=True)
+
+    # expected
+    expected = transformation(df_polling, df_conn_status, df_orders)
+    expected_changed = transformation(df_polling_late, df_conn_status, df_orders_new)
+
+    # computed
+    with caplog.at_level("INFO", logger="src.transform"):
+        cold = transformation(
+            df_polling, df_conn_status, df_orders, report_cache_dir=tmp_path
+        )
+        warm = transformation(
+            df_polling, df_conn_status, df_orders, report_cache_dir=tmp_path
+        )
+        computed_changed = transformation(
+            df_polling_late, df_conn_status, df_orders_new, report_cache_dir=tmp_path
+        )
+        transformation(
+            df_polling,
+            df_conn_status,
+            df_orders,
+            report_cache_dir=tmp_path,
+            report_cache_max_rows=0,
+        )
+    statistics = [
+        record.getMessage()
+        for record in caplog.records
+        if record.getMessage().startswith("Report cache")
+    ]
+
+    # tests
+    assert_frame_equal(cold, expected)
+    assert_frame_equal(warm, expected)
+    assert_frame_equal(computed_changed, expected_changed)
+    assert statistics[0].startswith("Report cache: 0 devices hit, 4 missed")
+    assert statistics[1].startswith("Report cache: 4 devices hit, 0 missed")
+    assert statistics[2].startswith("Report cache: 2 devices hit, 2 missed")
+    assert statistics[3].endswith("0 rows cached")
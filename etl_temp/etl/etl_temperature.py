@@ -1,23 +1,30 @@
 import logging
 from etl.load import load
-from etl.extract import extract
-from etl.transformation import transformation
+from etl.extract import extract, extract_chunks
+from etl.transformation import transformation, transformation_chunked
 
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-def main(input_data_path: str, output_data_path: str):
+def main(input_data_path: str, output_data_path: str, chunksize: int = None):
     # extract
     logger.info("Start extract step")
     logger.info(f"Input data path is {input_data_path}")
-    data = extract(path=input_data_path)
+    if chunksize:
+        # Streaming: the chunks are read lazily by the transform step
+        data = extract_chunks(path=input_data_path, chunksize=chunksize)
+    else:
+        data = extract(path=input_data_path)
     logger.info("extract step done")
 
     # transform
     logger.info("Start transform step")
-    data_transform = transformation(df=data)
+    if chunksize:
+        data_transform = transformation_chunked(chunks=data)
+    else:
+        data_transform = transformation(df=data)
     logger.info("transform step done")
 
     # load
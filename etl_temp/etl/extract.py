@@ -1,5 +1,17 @@
 import pandas as pd
 import os
+from typing import Iterator
+
+NECESSARY_COLUMNS = [
+    "Region",
+    "Country",
+    "City",
+    "Month",
+    "Day",
+    "Year",
+    "AvgTemperature",
+]
+CHUNKSIZE = 500_000
 
 
 def extract(path: str = "local/sample_city_temperature.csv") -> pd.DataFrame:
@@ -33,15 +45,7 @@ def extract(path: str = "local/sample_city_temperature.csv") -> pd.DataFrame:
     if len(df) == 0:
         raise ValueError(f"Dataframe at '{path}' is empty")
 
-    necessary_columns = [
-        "Region",
-        "Country",
-        "City",
-        "Month",
-        "Day",
-        "Year",
-        "AvgTemperature",
-    ]
+    necessary_columns = NECESSARY_COLUMNS
     if not (set(necessary_columns).issubset(set(df.columns))):
         # Find the names of the missing columns
         missing_columns = ", ".join(list(set(necessary_columns) - set(df.columns)))
@@ -49,3 +53,40 @@ def extract(path: str = "local/sample_city_temperature.csv") -> pd.DataFrame:
 
     # Return only the necessary columns
     return df[necessary_columns]
+
+
+def extract_chunks(
+    path: str = "local/sample_city_temperature.csv", chunksize: int = CHUNKSIZE
+) -> Iterator[pd.DataFrame]:
+    """
+    Reads a CSV file from the specified path in chunks of `chunksize` rows, so the file is never
+    loaded in memory at once. Only the necessary columns are read.
+
+    Args:
+        path (str): The path to the CSV file.
+        chunksize (int): The number of rows of each chunk.
+
+    Yields:
+        pd.DataFrame: The chunks, with the columns of `extract`.
+
+    Raises:
+        ValueError: If the specified path does not exist, or if the file at the specified path
+        is empty or missing one or more of the necessary columns.
+    """
+    if not (os.path.exists(path)):
+        raise ValueError(f"The data path '{path}' does not exist")
+
+    # Check the columns from the header only
+    columns = pd.read_csv(path, nrows=0).columns
+    if not (set(NECESSARY_COLUMNS).issubset(set(columns))):
+        # Find the names of the missing columns
+        missing_columns = ", ".join(list(set(NECESSARY_COLUMNS) - set(columns)))
+        raise ValueError(f"{missing_columns} are missing in the dataframe at '{path}'")
+
+    n_rows = 0
+    for df in pd.read_csv(path, usecols=NECESSARY_COLUMNS, chunksize=chunksize):
+        n_rows += len(df)
+        yield df[NECESSARY_COLUMNS]
+
+    if n_rows == 0:
+        raise ValueError(f"Dataframe at '{path}' is empty")
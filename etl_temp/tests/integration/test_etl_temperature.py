@@ -3,18 +3,24 @@ import sys
 sys.path.insert(0, ".")
 import os
 import pandas as pd
+import pytest
 from etl.etl_temperature import main
 from pandas.testing import assert_frame_equal
 
 
-def test_etl_temperature(capsys):
+@pytest.mark.parametrize("chunksize", [None, 5000])
+def test_etl_temperature(capsys, chunksize):
     # data
     input_data_path = "tests/resources/sample_city_temperature.csv"
     output_path = "tests/resources/test_sample_city_temperature.csv"
     expected_path = "tests/resources/expected_output_sample_city_temperature.csv"
     # running main, getting computed
     # sys.argv = ["main.py", input_data_path, output_path]
-    main(input_data_path=input_data_path, output_data_path=output_path)
+    main(
+        input_data_path=input_data_path,
+        output_data_path=output_path,
+        chunksize=chunksize,
+    )
     df_computed = pd.read_csv(output_path)
     os.remove(output_path)
     # get expectec
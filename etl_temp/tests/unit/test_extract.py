@@ -2,8 +2,10 @@ import sys
 
 sys.path.insert(0, ".")
 
+import pandas as pd
 import pytest
-from etl.extract import extract
+from etl.extract import extract, extract_chunks
+from pandas.testing import assert_frame_equal
 
 
 def test_extract_path_not_exist():
@@ -51,3 +53,25 @@ def test_miss_column_dataframe():
         extract(path=path)
 
     assert str(e.value) == f"AvgTemperature are missing in the dataframe at '{path}'"
+
+
+def test_extract_chunks_matches_extract():
+    """
+    Test that the chunks of the file have the rows and columns of the whole DataFrame, and that
+    a file missing a necessary column raises an error before any chunk is read.
+    """
+    # data
+    path = "tests/resources/sample_city_temperature.csv"
+    path_miss_col = "tests/resources/miss_col_city_temperature.csv"
+    # expected
+    expected = extract(path=path)
+    # computed
+    chunks = list(extract_chunks(path=path, chunksize=5000))
+    # tests
+    assert [len(chunk) for chunk in chunks] == [5000] * 4 + [len(expected) - 20000]
+    assert_frame_equal(pd.concat(chunks), expected)
+    with pytest.raises(ValueError) as e:
+        next(extract_chunks(path=path_miss_col))
+    assert str(e.value) == (
+        f"AvgTemperature are missing in the dataframe at '{path_miss_col}'"
+    )
@@ -4,8 +4,10 @@ sys.path.insert(0, ".")
 from etl.transformation import (
     clean_df,
     compute_avg_temp_month,
+    compute_avg_temp_month_chunked,
     compute_diff_vs_last_year,
 )
+import numpy as np
 import pandas as pd
 from pandas.testing import assert_frame_equal
 
@@ -167,3 +169,33 @@ def test_compute_diff_vs_last_year():
     computed = compute_diff_vs_last_year(data)
     # tests
     assert_frame_equal(computed, expected)
+
+
+def test_compute_avg_temp_month_chunked_matches_whole_dataframe():
+    """
+    Test that the average temperatures merged from the partial aggregates of chunks are the same as the ones
+    of the cleaned whole DataFrame, with duplicate rows split across chunks.
+    """
+    # data
+    data = pd.read_csv("tests/resources/sample_city_temperature.csv")
+    data = pd.concat([data, data.sample(n=500, random_state=0)], ignore_index=True)
+    chunks = [data.iloc[rows] for rows in np.array_split(range(len(data)), 24)]
+    # expected
+    expected = compute_avg_temp_month(clean_df(data))
+    # computed
+    computed = compute_avg_temp_month_chunked(chunks)
+    # tests
+    assert_frame_equal(computed, expected)
+
+
+def test_compute_avg_temp_month_chunked_without_chunks():
+    """
+    Test that an input without chunks, e.g. an empty file, gives an empty DataFrame with the output columns.
+    """
+    # expected
+    expected = ["Region", "Country", "Month", "Year", "AvgTemperature"]
+    # computed
+    computed = compute_avg_temp_month_chunked(iter([]))
+    # tests
+    assert computed.empty
+    assert list(computed.columns) == expected